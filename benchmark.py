@@ -0,0 +1,320 @@
+import argparse
+import json
+import platform
+import time
+
+from src.game import Game
+from src.ai_player import MAX_WORKERS, Play, shutdown_executors
+from src.mancala_board import INDEX, MancalaBoard
+from src.packed_board import apply_move, pack
+
+# Fixed position corpus and the default baseline file of the regression suite
+CORPUS_PATH = 'benchmark_positions.json'
+BASELINE_PATH = 'benchmark_baseline.json'
+
+# Slowdowns smaller than this many seconds are timer noise, not regressions
+MIN_SECONDS_DELTA = 0.1
+
+
+# Benchmark positions, given as the moves played from the initial board
+SCALING_POSITIONS = {
+    'opening': [],
+    'early': ['C', 'F', 'H', 'J'],
+    'middlegame': ['C', 'F', 'H', 'J', 'B', 'L', 'A', 'G'],
+}
+
+
+def position_from_moves(moves, playerSide=None):
+    #Build a game by playing the given pits from the initial board
+    game = Game(playerSide or {'COMPUTER1': 'player1', 'COMPUTER2': 'player2'})
+    for pit in moves:
+        side = 'player1' if pit in game.state.player1_pits else 'player2'
+        game.state.doMove(side, pit)
+    return game
+
+
+def benchmark_parallel_scaling(max_workers, depth, heuristic_version=1):
+    #Time the root-parallel search with 1..max_workers workers (at most the
+    #shared pool's MAX_WORKERS) on every scaling position and check it picks
+    #the same move as the serial search.
+    print(f"Parallel search scaling (depth={depth}, heuristic={heuristic_version})")
+    print(f"{'position':<12}{'workers':>8}{'move':>6}{'nodes':>10}{'seconds':>10}{'nodes/s':>11}{'speedup':>9}")
+    
+    ok = True
+    for name, moves in SCALING_POSITIONS.items():
+        game = position_from_moves(moves)
+        serial_time = None
+        serial_move = None
+        
+        for workers in range(1, min(max_workers, MAX_WORKERS) + 1):
+            play = Play(game, depth=depth, workers=workers)
+            if workers > 1:
+                # Start the pool outside the timed region
+                play.parallel_search(1, 1, heuristic_version)
+            
+            start = time.perf_counter()
+            _, move = play.choose_move(1, heuristic_version)
+            elapsed = time.perf_counter() - start
+            
+            if workers == 1:
+                serial_time, serial_move = elapsed, move
+            elif move != serial_move:
+                ok = False
+            
+            print(f"{name:<12}{workers:>8}{move:>6}{play.nodes:>10}{elapsed:>10.3f}"
+                  f"{play.nodes / elapsed:>11.0f}{serial_time / elapsed:>8.2f}x"
+                  + ("" if move == serial_move else "  MOVE DIFFERS FROM SERIAL"))
+    
+    shutdown_executors()
+    return ok
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path) as f:
+        return json.load(f)['positions']
+
+
+def game_from_position(position):
+    #Game for a corpus position; returns (game, player type of the side to move)
+    game = Game({'COMPUTER1': 'player1', 'COMPUTER2': 'player2'})
+    game.state = MancalaBoard.from_pits(position['pits'])
+    return game, 1 if position['side'] == 'player1' else -1
+
+
+def _operations_per_second(operation, min_seconds=0.3):
+    #Repeat operation() (which performs `count` operations and returns count)
+    #until min_seconds have passed
+    operations = 0
+    start = time.perf_counter()
+    while True:
+        operations += operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return operations / elapsed
+
+
+def benchmark_search(position, heuristic_version=1, max_depth=None, repeats=3, pvs=False,
+                     aspiration_window=None):
+    #Fixed-depth search on one position, plus the time to complete each
+    #shallower depth. The full-depth time is the best of repeats runs. With an
+    #aspiration window, each depth is centered on the previous depth's value.
+    game, player = game_from_position(position)
+    depth = min(position['depth'], max_depth or position['depth'])
+    play = Play(game, depth=depth, pvs=pvs, aspiration_window=aspiration_window)
+    
+    time_to_depth = {}
+    researches = 0
+    value = None
+    for d in range(1, depth + 1):
+        runs = repeats if d == depth else 1
+        elapsed = float('inf')
+        guess = value
+        for _ in range(runs):
+            start = time.perf_counter()
+            if aspiration_window and guess is not None:
+                play._start_search()
+                value, move = play._aspiration_search(game, player, d, heuristic_version, guess)
+            else:
+                value, move = play.MinimaxAlphaBetaPruning(
+                    game, player, d, float('-inf'), float('inf'), heuristic_version
+                )
+            elapsed = min(elapsed, time.perf_counter() - start)
+        time_to_depth[str(d)] = round(elapsed, 6)
+        researches += play.aspiration_researches
+    
+    return {
+        'depth': depth,
+        'nodes': play.nodes,
+        'seconds': round(elapsed, 6),
+        'nodesPerSecond': round(play.nodes / elapsed),
+        'bestMove': move,
+        'value': value,
+        'timeToDepth': time_to_depth,
+        'pvsResearches': play.pvs_researches,
+        'aspirationResearches': researches,
+    }
+
+
+def benchmark_primitives(corpus):
+    #Throughput of the board operations the search is built on
+    games = [game_from_position(position)[0] for position in corpus]
+    moves = [
+        (game.state, side, pit)
+        for game in games
+        for side in ('player1', 'player2')
+        for pit in game.state.possibleMoves(side)
+    ]
+    
+    def do_and_undo():
+        for state, side, pit in moves:
+            state.undo_move(state.do_move(side, pit))
+        return len(moves)
+    
+    def do_move_on_copy():
+        for state, side, pit in moves:
+            state.copy().doMove(side, pit)
+        return len(moves)
+    
+    packed_moves = [(pack(state.pits), side, INDEX[pit]) for state, side, pit in moves]
+    
+    def packed_apply_move():
+        for key, side, start in packed_moves:
+            apply_move(key, side, start)
+        return len(packed_moves)
+    
+    def possible_moves():
+        for game in games:
+            game.state.possibleMoves('player1')
+            game.state.possibleMoves('player2')
+        return 2 * len(games)
+    
+    def game_copy():
+        for game in games:
+            game.copy()
+        return len(games)
+    
+    return {
+        'doMoveUndo': round(_operations_per_second(do_and_undo)),
+        'copyAndDoMove': round(_operations_per_second(do_move_on_copy)),
+        'packedApplyMove': round(_operations_per_second(packed_apply_move)),
+        'possibleMoves': round(_operations_per_second(possible_moves)),
+        'gameCopy': round(_operations_per_second(game_copy)),
+    }
+
+
+def run_suite(corpus, heuristic_version=1, max_depth=None, repeats=3, pvs=False, aspiration_window=None):
+    #Run every benchmark and return the machine-readable results
+    positions = {}
+    print(f"{'position':<16}{'depth':>6}{'move':>6}{'nodes':>10}{'seconds':>10}{'nodes/s':>11}")
+    for position in corpus:
+        result = benchmark_search(position, heuristic_version, max_depth, repeats, pvs, aspiration_window)
+        positions[position['name']] = result
+        print(f"{position['name']:<16}{result['depth']:>6}{result['bestMove']:>6}{result['nodes']:>10}"
+              f"{result['seconds']:>10.3f}{result['nodesPerSecond']:>11}")
+    
+    primitives = benchmark_primitives(corpus)
+    for name, rate in primitives.items():
+        print(f"{name:<16}{rate:>12} ops/s")
+    
+    nodes = sum(result['nodes'] for result in positions.values())
+    seconds = sum(result['seconds'] for result in positions.values())
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'heuristicVersion': heuristic_version,
+            'pvs': pvs,
+            'aspirationWindow': aspiration_window,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'positions': positions,
+        'primitives': primitives,
+        'totals': {
+            'nodes': nodes,
+            'seconds': round(seconds, 6),
+            'nodesPerSecond': round(nodes / seconds),
+        },
+    }
+
+
+# Meta entries that change what the suite measures: results are only
+# compared with a baseline run with the same ones
+SEARCH_SETTINGS = ('heuristicVersion', 'pvs', 'aspirationWindow')
+
+
+def find_regressions(results, baseline, threshold=0.25, node_threshold=0.05):
+    #Compare results with a baseline run. Times and throughput may move by
+    #threshold, node counts by node_threshold; best moves must agree. Runs
+    #with other search settings are not comparable: their mismatch is
+    #reported instead.
+
+    #Returns:list of regression descriptions (empty if none)
+    mismatches = [
+        f"settings: {key} {results['meta'].get(key)!r} (baseline {baseline['meta'].get(key)!r})"
+        for key in SEARCH_SETTINGS if results['meta'].get(key) != baseline['meta'].get(key)
+    ]
+    if mismatches:
+        return mismatches
+    
+    regressions = []
+    
+    for name, base in baseline['positions'].items():
+        result = results['positions'].get(name)
+        if result is None or result['depth'] != base['depth']:
+            continue
+        if result['bestMove'] != base['bestMove']:
+            regressions.append(f"{name}: best move {result['bestMove']} (baseline {base['bestMove']})")
+        if result['nodes'] > base['nodes'] * (1 + node_threshold):
+            regressions.append(f"{name}: {result['nodes']} nodes (baseline {base['nodes']})")
+        if (result['seconds'] > base['seconds'] * (1 + threshold)
+                and result['seconds'] - base['seconds'] > MIN_SECONDS_DELTA):
+            regressions.append(f"{name}: {result['seconds']:.3f}s (baseline {base['seconds']:.3f}s)")
+    
+    for name, base_rate in baseline['primitives'].items():
+        rate = results['primitives'].get(name)
+        if rate is not None and rate < base_rate * (1 - threshold):
+            regressions.append(f"{name}: {rate} ops/s (baseline {base_rate})")
+    
+    base_nps = baseline['totals']['nodesPerSecond']
+    if results['totals']['nodesPerSecond'] < base_nps * (1 - threshold):
+        regressions.append(f"search: {results['totals']['nodesPerSecond']} nodes/s (baseline {base_nps})")
+    
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mancala search benchmarks")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    
+    suite = subcommands.add_parser('suite', help="search and board benchmarks on the fixed position corpus")
+    suite.add_argument('--corpus', default=CORPUS_PATH)
+    suite.add_argument('--heuristic', type=int, default=1)
+    suite.add_argument('--max-depth', type=int, help="cap the corpus depths (quick runs)")
+    suite.add_argument('--repeats', type=int, default=3, help="full-depth runs per position (best time counts)")
+    suite.add_argument('--pvs', action='store_true', help="principal variation search")
+    suite.add_argument('--aspiration', type=float, metavar='WIDTH',
+                       help="aspiration windows of this half-width around the previous depth's value")
+    suite.add_argument('--output', help="write the results as JSON to this file")
+    suite.add_argument('--save-baseline', nargs='?', const=BASELINE_PATH, metavar='PATH',
+                       help="store the results as the new baseline")
+    suite.add_argument('--baseline', nargs='?', const=BASELINE_PATH, metavar='PATH',
+                       help="compare with a baseline and fail on regressions")
+    suite.add_argument('--threshold', type=float, default=0.25,
+                       help="allowed relative slowdown of times and throughput")
+    suite.add_argument('--node-threshold', type=float, default=0.05,
+                       help="allowed relative increase of node counts")
+    
+    scaling = subcommands.add_parser('scaling', help="root-parallel search speed for 1..N workers")
+    scaling.add_argument('--workers', type=int, default=4, help="largest worker count to try")
+    scaling.add_argument('--depth', type=int, default=9)
+    scaling.add_argument('--heuristic', type=int, default=1)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'scaling':
+        ok = benchmark_parallel_scaling(args.workers, args.depth, args.heuristic)
+    
+    elif args.command == 'suite':
+        results = run_suite(load_corpus(args.corpus), args.heuristic, args.max_depth, args.repeats,
+                            args.pvs, args.aspiration)
+        ok = True
+        
+        for path in filter(None, (args.output, args.save_baseline)):
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {path}")
+        
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            regressions = find_regressions(results, baseline, args.threshold, args.node_threshold)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            print(f"{len(regressions)} regression(s) against {args.baseline}")
+            ok = not regressions
+    
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
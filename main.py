@@ -1,5 +1,14 @@
 from src.game import Game
 from src.ai_player import Play
+from src.endgame_db import open_database
+from src.opening_book import open_book
+from src.search_cache import SearchCache
+
+# Perfect endgame play when the database has been built (python -m src.endgame_db)
+endgame_db = open_database()
+
+# Instant opening moves when the book has been built (python -m src.opening_book)
+opening_book = open_book()
 
 
 
@@ -86,7 +95,8 @@ def human_vs_computer():
         'COMPUTER': computer_side
     })
     
-    play = Play(game, depth=depth)
+    play = Play(game, depth=depth, endgame_db=endgame_db, opening_book=opening_book,
+                search_cache=SearchCache(), ponder=True)
     
     # Determine who starts
     current_player = 'HUMAN' if human_side == 'player1' else 'COMPUTER'
@@ -99,30 +109,31 @@ def human_vs_computer():
     print(game.state)
     
     # Game loop
-    while not game.gameOver():
+    while not game.is_terminal():
         if current_player == 'HUMAN':
             # Human's turn (with replay rule)
             replay = True
-            while replay and not game.gameOver():
+            while replay and not game.is_terminal():
                 replay = play.humanTurn()
-                if replay and not game.gameOver():
+                if replay and not game.is_terminal():
                     print("\n→ You get another turn!")
             
-            if not game.gameOver():
+            if not game.is_terminal():
                 current_player = 'COMPUTER'
         else:
             # Computer's turn (with replay rule)
             replay = True
-            while replay and not game.gameOver():
+            while replay and not game.is_terminal():
                 replay = play.computerTurn('COMPUTER')
-                if replay and not game.gameOver():
+                if replay and not game.is_terminal():
                     print("\n→ Computer gets another turn!")
                     input("Press Enter to see computer's next move...")
             
-            if not game.gameOver():
+            if not game.is_terminal():
                 current_player = 'HUMAN'
     
-    # Game over
+    # Game over: collect the remaining seeds into the stores
+    game.gameOver()
     print("\n" + "="*60)
     print(" "*20 + "GAME OVER!")
     print("="*60)
@@ -172,7 +183,8 @@ def computer_vs_computer():
         'COMPUTER2': 'player2'
     })
     
-    play = Play(game, depth=depth)
+    play = Play(game, depth=depth, endgame_db=endgame_db, opening_book=opening_book,
+                search_cache=SearchCache())
     
     print("\n" + "="*60)
     print("GAME START!")
@@ -187,37 +199,38 @@ def computer_vs_computer():
     current_computer = 'COMPUTER1'
     move_count = 0
     
-    while not game.gameOver():
+    while not game.is_terminal():
         move_count += 1
         print(f"\n--- Move #{move_count} ---")
         
         if current_computer == 'COMPUTER1':
             # Computer 1's turn with standard heuristic
             replay = True
-            while replay and not game.gameOver():
+            while replay and not game.is_terminal():
                 replay = play.computerTurn('COMPUTER1', heuristic_version=1)
-                if replay and not game.gameOver():
+                if replay and not game.is_terminal():
                     print("\n→ COMPUTER 1 gets another turn!")
                     input("Press Enter to continue...")
             
-            if not game.gameOver():
+            if not game.is_terminal():
                 current_computer = 'COMPUTER2'
         else:
             # Computer 2's turn with advanced heuristic
             replay = True
-            while replay and not game.gameOver():
+            while replay and not game.is_terminal():
                 replay = play.computerTurn('COMPUTER2', heuristic_version=2)
-                if replay and not game.gameOver():
+                if replay and not game.is_terminal():
                     print("\n→ COMPUTER 2 gets another turn!")
                     input("Press Enter to continue...")
             
-            if not game.gameOver():
+            if not game.is_terminal():
                 current_computer = 'COMPUTER1'
         
-        if not game.gameOver():
+        if not game.is_terminal():
             input("\nPress Enter for next move...")
     
-    # Game over
+    # Game over: collect the remaining seeds into the stores
+    game.gameOver()
     print("\n" + "="*60)
     print(" "*20 + "GAME OVER!")
     print("="*60)
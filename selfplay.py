@@ -0,0 +1,263 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.game import Game
+from src.ai_player import Play
+
+
+# Engine settings accepted in --engine specs, mapped to Play arguments
+ENGINE_OPTIONS = {
+    'depth': ('depth', int),
+    'heuristic': ('heuristic_version', int),
+    'time_ms': ('time_ms', int),
+    'tt_mb': ('tt_memory_mb', float),
+    'ordering': ('move_ordering', lambda value: value.lower() in ('1', 'true', 'yes', 'on')),
+    'pvs': ('pvs', lambda value: value.lower() in ('1', 'true', 'yes', 'on')),
+    'aspiration': ('aspiration_window', float),
+}
+
+CSV_FIELDS = [
+    'game', 'player1', 'player2', 'winner', 'player1Score', 'player2Score', 'margin',
+    'moves', 'openingPlies', 'player1Nodes', 'player2Nodes',
+    'player1MsPerMove', 'player2MsPerMove', 'player1MaxMs', 'player2MaxMs',
+]
+
+
+def parse_engine(spec):
+    #Parse 'name:depth=6,heuristic=2,time_ms=100' into an engine settings dict
+    name, _, options = spec.partition(':')
+    engine = {'name': name, 'depth': 6, 'heuristic_version': 1}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key not in ENGINE_OPTIONS:
+            raise ValueError(f"Unknown engine option '{key}' in '{spec}'")
+        field, convert = ENGINE_OPTIONS[key]
+        engine[field] = convert(value)
+    return engine
+
+
+def random_opening(game, plies, rng):
+    #Play plies random moves (extra turns keep the same side).
+    #Returns the side to move, or None if the game ended during the opening.
+    side = 'player1'
+    for _ in range(plies):
+        moves = game.state.possibleMoves(side)
+        replay = game.state.doMove(side, rng.choice(moves))
+        if game.is_terminal():
+            return None
+        if not replay:
+            side = 'player2' if side == 'player1' else 'player1'
+    return side
+
+
+def play_game(task):
+    #Process-pool worker: play one headless game between two engines.
+    #Returns the per-game result dict.
+    game_number, engine1, engine2, opening_plies, seed = task
+    rng = random.Random(seed)
+
+    # Draw openings until one does not end the game by itself
+    while True:
+        game = Game({'COMPUTER1': 'player1', 'COMPUTER2': 'player2'})
+        side = random_opening(game, opening_plies, rng)
+        if side is not None:
+            break
+
+    engines = {'player1': engine1, 'player2': engine2}
+    players = {}
+    for board_side, engine in engines.items():
+        settings = {k: v for k, v in engine.items() if k not in ('name', 'heuristic_version')}
+        players[board_side] = Play(game, **settings)
+
+    nodes = {'player1': 0, 'player2': 0}
+    times = {'player1': [], 'player2': []}
+    moves = 0
+
+    while True:
+        play = players[side]
+        player_type = 1 if side == 'player1' else -1
+
+        start = time.perf_counter()
+        _, pit = play.choose_move(player_type, engines[side]['heuristic_version'])
+        times[side].append(time.perf_counter() - start)
+        nodes[side] += play.nodes
+
+        replay = game.state.doMove(side, pit)
+        moves += 1
+        if game.gameOver():
+            break
+        if not replay:
+            side = 'player2' if side == 'player1' else 'player1'
+
+    score1 = game.state.get_store_count('player1')
+    score2 = game.state.get_store_count('player2')
+    if score1 > score2:
+        winner = engine1['name']
+    elif score2 > score1:
+        winner = engine2['name']
+    else:
+        winner = 'TIE'
+
+    def ms_per_move(side):
+        return round(1000 * sum(times[side]) / len(times[side]), 3) if times[side] else 0.0
+
+    def max_ms(side):
+        return round(1000 * max(times[side]), 3) if times[side] else 0.0
+
+    return {
+        'game': game_number,
+        'player1': engine1['name'],
+        'player2': engine2['name'],
+        'winner': winner,
+        'player1Score': score1,
+        'player2Score': score2,
+        'margin': score1 - score2,
+        'moves': moves,
+        'openingPlies': opening_plies,
+        'player1Nodes': nodes['player1'],
+        'player2Nodes': nodes['player2'],
+        'player1MsPerMove': ms_per_move('player1'),
+        'player2MsPerMove': ms_per_move('player2'),
+        'player1MaxMs': max_ms('player1'),
+        'player2MaxMs': max_ms('player2'),
+    }
+
+
+def schedule(engines, games_per_pair, opening_plies, seed):
+    #Round robin over engine pairs. Games come in pairs with the same random
+    #opening and colors swapped, so neither engine profits from the opening.
+    tasks = []
+    game_number = 0
+    for engine_a, engine_b in itertools.combinations(engines, 2):
+        for i in range(games_per_pair):
+            opening_seed = seed * 1000003 + game_number - (i % 2)
+            first, second = (engine_a, engine_b) if i % 2 == 0 else (engine_b, engine_a)
+            tasks.append((game_number, first, second, opening_plies, opening_seed))
+            game_number += 1
+    return tasks
+
+
+def elo_ratings(results, names, iterations=200):
+    #Elo-style ratings fitted to all results (draws count half), mean 1500
+    ratings = dict.fromkeys(names, 0.0)
+    pairs = []
+    for result in results:
+        if result['winner'] == 'TIE':
+            score = 0.5
+        else:
+            score = 1.0 if result['winner'] == result['player1'] else 0.0
+        pairs.append((result['player1'], result['player2'], score))
+
+    for _ in range(iterations):
+        delta = dict.fromkeys(names, 0.0)
+        played = dict.fromkeys(names, 0)
+        for a, b, score in pairs:
+            expected = 1 / (1 + 10 ** ((ratings[b] - ratings[a]) / 400))
+            delta[a] += score - expected
+            delta[b] -= score - expected
+            played[a] += 1
+            played[b] += 1
+        for name in names:
+            if played[name]:
+                ratings[name] += 32 * delta[name] / math.sqrt(played[name])
+        mean = sum(ratings.values()) / len(ratings)
+        for name in names:
+            ratings[name] -= mean
+
+    return {name: round(1500 + rating, 1) for name, rating in ratings.items()}
+
+
+def summarize(results, engines):
+    names = [engine['name'] for engine in engines]
+    summary = {name: {'games': 0, 'wins': 0, 'losses': 0, 'ties': 0, 'margin': 0} for name in names}
+
+    for result in results:
+        for side, sign in (('player1', 1), ('player2', -1)):
+            stats = summary[result[side]]
+            stats['games'] += 1
+            stats['margin'] += sign * result['margin']
+            if result['winner'] == 'TIE':
+                stats['ties'] += 1
+            elif result['winner'] == result[side]:
+                stats['wins'] += 1
+            else:
+                stats['losses'] += 1
+
+    ratings = elo_ratings(results, names)
+    for name, stats in summary.items():
+        games = stats['games'] or 1
+        stats['winRate'] = round((stats['wins'] + 0.5 * stats['ties']) / games, 4)
+        stats['averageMargin'] = round(stats['margin'] / games, 2)
+        stats['elo'] = ratings[name]
+        del stats['margin']
+    return summary
+
+
+def run_tournament(engines, games_per_pair, output, workers=1, opening_plies=4, seed=1):
+    #Play the round robin across worker processes, streaming each result to
+    #output (.csv for CSV, anything else JSON lines). Returns the summary.
+    tasks = schedule(engines, games_per_pair, opening_plies, seed)
+    as_csv = output.endswith('.csv')
+    results = []
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS) if as_csv else None
+        if writer:
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(play_game, task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results.append(result)
+                if writer:
+                    writer.writerow(result)
+                else:
+                    f.write(json.dumps(result) + '\n')
+                f.flush()
+                if done % 10 == 0 or done == len(tasks):
+                    print(f"  {done}/{len(tasks)} games")
+
+    return summarize(results, engines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless computer-vs-computer tournaments")
+    parser.add_argument('--engine', action='append', required=True,
+                        help="name:option=value,... with options " + ', '.join(ENGINE_OPTIONS)
+                             + " (give at least two)")
+    parser.add_argument('--games', type=int, default=100, help="games per engine pair")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--opening-plies', type=int, default=4, help="random moves before the engines play")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='selfplay_results.jsonl', help=".jsonl or .csv")
+    parser.add_argument('--summary', help="also write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    engines = [parse_engine(spec) for spec in args.engine]
+    if len(engines) < 2 or len({engine['name'] for engine in engines}) != len(engines):
+        parser.error("give at least two engines with distinct names")
+
+    start = time.perf_counter()
+    summary = run_tournament(engines, args.games, args.output, args.workers, args.opening_plies, args.seed)
+
+    print(f"\nResults written to {args.output} ({time.perf_counter() - start:.1f}s)")
+    print(f"{'engine':<16}{'games':>7}{'wins':>6}{'ties':>6}{'losses':>8}{'win rate':>10}{'avg margin':>12}{'elo':>9}")
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]['elo']):
+        print(f"{name:<16}{stats['games']:>7}{stats['wins']:>6}{stats['ties']:>6}{stats['losses']:>8}"
+              f"{stats['winRate']:>10.3f}{stats['averageMargin']:>12.2f}{stats['elo']:>9.1f}")
+
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,340 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from src.game import Game
-from src.ai_player import Play
-import copy
+from src.mancala_board import MancalaBoard
+from src.packed_board import pack, unpack
+from src.ai_player import MAX_WORKERS, Play, choose_moves
+from src.analysis import AnalysisCache, analyze_positions, parse_pits
+from src.metrics import COUNT_BUCKETS, MetricsTable, Registry, render_families
+from src.endgame_db import open_database
+from src.opening_book import open_book
+from src.search_cache import SearchCachePool
+from src.ponder import set_max_ponderers
+from src.move_cache import MoveCache, move_key
+from src.job_queue import JobQueue, JobTable, QueueFull
+from src.session_store import (SessionStore, SharedSessionStore, SessionConflict,
+                               DEFAULT_PATH as SESSION_DB_PATH)
+import argparse
+import atexit
+import json
+import os
+import signal
+import socket
+import threading
+import time
 
 app = Flask(__name__)
 CORS(app)  # Allow requests from browser
 
-# Store active games (in production, use a database)
-games = {}
+def end_session(game_id, game_data):
+    """Free what an evicted or expired game holds besides its session"""
+    game_data['play'].stop_pondering()
+    search_caches.discard(game_id)
+
+# Active games and AI move jobs, created by configure_state(): kept in this
+# process, or shared with other server processes through SQLite
+games = None
+jobs = None
+shared_state = False
+metrics_table = None  # metrics of every process sharing the file (shared state only)
+
+# Endgame database shared by all games (None until built with python -m src.endgame_db)
+endgame_db = open_database()
+
+# Opening book shared by all games (None until built with python -m src.opening_book)
+opening_book = open_book()
+
+# Search caches (transposition table + principal variation) kept between the
+# moves of each game: MB per game, and MB for all games together (least
+# recently used games lose their cache first)
+search_caches = SearchCachePool(
+    session_mb=float(os.environ.get('MANCALA_CACHE_SESSION_MB', 16)),
+    total_mb=float(os.environ.get('MANCALA_CACHE_TOTAL_MB', 256)),
+)
+
+jobs_lock = threading.Lock()  # one AI move job per game at a time
+
+# Games held by a synchronous move (/api/ai-move, /api/human-move) or a running
+# /api/ai-moves batch: the search plays its moves on the live board
+busy_games = set()
+
+# Background searches on the humans' time for all games together: when they
+# are all running, further games do not ponder
+set_max_ponderers(int(os.environ.get('MANCALA_MAX_PONDERERS', 4)))
+
+# Worker processes searching the games of a batch (at a time, from the shared
+# pool of MAX_WORKERS), and most games per batch
+BATCH_WORKERS = min(int(os.environ.get('MANCALA_BATCH_WORKERS', MAX_WORKERS)), MAX_WORKERS)
+MAX_BATCH_MOVES = int(os.environ.get('MANCALA_MAX_BATCH', 256))
+
+# Longest a job poll waits for the result (seconds)
+MAX_POLL_WAIT = 30
+
+# Seconds between keep-alive comments on an idle event stream
+SSE_HEARTBEAT = 15
+
+# Moves found by earlier searches, by position, side, depth or time budget and
+# heuristic: a repeated request plays the move without searching. With
+# MANCALA_MOVE_CACHE_DB they are also kept in that SQLite file (across restarts,
+# and shared by the server processes using it).
+move_cache = MoveCache(int(os.environ.get('MANCALA_MOVE_CACHE', 100000)),
+                       os.environ.get('MANCALA_MOVE_CACHE_DB') or None)
+
+# Largest limits of an AI move: time budget (of a game or a request) and
+# fixed depth
+MAX_MOVE_TIME_MS = int(os.environ.get('MANCALA_MAX_MOVE_TIME_MS', 10000))
+MAX_MOVE_DEPTH = int(os.environ.get('MANCALA_MAX_MOVE_DEPTH', 15))
+
+# Results of /api/analyze memoized by position and limits, and the largest
+# limits a request may ask for
+analysis_cache = AnalysisCache(int(os.environ.get('MANCALA_ANALYSIS_CACHE', 10000)))
+MAX_ANALYSIS_DEPTH = int(os.environ.get('MANCALA_MAX_ANALYSIS_DEPTH', 12))
+MAX_ANALYSIS_TIME_MS = int(os.environ.get('MANCALA_MAX_ANALYSIS_TIME_MS', 10000))
+
+# Prometheus metrics of this process, served at /metrics: every AI move search
+# (labelled by the depth it reached and the heuristic), the move cache and the
+# latency of each endpoint. With shared state every process publishes them to
+# the SQLite file at most every MANCALA_METRICS_PUBLISH_S seconds (and when it
+# answers /metrics), labelled worker=<pid>, and /metrics serves all of them.
+metrics = Registry()
+METRICS_PUBLISH_S = float(os.environ.get('MANCALA_METRICS_PUBLISH_S', 5))
+metrics_published = 0.0  # time.monotonic() of this process's last publication
+SEARCH_LABELS = ('depth', 'heuristic_version')
+search_seconds = metrics.histogram('mancala_search_duration_seconds', 'Wall time of AI move searches', SEARCH_LABELS)
+search_nodes = metrics.histogram('mancala_search_nodes', 'Nodes visited per AI move search',
+                                 SEARCH_LABELS, COUNT_BUCKETS)
+search_leaf_evals = metrics.histogram('mancala_search_leaf_evaluations', 'Leaf evaluations per AI move search',
+                                      SEARCH_LABELS, COUNT_BUCKETS)
+search_cutoffs = metrics.histogram('mancala_search_cutoffs', 'Alpha-beta cutoffs per AI move search',
+                                   SEARCH_LABELS, COUNT_BUCKETS)
+search_max_ply = metrics.histogram('mancala_search_max_ply', 'Deepest ply reached per AI move search (extra turns included)',
+                                   SEARCH_LABELS, (2, 4, 6, 8, 10, 12, 16, 20, 24, 32, 48, 64))
+tt_probes = metrics.counter('mancala_transposition_probes_total', 'Transposition table probes of AI move searches',
+                            SEARCH_LABELS + ('result',))
+move_cache_lookups = metrics.counter('mancala_move_cache_lookups_total', 'AI moves answered from the move cache or searched',
+                                     ('result',))
+http_seconds = metrics.histogram('mancala_http_request_duration_seconds', 'Time to answer API requests',
+                                 ('endpoint', 'method', 'status'))
+active_games_gauge = metrics.gauge('mancala_active_games', 'Games in the session store')
+queued_jobs_gauge = metrics.gauge('mancala_jobs_queued', 'AI move jobs waiting for a worker thread')
+search_caches_gauge = metrics.gauge('mancala_search_caches', 'Games holding a search cache')
+
+def record_search(stats, heuristic_version):
+    """Add the stats of an AI move (searched or from the move cache) to the metrics"""
+    move_cache_lookups.inc(result=stats['moveCache'])
+    if stats['moveCache'] != 'miss':
+        return
+    labels = {'depth': stats['depth'], 'heuristic_version': heuristic_version}
+    search_seconds.observe(stats['ms'] / 1000, **labels)
+    search_nodes.observe(stats['nodes'], **labels)
+    search_leaf_evals.observe(stats['leafEvals'], **labels)
+    search_cutoffs.observe(stats['cutoffs'], **labels)
+    search_max_ply.observe(stats['maxPly'], **labels)
+    tt = stats.get('transpositionTable')
+    if tt is not None:
+        tt_probes.inc(tt['hits'], result='hit', **labels)
+        tt_probes.inc(tt['misses'], result='miss', **labels)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def time_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_seconds.observe(time.perf_counter() - started, endpoint=rule,
+                             method=request.method, status=response.status_code)
+    if metrics_table is not None and time.monotonic() - metrics_published >= METRICS_PUBLISH_S:
+        publish_metrics()
+    return response
+
+def publish_metrics():
+    """Write this process's metrics to the shared file for the other processes' /metrics"""
+    global metrics_published
+    metrics_published = time.monotonic()
+    update_gauges()
+    metrics_table.publish(metrics.families(worker=os.getpid()))
+
+def update_gauges():
+    active_games_gauge.set(len(games))
+    queued_jobs_gauge.set(jobs.stats()['queued'])
+    search_caches_gauge.set(len(search_caches))
+
+# Answer to an AI move request when the engine has no move left
+NO_MOVES_RESPONSE = ({'success': False, 'error': 'No possible moves', 'gameOver': True}, 200)
 
 def normalize_board(board):
     """Convert all board keys to strings for JSON serialization"""
     return {str(k): v for k, v in board.items()}
 
+# Board encodings of responses, chosen with ?board=<format> or the Accept header:
+# 'board' (object keyed A-L, 1, 2), 'pits' (14 counts: A-F, store 1, G-L,
+# store 2), 'packed' (hex of the 6-bits-per-slot packed int), 'delta' (only the
+# [slot index, count] pairs a move changed) and, for /api/game-state, 'bytes'
+# (the 14 counts as raw bytes)
+BOARD_MIMETYPES = {
+    'application/json': 'board',
+    'application/vnd.mancala.pits+json': 'pits',
+    'application/vnd.mancala.packed+json': 'packed',
+    'application/vnd.mancala.delta+json': 'delta',
+    'application/octet-stream': 'bytes',
+}
+
+def requested_board_format():
+    """Board encoding asked for by the request (unknown formats get 'board')"""
+    board_format = request.args.get('board')
+    if board_format is None:
+        board_format = BOARD_MIMETYPES.get(request.accept_mimetypes.best_match(list(BOARD_MIMETYPES)))
+    return board_format if board_format in BOARD_MIMETYPES.values() else 'board'
+
+def board_fields(pits, board_format, before=None):
+    """Response fields carrying the board pits in the given encoding; a
+    delta is taken against the board before, else the pits are sent whole"""
+    if board_format == 'delta' and before is not None:
+        return {'delta': [[i, count] for i, (old, count) in enumerate(zip(before, pits)) if old != count]}
+    if board_format in ('pits', 'delta', 'bytes'):
+        return {'pits': list(pits)}
+    if board_format == 'packed':
+        return {'packed': '%x' % pack(pits)}
+    return {'board': normalize_board(MancalaBoard.from_pits(pits).board)}
+
+def game_busy(game_id):
+    """True while a move, batch or AI move job for the game is queued or running"""
+    return game_id in busy_games or jobs.active(game_id)
+
+def claim_game(game_id):
+    """Hold a game for a synchronous move; False if it is busy"""
+    with jobs_lock:
+        if game_busy(game_id):
+            return False
+        busy_games.add(game_id)
+        return True
+
+def release_game(game_id):
+    with jobs_lock:
+        busy_games.discard(game_id)
+
+def create_session(game_id, mode, player_side, settings, pits=None):
+    """Game (on the given pits, else the initial board) and its engine.
+
+    settings are the Play options chosen at /api/new-game.
+    """
+    game = Game(playerSide=player_side)
+    if pits is not None:
+        game.state = MancalaBoard.from_pits(pits)
+    # Pondering needs the human's next move to reach the same process
+    engine_settings = dict(settings, ponder=settings['ponder'] and not shared_state)
+    play = Play(game, endgame_db=endgame_db, opening_book=opening_book,
+                search_cache=search_caches.get(game_id), **engine_settings)
+    return {
+        'game': game,
+        'play': play,
+        'mode': mode,
+        'depth': settings['depth'],
+        'timeMs': settings['time_ms'],
+        'settings': settings,
+        'pits': list(game.state.pits)
+    }
+
+def session_record(game_data):
+    """Compact snapshot of a game: board, sides and settings.
+
+    Uses the board as of the last move played ('pits'), since a search may
+    be playing moves on the live board.
+    """
+    return {
+        'mode': game_data['mode'],
+        'playerSide': game_data['game'].playerSide,
+        'settings': game_data['settings'],
+        'pits': game_data['pits']
+    }
+
+def restore_session(game_id, record):
+    """Game of a session record; None (dropped) if the engine refuses its
+    settings, e.g. more workers than this machine allows"""
+    try:
+        return create_session(game_id, record['mode'], record['playerSide'], record['settings'], record['pits'])
+    except ValueError:
+        return None
+
+def configure_state(shared):
+    """Create the game store and the AI move job queue.
+    
+    Games are kept for MANCALA_SESSION_TTL_S seconds after their last request,
+    at most MANCALA_MAX_SESSIONS of them (least recently used evicted first).
+    Jobs run on MANCALA_JOB_WORKERS threads fed by a queue of at most
+    MANCALA_JOB_QUEUE jobs.
+    
+    shared=False keeps games in this process, snapshotted to the SQLite file
+    MANCALA_SESSION_DB every MANCALA_SNAPSHOT_INTERVAL_S seconds and on exit,
+    and restored now. shared=True keeps games and jobs in that file, so that
+    several server processes can serve every game.
+    """
+    global games, jobs, shared_state, metrics_table
+    max_sessions = int(os.environ.get('MANCALA_MAX_SESSIONS', 1000))
+    ttl_s = float(os.environ.get('MANCALA_SESSION_TTL_S', 3600))
+    job_workers = int(os.environ.get('MANCALA_JOB_WORKERS', 2))
+    max_queued = int(os.environ.get('MANCALA_JOB_QUEUE', 64))
+    
+    shared_state = shared
+    if shared:
+        if not SESSION_DB_PATH:
+            raise ValueError("shared state needs a MANCALA_SESSION_DB file")
+        games = SharedSessionStore(SESSION_DB_PATH, session_record, restore_session,
+                                   max_sessions, ttl_s, on_evict=end_session)
+        jobs = JobQueue(job_workers, max_queued, table=JobTable(SESSION_DB_PATH))
+        metrics_table = MetricsTable(SESSION_DB_PATH)
+        return
+    
+    metrics_table = None
+    
+    games = SessionStore(max_sessions, ttl_s, on_evict=end_session,
+                         can_evict=lambda game_id, game_data: not game_busy(game_id))
+    jobs = JobQueue(job_workers, max_queued)
+    if SESSION_DB_PATH:
+        games.open(SESSION_DB_PATH, session_record, restore_session,
+                   interval_s=float(os.environ.get('MANCALA_SNAPSHOT_INTERVAL_S', 60)))
+
+def limit_error(name, value, most):
+    """Error message if value, an optional request field, is neither None nor
+    an int between 1 and most; else None"""
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= most):
+        return "%s must be an integer between 1 and %d" % (name, most)
+    return None
+
+def save_game(game_id, game_data):
+    """Record a move in the game store; returns an error response if another
+    server process changed the game meanwhile, else None"""
+    try:
+        games.save(game_id, game_data)
+    except SessionConflict as e:
+        return {'success': False, 'error': str(e)}, 409
+    return None
+
+def busy_response():
+    return jsonify({'success': False, 'error': 'An AI move is in progress for this game'}), 409
+
 @app.route('/api/new-game', methods=['POST'])
 def new_game():
     """Create a new game"""
     data = request.json
     game_id = data.get('gameId', 'default')
     mode = data.get('mode', 'human')  # 'human' or 'ai'
-    depth = data.get('depth', 6)
+    error = (limit_error('depth', data.get('depth', 6), MAX_MOVE_DEPTH)
+             or limit_error('timeMs', data.get('timeMs'), MAX_MOVE_TIME_MS))
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    settings = {
+        'depth': data.get('depth', 6),
+        'time_ms': data.get('timeMs'),  # time budget per AI move, used instead of depth
+        'move_ordering': data.get('moveOrdering', True),
+        'workers': data.get('workers', 1),  # processes for root-parallel fixed-depth search
+        'pvs': data.get('pvs', False),  # principal variation search (null-window searches)
+        'aspiration_window': data.get('aspirationWindow'),  # root window half-width, None = full window
+        'ponder': data.get('ponder', False) and mode == 'human',  # search on the human's time
+    }
     
     # Set up player sides based on mode
     if mode == 'human':
@@ -34,24 +348,28 @@ def new_game():
             'COMPUTER2': 'player2'
         }
     
-    # Create game
-    game = Game(playerSide=player_side)
-    play = Play(game, depth=depth)
+    if game_busy(game_id):
+        return busy_response()
+    
+    # Create game (a new game under an existing id starts with an empty cache)
+    if game_id in games:
+        games[game_id]['play'].stop_pondering()
+    search_caches.discard(game_id)
+    try:
+        game_data = create_session(game_id, mode, player_side, settings)
+    except ValueError as e:  # settings the engine refuses
+        return jsonify({'success': False, 'error': str(e)}), 400
+    game = game_data['game']
     
     # Store game
-    games[game_id] = {
-        'game': game,
-        'play': play,
-        'mode': mode,
-        'depth': depth
-    }
+    games[game_id] = game_data
     
-    # Return initial state with normalized board
-    return jsonify({
-        'success': True,
-        'board': normalize_board(game.state.board),
-        'currentPlayer': 'player1'
-    })
+    # Return initial state in the board encoding asked for
+    return jsonify(dict(
+        board_fields(game.state.pits, requested_board_format()),
+        success=True,
+        currentPlayer='player1'
+    ))
 
 @app.route('/api/ai-move', methods=['POST'])
 def ai_move():
@@ -60,58 +378,153 @@ def ai_move():
     game_id = data.get('gameId', 'default')
     current_player = data.get('currentPlayer', 'player1')
     heuristic_version = data.get('heuristicVersion', 1)
+    time_ms = data.get('timeMs')  # optional per-move override of the game's time budget
     
+    error = limit_error('timeMs', time_ms, MAX_MOVE_TIME_MS)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
     if game_id not in games:
         return jsonify({'success': False, 'error': 'Game not found'}), 404
+    if not claim_game(game_id):
+        return busy_response()
     
+    try:
+        response, status = play_ai_move(game_id, current_player, heuristic_version, time_ms,
+                                        board_format=requested_board_format())
+    finally:
+        release_game(game_id)
+    return jsonify(response), status
+
+def play_ai_move(game_id, current_player, heuristic_version, time_ms, job=None, board_format='board'):
+    """Search and play the AI move, directly or as a job; the response
+    carries the board in board_format (see board_fields).
+
+    Returns (response dict, HTTP status).
+    """
     game_data = games[game_id]
-    game = game_data['game']
     play = game_data['play']
-    mode = game_data['mode']
-    
-    # Determine player name based on mode and current player
-    if mode == 'human':
-        player_name = 'COMPUTER'
-        player_side = game.playerSide['COMPUTER']
-    else:  # ai vs ai
-        if current_player == 'player1':
-            player_name = 'COMPUTER1'
-            player_side = game.playerSide['COMPUTER1']
-        else:
-            player_name = 'COMPUTER2'
-            player_side = game.playerSide['COMPUTER2']
+    player_side, player_type = engine_turn(game_data, current_player)
     
     # Check for possible moves
-    possible_moves = game.state.possibleMoves(player_side)
+    if not game_data['game'].state.possibleMoves(player_side):
+        return NO_MOVES_RESPONSE
     
-    if not possible_moves:
-        return jsonify({
-            'success': False,
-            'error': 'No possible moves',
-            'gameOver': True
-        })
+    # Use Minimax Alpha-Beta Pruning to find best move
+    # (iterative deepening when the game or request has a time budget),
+    # reusing this game's cache (recreated if it was evicted), unless the
+    # position was searched with the same limits before
+    play.search_cache = search_caches.get(game_id)
+    key = ai_move_key(game_data, player_side, heuristic_version, time_ms)
+    known = play_known_move(game_id, game_data, player_side, player_type, heuristic_version, key, board_format)
+    if known is not None:
+        return known
+    
+    complete = True  # searched to the full limits (cacheable)
+    if job is None:
+        play.stop_requested = False  # in case a finished job's stop came late
+        best_value, best_pit = play.choose_move(player_type, heuristic_version, time_ms)
+    else:
+        # Jobs always deepen iteratively, so that they report progress and can
+        # stop early: a fixed-depth game deepens up to its depth, and the
+        # job's deadline caps the time budget
+        max_depth = None if time_ms or play.time_ms else play.depth
+        budget = time_ms or play.time_ms or float('inf')
+        remaining = job.remaining_ms()
+        if remaining is not None and remaining < budget:
+            budget = max(1, remaining)
+            complete = False
+        
+        job.progress = play.search_progress
+        job.on_stop = lambda: setattr(play, 'stop_requested', True)
+        play.stop_requested = job.finish_requested
+        if job.cancel_requested:
+            job.on_stop = None
+            play.stop_requested = False
+            return {'success': False, 'error': 'Cancelled'}, 409
+        play.on_progress = job.publish
+        try:
+            best_value, best_pit = play.choose_move(player_type, heuristic_version, budget, max_depth)
+        finally:
+            # The game's next searches must not inherit the job's stop
+            play.on_progress = job.on_stop = None
+            stopped, play.stop_requested = play.stop_requested, False
+        if job.cancel_requested:
+            # Stopped early: the move is not played
+            return {'success': False, 'error': 'Cancelled', 'stats': play.search_stats()}, 409
+        complete = complete and not stopped
+    
+    if complete:
+        move_cache.put(key, best_value * player_type, best_pit, play.completed_depth, play.pv)
+    return play_move(game_id, game_data, player_side, player_type, heuristic_version,
+                     best_value, best_pit, dict(play.search_stats(), moveCache='miss'), board_format)
+
+def ai_move_key(game_data, player_side, heuristic_version, time_ms):
+    """Move cache key of the engine's search in the game's current position.
+
+    Every engine setting that can change the move found is part of the key,
+    so games with other settings (or another endgame database or opening
+    book) do not share entries.
+    """
+    play = game_data['play']
+    settings = dict(play.search_settings(), ponder=play.ponder)
+    return move_key(game_data['game'].state.pits, player_side, play.depth, time_ms or play.time_ms,
+                    heuristic_version, settings)
+
+def play_known_move(game_id, game_data, player_side, player_type, heuristic_version, key, board_format):
+    """Play the move cached under key without searching; None if there is none.
+
+    Cached values are from the side to move's point of view (value times
+    player_type), since which side is MAX depends on the game mode.
+    """
+    known = move_cache.get(key)
+    if known is None:
+        return None
+    value, best_pit, depth, pv = known
+    best_value = value * player_type
+    play = game_data['play']
+    play.take_known_move(player_type, heuristic_version, (best_value, best_pit), depth, pv)
+    return play_move(game_id, game_data, player_side, player_type, heuristic_version,
+                     best_value, best_pit, dict(play.search_stats(), moveCache='hit'), board_format)
+
+def engine_turn(game_data, current_player):
+    """Side and minimax player (1 MAX, -1 MIN) of the engine to move"""
+    game = game_data['game']
+    
+    # Determine player name based on mode and current player
+    if game_data['mode'] == 'human':
+        player_name = 'COMPUTER'
+    elif current_player == 'player1':  # ai vs ai
+        player_name = 'COMPUTER1'
+    else:
+        player_name = 'COMPUTER2'
     
     # Determine player type for minimax (1 for MAX, -1 for MIN)
     if player_name in ['COMPUTER', 'COMPUTER1']:
         player_type = 1  # MAX
     else:
         player_type = -1  # MIN
+    return game.playerSide[player_name], player_type
+
+def play_move(game_id, game_data, player_side, player_type, heuristic_version, best_value, best_pit, stats,
+              board_format='board'):
+    """Play the AI move chosen and save the game.
+
+    Returns (response dict, HTTP status).
+    """
+    game = game_data['game']
+    play = game_data['play']
+    record_search(stats, heuristic_version)
     
-    # Use Minimax Alpha-Beta Pruning to find best move
-    best_value, best_pit = play.MinimaxAlphaBetaPruning(
-        game,
-        player_type,
-        game_data['depth'],
-        float('-inf'),
-        float('inf'),
-        heuristic_version
-    )
-    
-    # Execute the move
-    game.state.doMove(player_side, best_pit)
+    # Execute the move (landing in the own store earns an extra turn)
+    before = list(game.state.pits)
+    extra_turn = game.state.doMove(player_side, best_pit)
     
     # Check if game is over
     game_over = game.gameOver()
+    game_data['pits'] = list(game.state.pits)  # board as snapshotted
+    conflict = save_game(game_id, game_data)
+    if conflict is not None:
+        return conflict
     winner_info = None
     
     if game_over:
@@ -122,16 +535,264 @@ def ai_move():
             'player1Score': game.state.get_store_count('player1'),
             'player2Score': game.state.get_store_count('player2')
         }
+    elif game_data['mode'] == 'human' and not extra_turn:
+        # The human moves next: search the expected reply meanwhile
+        play.start_pondering(player_type, heuristic_version)
+    
+    return dict(
+        board_fields(game_data['pits'], board_format, before),
+        success=True,
+        move=best_pit,
+        value=best_value,
+        stats=stats,
+        extraTurn=extra_turn,
+        gameOver=game_over,
+        winner=winner_info
+    ), 200
+
+@app.route('/api/ai-moves', methods=['POST'])
+def ai_moves():
+    """AI moves of several games in one request, searched in parallel.
+    
+    Body: {"moves": [{gameId, currentPlayer, heuristicVersion, timeMs}, ...]},
+    at most one entry per game. The games are searched concurrently on
+    MANCALA_BATCH_WORKERS processes. Answers with one result per entry, in
+    order: the /api/ai-move response plus gameId and the HTTP status that
+    request would have had, so that one failed game does not fail the rest.
+    """
+    data = request.json or {}
+    entries = data.get('moves')
+    if not isinstance(entries, list) or not entries or not all(isinstance(e, dict) for e in entries):
+        return jsonify({'success': False, 'error': 'moves must be a non-empty list of objects'}), 400
+    if len(entries) > MAX_BATCH_MOVES:
+        return jsonify({'success': False, 'error': 'At most %d moves per batch' % MAX_BATCH_MOVES}), 400
+    
+    board_format = requested_board_format()
+    results = [None] * len(entries)
+    searches = []  # (entry index, game id, game data, player side, player type, heuristic version, time budget)
+    with jobs_lock:
+        seen = set()
+        for i, entry in enumerate(entries):
+            game_id = entry.get('gameId', 'default')
+            error = limit_error('timeMs', entry.get('timeMs'), MAX_MOVE_TIME_MS)
+            if game_id in seen:
+                results[i] = {'success': False, 'error': 'Game appears twice in the batch'}, 400
+            elif error:
+                results[i] = {'success': False, 'error': error}, 400
+            elif game_id not in games:
+                results[i] = {'success': False, 'error': 'Game not found'}, 404
+            elif game_busy(game_id):
+                results[i] = {'success': False, 'error': 'An AI move is in progress for this game'}, 409
+            else:
+                game_data = games[game_id]
+                player_side, player_type = engine_turn(game_data, entry.get('currentPlayer', 'player1'))
+                if not game_data['game'].state.possibleMoves(player_side):
+                    results[i] = NO_MOVES_RESPONSE
+                else:
+                    searches.append((i, game_id, game_data, player_side, player_type,
+                                     entry.get('heuristicVersion', 1), entry.get('timeMs')))
+            seen.add(game_id)
+        busy_games.update(search[1] for search in searches)
+    
+    try:
+        requests = []
+        misses = []  # (search, move cache key) of the games searched
+        for search in searches:
+            i, game_id, game_data, player_side, player_type, heuristic_version, time_ms = search
+            play = game_data['play']
+            play.search_cache = search_caches.get(game_id)
+            key = ai_move_key(game_data, player_side, heuristic_version, time_ms)
+            known = play_known_move(game_id, game_data, player_side, player_type, heuristic_version,
+                                    key, board_format)
+            if known is not None:
+                results[i] = known
+            else:
+                misses.append((search, key))
+                requests.append((play, player_type, heuristic_version, time_ms))
+        chosen = choose_moves(requests, BATCH_WORKERS) if requests else []
+        
+        for ((i, game_id, game_data, player_side, player_type, heuristic_version, _), key), outcome in zip(misses, chosen):
+            if isinstance(outcome, Exception):
+                results[i] = {'success': False, 'error': 'Search failed: %s' % outcome}, 500
+                continue
+            (best_value, best_pit), stats = outcome
+            move_cache.put(key, best_value * player_type, best_pit, stats['depth'], stats['pv'])
+            results[i] = play_move(game_id, game_data, player_side, player_type, heuristic_version,
+                                   best_value, best_pit, dict(stats, moveCache='miss'), board_format)
+    finally:
+        with jobs_lock:
+            busy_games.difference_update(search[1] for search in searches)
     
     return jsonify({
         'success': True,
-        'move': best_pit,
-        'value': best_value,
-        'board': normalize_board(game.state.board),
-        'gameOver': game_over,
-        'winner': winner_info
+        'results': [
+            dict(response, gameId=entry.get('gameId', 'default'), status=status)
+            for entry, (response, status) in zip(entries, results)
+        ]
     })
 
+def analysis_key(entry, defaults):
+    """Position and limits of an /api/analyze entry, as the tuple of
+    analyze_position arguments (also the memo key); raises ValueError"""
+    def option(name, default=None):
+        return entry.get(name, defaults.get(name, default))
+    
+    pits = parse_pits(entry.get('pits'), entry.get('board'))
+    to_move = option('toMove', 'player1')
+    if to_move not in ('player1', 'player2'):
+        raise ValueError("toMove must be 'player1' or 'player2'")
+    heuristic_version = option('heuristicVersion', 1)
+    if heuristic_version not in (1, 2):
+        raise ValueError("heuristicVersion must be 1 or 2")
+    
+    depth = option('depth')
+    time_ms = option('timeMs')
+    if depth is None and time_ms is None:
+        depth = 6
+    if depth is not None and (not isinstance(depth, int) or not 1 <= depth <= MAX_ANALYSIS_DEPTH):
+        raise ValueError("depth must be between 1 and %d" % MAX_ANALYSIS_DEPTH)
+    if time_ms is not None:
+        if not isinstance(time_ms, (int, float)) or not 0 < time_ms <= MAX_ANALYSIS_TIME_MS:
+            raise ValueError("timeMs must be between 0 and %d" % MAX_ANALYSIS_TIME_MS)
+        depth = depth or MAX_ANALYSIS_DEPTH
+    return pits, to_move, depth, time_ms, heuristic_version
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    """Analyse positions without a game session.
+    
+    A position is {pits: [14 counts, A-F, store 1, G-L, store 2]} (or {board:
+    {...}} as returned by the other endpoints) with toMove, and the search
+    limits depth (default 6) and/or timeMs (iterative deepening up to depth),
+    and heuristicVersion. Returns the value (player1's point of view), best
+    move, principal variation and the value of every move. Results are
+    memoized per position and limits.
+    
+    Body: one position, or {"positions": [...]} with the limits given once
+    beside the list or per position; then the answer lists one result each,
+    in order, an invalid position failing alone.
+    """
+    data = request.json or {}
+    entries = data.get('positions')
+    single = entries is None
+    if single:
+        entries = [data]
+    if not isinstance(entries, list) or not entries or not all(isinstance(e, dict) for e in entries):
+        return jsonify({'success': False, 'error': 'positions must be a non-empty list of objects'}), 400
+    if len(entries) > MAX_BATCH_MOVES:
+        return jsonify({'success': False, 'error': 'At most %d positions per request' % MAX_BATCH_MOVES}), 400
+    
+    results = [None] * len(entries)
+    searches = {}  # analysis key -> indexes of the entries asking for it
+    for i, entry in enumerate(entries):
+        try:
+            key = analysis_key(entry, data if not single else {})
+        except ValueError as e:
+            results[i] = {'success': False, 'error': str(e)}
+            continue
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            results[i] = dict(cached, success=True, cached=True)
+        else:
+            searches.setdefault(key, []).append(i)
+    
+    keys = list(searches)
+    for key, result in zip(keys, analyze_positions(keys, BATCH_WORKERS, endgame_db)):
+        analysis_cache.put(key, result)
+        for i in searches[key]:
+            results[i] = dict(result, success=True, cached=False)
+    
+    if single:
+        return jsonify(results[0]), 200 if results[0]['success'] else 400
+    return jsonify({'success': True, 'results': results})
+
+@app.route('/api/jobs/ai-move', methods=['POST'])
+def submit_ai_move():
+    """Queue an AI move and return its job id at once (poll /api/jobs/<id>)"""
+    data = request.json
+    game_id = data.get('gameId', 'default')
+    current_player = data.get('currentPlayer', 'player1')
+    heuristic_version = data.get('heuristicVersion', 1)
+    time_ms = data.get('timeMs')
+    deadline_ms = data.get('deadlineMs')  # the best move found by then is played
+    board_format = requested_board_format()  # of the result
+    
+    error = limit_error('timeMs', time_ms, MAX_MOVE_TIME_MS)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    with jobs_lock:
+        if game_id not in games:
+            return jsonify({'success': False, 'error': 'Game not found'}), 404
+        if game_busy(game_id):
+            return busy_response()
+        
+        def run(job):
+            return play_ai_move(game_id, current_player, heuristic_version, time_ms, job, board_format)[0]
+        
+        try:
+            job = jobs.submit(run, deadline_ms, info={'gameId': game_id}, key=game_id)
+        except QueueFull as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+    
+    return jsonify(dict(job.to_dict(), success=True)), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status, progress while running, and result once done.
+    
+    ?wait=<seconds> long-polls: answers as soon as the job finishes.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    wait = request.args.get('wait', type=float)
+    if wait:
+        job.wait(min(wait, MAX_POLL_WAIT))
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events of a job: 'progress' after each completed search
+    depth (depth, bestMove, value, nodes, ms, nps), then one event named after
+    the final status ('done', 'cancelled', ...) carrying the job as polled.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    def stream():
+        for event, data in job.follow(SSE_HEARTBEAT):
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/accept', methods=['POST'])
+def accept_job(job_id):
+    """Stop the search now and play the best move found so far"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    accepted = job.finish_early()
+    job.wait(MAX_POLL_WAIT)
+    return jsonify(dict(job.to_dict(), success=accepted))
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job (a cancelled AI move is not played)"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    cancelled = job.cancel()
+    job.wait(MAX_POLL_WAIT)
+    return jsonify(dict(job.to_dict(), success=cancelled))
+
 @app.route('/api/human-move', methods=['POST'])
 def human_move():
     """Process human move"""
@@ -141,7 +802,15 @@ def human_move():
     
     if game_id not in games:
         return jsonify({'success': False, 'error': 'Game not found'}), 404
-    
+    if not claim_game(game_id):
+        return busy_response()
+    try:
+        return play_human_move(game_id, pit)
+    finally:
+        release_game(game_id)
+
+def play_human_move(game_id, pit):
+    """Play the human's move in a game held by claim_game"""
     game_data = games[game_id]
     game = game_data['game']
     
@@ -156,11 +825,20 @@ def human_move():
             'error': 'Invalid move'
         }), 400
     
-    # Execute move
-    game.state.doMove(human_side, pit)
+    # Execute move (landing in the own store earns an extra turn)
+    before = list(game.state.pits)
+    extra_turn = game.state.doMove(human_side, pit)
+    
+    # Keep pondering only while the human follows the predicted reply
+    game_data['play'].opponent_moved()
     
     # Check if game is over
     game_over = game.gameOver()
+    game_data['pits'] = list(game.state.pits)  # board as snapshotted
+    conflict = save_game(game_id, game_data)
+    if conflict is not None:
+        response, status = conflict
+        return jsonify(response), status
     winner_info = None
     
     if game_over:
@@ -172,54 +850,152 @@ def human_move():
             'player2Score': game.state.get_store_count('player2')
         }
     
-    return jsonify({
-        'success': True,
-        'board': normalize_board(game.state.board),
-        'gameOver': game_over,
-        'winner': winner_info
-    })
+    return jsonify(dict(
+        board_fields(game_data['pits'], requested_board_format(), before),
+        success=True,
+        extraTurn=extra_turn,
+        gameOver=game_over,
+        winner=winner_info
+    ))
 
 @app.route('/api/game-state/<game_id>', methods=['GET'])
 def get_game_state(game_id):
-    """Get current game state"""
+    """Get current game state.
+    
+    The board is the one after the last move played, in the encoding asked
+    for (see board_fields). ?board=delta&since=<packed hex> sends only the
+    slots that differ from the board the client holds; ?board=bytes answers
+    with the 14 counts alone as a binary body.
+    """
     if game_id not in games:
         return jsonify({'success': False, 'error': 'Game not found'}), 404
     
     game_data = games[game_id]
-    game = game_data['game']
-    
-    return jsonify({
-        'success': True,
-        'board': normalize_board(game.state.board),
-        'mode': game_data['mode'],
-        'depth': game_data['depth']
-    })
+    pits = game_data['pits']
+    board_format = requested_board_format()
+    if board_format == 'bytes':
+        response = Response(bytes(pits), mimetype='application/octet-stream')
+    else:
+        before = None
+        since = request.args.get('since')
+        if board_format == 'delta' and since:
+            try:
+                before = unpack(int(since, 16))
+            except ValueError:
+                return jsonify({'success': False, 'error': 'since must be a packed board in hex'}), 400
+        response = jsonify(dict(
+            board_fields(pits, board_format, before),
+            success=True,
+            mode=game_data['mode'],
+            depth=game_data['depth'],
+            timeMs=game_data['timeMs']
+        ))
+    response.headers['Vary'] = 'Accept'
+    return response
 
 @app.route('/api/delete-game/<game_id>', methods=['DELETE'])
 def delete_game(game_id):
     """Delete a game session"""
+    if game_busy(game_id):
+        return busy_response()
     if game_id in games:
+        games[game_id]['play'].stop_pondering()
         del games[game_id]
+        search_caches.discard(game_id)
         return jsonify({'success': True})
     return jsonify({'success': False, 'error': 'Game not found'}), 404
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Metrics in the Prometheus text format: of this process, or with shared
+    state of every live server process (labelled by worker pid)"""
+    if metrics_table is None:
+        update_gauges()
+        text = metrics.render()
+    else:
+        publish_metrics()
+        text = render_families(metrics_table.collect())
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'activeGames': len(games)
+        'pid': os.getpid(),  # which server process answered
+        'activeGames': len(games),
+        'sessions': games.stats(),
+        'searchCaches': search_caches.stats(),
+        'moveCache': move_cache.stats(),
+        'analysisCache': analysis_cache.stats(),
+        'jobs': jobs.stats()
     })
 
+def serve_workers(host, port, workers):
+    """Serve from several processes accepting on one listening socket (POSIX).
+    
+    Games and jobs move to the shared SQLite store first, so that any process
+    can answer any request.
+    """
+    from werkzeug.serving import make_server
+    
+    if not hasattr(os, 'fork'):
+        raise SystemExit("--workers needs os.fork (POSIX); run one server per port instead")
+    if not shared_state:
+        games.close()  # the snapshot becomes the shared store
+        configure_state(True)
+    
+    listener = socket.create_server((host, port), backlog=128)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+# MANCALA_SESSION_DB='' turns snapshots off; MANCALA_SHARED_STATE=1 shares
+# games between processes started by another server (e.g. gunicorn -w N).
+# The search pool's processes import this script as __mp_main__ (see
+# get_executor): they serve no games and must not restore or snapshot them.
+if __name__ != '__mp_main__':
+    configure_state(os.environ.get('MANCALA_SHARED_STATE') == '1')
+    atexit.register(lambda: games.close())
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mancala Flask server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='server processes sharing the port and the games (POSIX)')
+    parser.add_argument('--debug', action='store_true', help='Flask debug mode (one process)')
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("🎮 Mancala Flask Server Starting...")
     print("=" * 60)
-    print("\n✅ Server will run at: http://localhost:5000")
+    print(f"\n✅ Server will run at: http://localhost:{args.port}")
+    if args.workers > 1:
+        print(f"✅ {args.workers} worker processes sharing {SESSION_DB_PATH}")
     print("✅ Open mancala_web.html in your browser")
     print("✅ The web interface will connect to this server\n")
     print("=" * 60)
     print("Press CTRL+C to stop the server")
     print("=" * 60)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    if args.workers > 1:
+        serve_workers(args.host, args.port, args.workers)
+    else:
+        app.run(debug=args.debug, host=args.host, port=args.port, threaded=True)
\ No newline at end of file
@@ -1,8 +1,279 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import time
+
 from .game import Game
+from .endgame_db import EndgameDatabase
+from .mancala_board import MancalaBoard
+from .search_cache import line_continuation, pv_line
+from .transposition import (ADVANCED_HEURISTIC_KEY, EXACT, LOWER, MAX_REPLAY_CHAIN, REPLAY_CHAIN_KEYS, UPPER,
+                            TranspositionTable)
+
+# Deepest iteration tried by a time-budgeted search
+MAX_SEARCH_DEPTH = 64
+
+# The deadline is checked every (mask + 1) nodes
+DEADLINE_CHECK_MASK = 511
+
+# Move ordering scores: extra-turn moves, then captures (by size), then
+# killer moves, then history-heuristic counts
+ORDER_REPLAY = 3000000
+ORDER_CAPTURE = 2000000
+ORDER_KILLER = 1000000
+
+# Width of the null windows searched by PVS. Evaluations are multiples of 0.5,
+# so no value lies strictly inside (alpha, alpha + NULL_WINDOW).
+NULL_WINDOW = 1e-6
+
+
+class SearchTimeout(Exception):
+    #Raised inside the search when the time budget runs out
+    pass
+
+
+# Worker processes of the process pool shared by all Play instances: the most
+# a search or batch can use at a time
+MAX_WORKERS = os.cpu_count() or 1
+
+# How the pool starts its processes: forking a threaded server could copy
+# locks held by other threads into them, so they come from a fork server
+# (or are spawned where there is none)
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# The shared pool, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+# Endgame databases and opening books opened by a worker process, keyed by path
+_worker_endgame_dbs = {}
+_worker_opening_books = {}
+
+
+def get_executor():
+    #Return the shared process pool (MAX_WORKERS processes)
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                            mp_context=multiprocessing.get_context(POOL_START_METHOD))
+        return _executor
+
+
+def run_tasks(fn, tasks, workers):
+    #Run fn(task) for each task on the shared pool, at most workers at a time.
+    #Yields the futures in task order, each once submitted; a task's exception
+    #is raised by its future's result().
+    executor = get_executor()
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= workers:
+            yield pending.popleft()
+        pending.append(executor.submit(fn, task))
+    while pending:
+        yield pending.popleft()
+
+
+def shutdown_executors():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def worker_endgame_db(path):
+    #Endgame database at path opened once per worker process (None for no path)
+    if not path:
+        return None
+    endgame_db = _worker_endgame_dbs.get(path)
+    if endgame_db is None:
+        endgame_db = _worker_endgame_dbs[path] = EndgameDatabase(path)
+    return endgame_db
+
+
+def _search_root_move(task):
+    #Process-pool worker: search one root move in a process-local Play.
+    #Returns (value, nodes, PVS re-searches, leaf evaluations, cutoffs, deepest ply).
+    pits, player_side, player, pit, depth, alpha, beta, heuristic_version, settings = task
+    game = Game(player_side)
+    game.state = MancalaBoard.from_pits(pits)
+    
+    endgame_db = worker_endgame_db(settings.pop('endgame_db_path'))
+    
+    play = Play(game, depth=depth, endgame_db=endgame_db, **settings)
+    play._start_search()
+    value = play._search_root_child(game, player, pit, depth, alpha, beta, heuristic_version)
+    return value, play.nodes, play.pvs_researches, play.leaf_evals, play.cutoffs, play.max_ply
+
+
+def _search_position(task):
+    #Process-pool worker: choose the move of a whole position in a process-local
+    #Play, as Play.choose_move does (with its own transposition table).
+    #Returns ((best_value, best_pit), search_stats()).
+    from .opening_book import OpeningBook
+    
+    pits, player_side, player, heuristic_version, time_ms, carried_pv, guess, settings = task
+    game = Game(player_side)
+    game.state = MancalaBoard.from_pits(pits)
+    
+    settings = dict(settings)
+    endgame_db = worker_endgame_db(settings.pop('endgame_db_path'))
+    book_path = settings.pop('opening_book_path')
+    opening_book = None
+    if book_path:
+        opening_book = _worker_opening_books.get(book_path)
+        if opening_book is None:
+            opening_book = _worker_opening_books[book_path] = OpeningBook(book_path)
+    
+    play = Play(game, endgame_db=endgame_db, opening_book=opening_book, **settings)
+    play._carried_pv = carried_pv
+    if guess is not None:
+        play._previous_values[heuristic_version] = guess
+    result = play._choose_move(player, heuristic_version, time_ms or play.time_ms)
+    return result, play.search_stats()
+
+
+def choose_moves(requests, workers):
+    #Choose the moves of several games at once, one game per worker process.
+    #requests are (play, player, heuristic_version, time_ms) tuples with the
+    #arguments of play.choose_move; every play must be on its own game. The
+    #searches use their own tables (not the plays' search caches), but each
+    #play records the principal variation found as after choose_move. No move
+    #is played.
+    
+    #Returns:list with, per request, ((best_value, best_pit), search stats) or
+    #the exception its search raised
+    tasks = []
+    for play, player, heuristic_version, time_ms in requests:
+        player_side = play._player_side(play.game, player)
+        if play.search_cache is not None:
+            play._carried_pv = play.search_cache.continuation(play.game.state, player_side)
+        play._finish_pondering(player_side, heuristic_version)  # a hit only hands over its pv
+        tasks.append(play._position_task(player, heuristic_version, time_ms))
+        play._carried_pv = []
+    
+    results = []
+    for (play, player, heuristic_version, _), future in zip(requests, run_tasks(_search_position, tasks, workers)):
+        try:
+            result, stats = future.result()
+        except Exception as e:
+            results.append(e)
+            continue
+        play._reset_counters()
+        play.nodes = stats['nodes']
+        play.leaf_evals = stats['leafEvals']
+        play.cutoffs = stats['cutoffs']
+        play.max_ply = stats['maxPly']
+        play.search_ms = stats['ms']
+        play.completed_depth = stats['depth']
+        play.pv = stats['pv']
+        play.endgame_hits = stats['endgameHits']
+        play.book_hit = stats['bookHit']
+        play.pvs_researches = stats['pvsResearches']
+        play.aspiration_researches = stats['aspirationResearches']
+        play._record_choice(play._player_side(play.game, player), heuristic_version, result)
+        
+        if play.search_cache is not None:
+            stats['searchCache'] = play.search_cache.stats()
+        if play.ponder_stats is not None:
+            stats['ponder'] = play.ponder_stats
+        results.append((result, stats))
+    return results
+
+
 class Play:
-    def __init__(self, game, depth=6):
+    def __init__(self, game, depth=6, time_ms=None, tt_memory_mb=16, tt_replacement='depth',
+                 max_replay_chain=6, move_ordering=True, workers=1, endgame_db=None,
+                 opening_book=None, pvs=False, aspiration_window=None, search_cache=None,
+                 ponder=False):
         self.game = game
         self.depth = depth
+        
+        # Pondering: after moving against a human, search the position after
+        # their expected reply in a background thread (see start_pondering)
+        self.ponder = ponder
+        self._ponder = None
+        self.ponder_stats = None
+        self._last_line = []
+        
+        # Optional SearchCache: transposition table and principal variation
+        # kept between the moves of a game (used instead of a table per search)
+        self.search_cache = search_cache
+        self._carried_pv = []
+        
+        # Principal variation search: moves after the first are searched with a
+        # null window and only searched again with the full window if they beat it
+        self.pvs = pvs
+        
+        # Aspiration windows: the root is searched in (guess - w, guess + w)
+        # around the previous iteration's (or previous move's) value, and
+        # searched again with a wider window if the value falls outside.
+        # None searches the root with the full window.
+        if aspiration_window is not None and not (
+                isinstance(aspiration_window, (int, float)) and not isinstance(aspiration_window, bool)
+                and aspiration_window > 0):
+            raise ValueError("aspiration_window must be a positive number")
+        self.aspiration_window = aspiration_window
+        self._previous_values = {}
+        
+        # Optional OpeningBook of moves searched offline for the first plies
+        self.opening_book = opening_book
+        
+        # Optional EndgameDatabase: exact values once few seeds are left in the pits
+        self.endgame_db = endgame_db
+        
+        # Worker processes for fixed-depth searches (1 = search serially)
+        if not (isinstance(workers, int) and not isinstance(workers, bool) and 1 <= workers <= MAX_WORKERS):
+            raise ValueError(f"workers must be between 1 and {MAX_WORKERS}")
+        self.workers = workers
+        
+        # Order moves (extra turns, captures, killers, history) before searching them
+        self.move_ordering = move_ordering
+        
+        # Extra-turn moves played in a row before the search charges them a ply
+        if not 0 <= max_replay_chain <= MAX_REPLAY_CHAIN:
+            raise ValueError(f"max_replay_chain must be between 0 and {MAX_REPLAY_CHAIN}")
+        self.max_replay_chain = max_replay_chain
+        
+        # Time budget per move in milliseconds; when set, the search deepens
+        # iteratively until the deadline instead of using the fixed depth
+        self.time_ms = time_ms
+        
+        # Transposition table (tt_memory_mb=0 disables it)
+        self.tt_memory_mb = tt_memory_mb
+        self.tt_replacement = tt_replacement
+        self.tt = None
+        if tt_memory_mb and search_cache is None:
+            self.tt = TranspositionTable(tt_memory_mb, tt_replacement)
+        
+        # Counters and principal variation of the last search
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.cutoffs = 0  # alpha-beta cutoffs (transposition table cutoffs are counted by the table)
+        self.max_ply = 0  # deepest leaf reached, extra turns included
+        self.search_ms = 0.0
+        self.endgame_hits = 0
+        self.book_hit = False
+        self.completed_depth = 0
+        self.pv = []
+        self.pvs_researches = 0
+        self.aspiration_researches = 0
+        self.best_so_far = None  # (value, pit) of the deepest completed iteration
+        
+        # Called with search_progress() after each completed iteration
+        self.on_progress = None
+        
+        self.deadline = None
+        self.stop_requested = False  # set by another thread to end a timed search early
+        self._search_started = None
+        self._pv_table = {}
+        self._follow_pv = False
+        self._depth_limited = False
+        self._killers = {}
+        self._history = {}
     
     def humanTurn(self):
         #Allow the human player to take their turn.
@@ -39,6 +310,7 @@ class Play:
         
         # Execute the move and check if last seed lands in store
         replay = self._execute_move_with_replay_check(human_side, pit)
+        self.opponent_moved()
         
         print(f"\nYou played pit {pit}")
         print(self.game.state)
@@ -68,7 +340,10 @@ class Play:
             print("No possible moves! Skipping turn...")
             return False
         
-        print(f"Thinking... (depth={self.depth})")
+        if self.time_ms:
+            print(f"Thinking... (time budget={self.time_ms}ms)")
+        else:
+            print(f"Thinking... (depth={self.depth})")
         
         # Determine MAX or MIN based on computer name
         if computer_name in ['COMPUTER', 'COMPUTER1']:
@@ -77,14 +352,7 @@ class Play:
             player_type = -1  # MIN
         
         # Use Minimax to find best move
-        best_value, best_pit = self.MinimaxAlphaBetaPruning(
-            self.game, 
-            player_type, 
-            self.depth, 
-            float('-inf'), 
-            float('inf'),
-            heuristic_version
-        )
+        best_value, best_pit = self.choose_move(player_type, heuristic_version)
         
         print(f"{computer_name} chooses pit {best_pit} (value: {best_value})")
         
@@ -97,110 +365,620 @@ class Play:
             print(f"\n🎉 {computer_name} gets another turn!")
             return True
         
+        # Think on the human's time
+        if 'HUMAN' in self.game.playerSide:
+            self.start_pondering(player_type, heuristic_version)
+        
         return False
     
     def _execute_move_with_replay_check(self, player, pit):
         #Execute a move and check if the last seed lands in the player's store.
 
         #True if last seed lands in player's store (replay), False otherwise
-        # Determine player's store
-        my_store = 1 if player == 'player1' else 2
-        opponent_store = 2 if player == 'player1' else 1
+        return self.game.state.doMove(player, pit)
+    
+    def choose_move(self, player, heuristic_version=1, time_ms=None, max_depth=None):
+        #Search the current game position for the given player (1 MAX, -1 MIN).
+        #The endgame database and the opening book are tried first. Otherwise
+        #uses iterative deepening when a time budget is set (time_ms or
+        #self.time_ms), stopping at max_depth if given, or a fixed-depth
+        #search to self.depth.
         
-        # Get number of seeds
-        seeds = self.game.state.board[pit]
+        #Returns:(best_value, best_pit) tuple
+        state = self.game.state
+        player_side = self._player_side(self.game, player)
+        time_ms = time_ms or self.time_ms
         
-        # Simulate the move to find where last seed lands
-        current_position = pit
-        remaining_seeds = seeds
+        cache = self.search_cache
+        if cache is not None:
+            # Continue along the previous move's principal variation
+            self._carried_pv = cache.continuation(state, player_side)
+        pondered = self._finish_pondering(player_side, heuristic_version)
         
-        while remaining_seeds > 0:
-            current_position = self.game.state.next_pit[current_position]
-            
-            # Skip opponent's store
-            if current_position == opponent_store:
-                current_position = self.game.state.next_pit[current_position]
+        result = self._choose_move(player, heuristic_version, time_ms, pondered, max_depth)
+        self._carried_pv = []
+        self._record_choice(player_side, heuristic_version, result)
+        return result
+    
+    def take_known_move(self, player, heuristic_version, result, depth, pv):
+        #Adopt, instead of choose_move, the result of an earlier search of the
+        #current position (e.g. from the server's move cache): nothing is
+        #searched, and search_stats() reports the depth and pv given
+        self.stop_pondering()
+        self.ponder_stats = None
+        self._reset_counters()
+        self.completed_depth = depth
+        self.pv = list(pv)
+        self._record_choice(self._player_side(self.game, player), heuristic_version, result)
+        return result
+    
+    def _record_choice(self, player_side, heuristic_version, result):
+        #Remember the principal variation of the search just made from the
+        #current position, for the next move and for pondering
+        state = self.game.state
+        self._last_line = pv_line(state, player_side, self.pv)
+        cache = self.search_cache
+        if cache is not None:
+            cache.searches += 1
+            cache.remember_pv(state, player_side, self.pv)
+        
+        # Center of the next move's aspiration window
+        self._previous_values[heuristic_version] = result[0]
+    
+    def search_settings(self):
+        #Options besides the depth and time limits that can change the move a
+        #search picks (the number of workers does not)
+        return {
+            'tt_memory_mb': self.tt_memory_mb,
+            'tt_replacement': self.tt_replacement,
+            'max_replay_chain': self.max_replay_chain,
+            'move_ordering': self.move_ordering,
+            'pvs': self.pvs,
+            'aspiration_window': self.aspiration_window,
+            'endgame_db_path': self.endgame_db.path if self.endgame_db else None,
+            'opening_book_path': self.opening_book.path if self.opening_book else None,
+        }
+    
+    def _position_task(self, player, heuristic_version, time_ms):
+        #Picklable arguments of _search_position for the current position
+        settings = dict(self.search_settings(), depth=self.depth, time_ms=self.time_ms)
+        return (
+            tuple(self.game.state.pits), dict(self.game.playerSide), player, heuristic_version,
+            time_ms, list(self._carried_pv), self._previous_values.get(heuristic_version), settings
+        )
+    
+    def _choose_move(self, player, heuristic_version, time_ms, pondered=None, max_depth=None):
+        solved = self._probe_endgame_root(player, heuristic_version)
+        if solved is not None:
+            return solved
+        
+        # A book move must be searched at least as deep as the search it replaces
+        min_book_depth = max_depth or (0 if time_ms else self.depth)
+        booked = self._probe_opening_book(player, heuristic_version, min_book_depth)
+        if booked is not None:
+            return booked
+        
+        if time_ms:
+            # Time spent pondering this position counts towards the budget
+            if pondered is not None:
+                time_ms -= pondered.elapsed_ms()
+                if time_ms <= 0 or (max_depth and pondered.play.completed_depth >= max_depth):
+                    return self._use_pondered(pondered)
+            result = self.iterative_deepening(self.game, player, time_ms, heuristic_version,
+                                              max_depth or MAX_SEARCH_DEPTH)
+            if pondered is not None and pondered.play.completed_depth > self.completed_depth:
+                return self._use_pondered(pondered)
+            return result
+        
+        if pondered is not None and pondered.play.completed_depth >= self.depth:
+            return self._use_pondered(pondered)
+        
+        if self.workers > 1:
+            return self.parallel_search(player, self.depth, heuristic_version)
+        
+        guess = self._previous_values.get(heuristic_version)
+        if self.aspiration_window and guess is not None:
+            self._start_search()
+            result = self._aspiration_search(self.game, player, self.depth, heuristic_version, guess)
+            self.completed_depth = self.depth
+            self.pv = self._pv_table.get(0, [])
+            self._finish_search()
+            return result
+        
+        return self.MinimaxAlphaBetaPruning(
+            self.game,
+            player,
+            self.depth,
+            float('-inf'),
+            float('inf'),
+            heuristic_version
+        )
+    
+    def start_pondering(self, player, heuristic_version=1):
+        #Start searching, in a background thread, the position after the
+        #opponent's expected reply. player is this engine (1 MAX, -1 MIN) and
+        #the opponent must be to move. Does nothing unless pondering is on.
+        
+        #Returns:True if a background search was started
+        from .ponder import Ponderer, predict_line
+        
+        self.stop_pondering()
+        if not self.ponder:
+            return False
+        
+        predicted = predict_line(self, player, heuristic_version)
+        if predicted is None:
+            return False
+        board, line_keys = predicted
+        
+        game = Game(dict(self.game.playerSide))
+        game.state = board
+        searcher = Play(
+            game, depth=self.depth, tt_memory_mb=self.tt_memory_mb, tt_replacement=self.tt_replacement,
+            max_replay_chain=self.max_replay_chain, move_ordering=self.move_ordering,
+            endgame_db=self.endgame_db, pvs=self.pvs, aspiration_window=self.aspiration_window,
+            search_cache=self.search_cache
+        )
+        searcher._previous_values = dict(self._previous_values)
+        searcher._carried_pv = self.last_continuation(board, self._player_side(game, player))
+        
+        max_depth = MAX_SEARCH_DEPTH if self.time_ms else self.depth
+        ponder = Ponderer(searcher, game, player, heuristic_version, line_keys, max_depth)
+        if not ponder.start():
+            return False  # every ponderer slot of the process is taken
+        self._ponder = ponder
+        return True
+    
+    def stop_pondering(self):
+        #Cancel the background search, if any
+        if self._ponder is not None:
+            self._ponder.stop()
+            self._ponder = None
+    
+    def opponent_moved(self):
+        #Call after the opponent's move: cancels pondering if the game left
+        #the predicted line
+        ponder = self._ponder
+        if ponder is None:
+            return
+        state = self.game.state
+        if not (ponder.on_line(state.position_key('player1')) or ponder.on_line(state.position_key('player2'))):
+            self.stop_pondering()
+    
+    def last_continuation(self, board, player_side):
+        #Rest of the last search's principal variation from this position, or []
+        return line_continuation(self._last_line, board, player_side)
+    
+    def _finish_pondering(self, player_side, heuristic_version):
+        #Stop the background search. Returns the Ponderer if it searched the
+        #current position (its principal variation is then followed first),
+        #otherwise None.
+        ponder = self._ponder
+        if ponder is None:
+            self.ponder_stats = None
+            return None
+        self.stop_pondering()
+        
+        hit = (ponder.result is not None and ponder.heuristic_version == heuristic_version
+               and ponder.key == self.game.state.position_key(player_side))
+        self.ponder_stats = dict(ponder.stats(), hit=hit)
+        if not hit:
+            return None
+        
+        self._carried_pv = ponder.play.pv
+        return ponder
+    
+    def _use_pondered(self, ponder):
+        #Take over the result of a background search of the current position
+        searcher = ponder.play
+        self._reset_counters()
+        self.nodes = searcher.nodes
+        self.leaf_evals = searcher.leaf_evals
+        self.cutoffs = searcher.cutoffs
+        self.max_ply = searcher.max_ply
+        self.search_ms = ponder.elapsed_ms()
+        self.completed_depth = searcher.completed_depth
+        self.pv = searcher.pv
+        self.pvs_researches = searcher.pvs_researches
+        self.aspiration_researches = searcher.aspiration_researches
+        return ponder.result
+    
+    def iterative_deepening(self, game, player, time_ms, heuristic_version=1, max_depth=MAX_SEARCH_DEPTH):
+        #Search depth 1, 2, 3, ... until the time budget runs out and return the
+        #result of the deepest completed iteration. Each iteration tries the
+        #previous iteration's principal variation first.
+        
+        #Returns:(best_value, best_pit) tuple
+        self._start_search()
+        self.deadline = time.perf_counter() + time_ms / 1000
+        snapshot = game.state.snapshot()
+        result = None
+        guess = self._previous_values.get(heuristic_version)
+        
+        try:
+            for depth in range(1, max_depth + 1):
+                self._depth_limited = False
+                
+                try:
+                    result = self._aspiration_search(game, player, depth, heuristic_version, guess)
+                    guess = result[0]
+                except SearchTimeout:
+                    # Abandon the unfinished iteration and put the board back
+                    game.state.restore(snapshot)
+                    break
+                
+                self.completed_depth = depth
+                self.pv = self._pv_table.get(0, [])
+                self.best_so_far = result
+                if self.on_progress is not None:
+                    self.on_progress(self.search_progress())
+                
+                # Every line reached the end of the game: deeper iterations change nothing
+                if not self._depth_limited:
+                    break
+        finally:
+            self.deadline = None
+        
+        if result is None:
+            # Not even depth 1 finished in time; it is cheap, so finish it anyway
+            self._follow_pv = False
+            result = self._alphabeta(game, player, 1, float('-inf'), float('inf'), heuristic_version)
+            self.completed_depth = 1
+            self.pv = self._pv_table.get(0, [])
+        
+        self._finish_search()
+        return result
+    
+    def _aspiration_search(self, game, player, depth, heuristic_version, guess):
+        #Root search in an aspiration window around guess. A value on or outside
+        #the window is only a bound, so the search is repeated with the failing
+        #side moved out by twice the width each time. Full window without a
+        #guess or with aspiration windows off.
+        
+        #Returns:(best_value, best_pit) tuple
+        width = self.aspiration_window
+        if not width or guess is None:
+            alpha, beta = float('-inf'), float('inf')
+        else:
+            alpha, beta = guess - width, guess + width
+        
+        while True:
+            # Every attempt tries the previous iteration's principal variation first
+            self._follow_pv = True
+            result = self._alphabeta(game, player, depth, alpha, beta, heuristic_version)
+            value = result[0]
+            if alpha < value < beta:
+                return result
             
-            remaining_seeds -= 1
+            self.aspiration_researches += 1
+            width *= 2
+            if value <= alpha:
+                alpha = value - width
+            else:
+                beta = value + width
+    
+    def _probe_endgame_root(self, player, heuristic_version):
+        #Perfect move from the endgame database, or None if the position is not in it
+        if self.endgame_db is None:
+            return None
+        
+        game = self.game
+        solved = self.endgame_db.best_move(game.state, self._player_side(game, player))
+        if solved is None:
+            return None
+        
+        self._reset_counters()
+        self.endgame_hits = 1
+        final_difference, pit = solved
+        self.pv = [pit]
+        return self._exact_value(game, final_difference, heuristic_version), pit
+    
+    def _probe_opening_book(self, player, heuristic_version, min_depth):
+        #Book move for the current position, or None if there is none. The book
+        #must use the same heuristic and be searched at least min_depth deep.
+        book = self.opening_book
+        if book is None or book.heuristic_version != heuristic_version:
+            return None
+        
+        game = self.game
+        player_side = self._player_side(game, player)
+        entry = book.lookup(game.state, player_side)
+        if entry is None:
+            return None
         
-        # Check if last position is player's store
-        lands_in_store = (current_position == my_store)
+        value, pit, depth = entry
+        if depth < min_depth or pit not in game.state.possibleMoves(player_side):
+            return None
         
-        # Now execute the actual move
-        self.game.state.doMove(player, pit)
+        self._reset_counters()
+        self.book_hit = True
+        self.completed_depth = depth
+        self.pv = [pit]
+        # Book values are for the side to move
+        return value * player, pit
+    
+    def _exact_value(self, game, final_difference, heuristic_version):
+        #Score of a known game result (final store difference player1 - player2),
+        #on the same scale as the evaluation of a finished game
+        if self._player_side(game, 1) != 'player1':
+            final_difference = -final_difference
+        if heuristic_version == 1:
+            return final_difference
+        return final_difference * 10
+    
+    def _reset_counters(self):
+        #Reset the per-search counters reported by search_stats
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.cutoffs = 0
+        self.max_ply = 0
+        self.search_ms = 0.0
+        self.endgame_hits = 0
+        self.book_hit = False
+        self.completed_depth = 0
+        self.pv = []
+        self.pvs_researches = 0
+        self.aspiration_researches = 0
+        self.best_so_far = None
+        if self.tt is not None:
+            self.tt.reset_stats()
+    
+    def _start_search(self):
+        #Reset per-search counters and tables. A search cache keeps its table
+        #and hands over the rest of the previous principal variation.
+        cache = self.search_cache
+        if cache is not None:
+            self.tt = cache.tt  # None once the cache has been evicted
+        
+        self._reset_counters()
+        self._search_started = time.perf_counter()
+        self._pv_table = {}
+        self._killers = {}
+        self._history = {'player1': {}, 'player2': {}}
         
-        return lands_in_store
+        self.pv = self._carried_pv
+        self._follow_pv = bool(self.pv)
+        
+        if self.tt is not None:
+            if cache is not None:
+                self.tt.new_search()
+            else:
+                self.tt.clear()
     
     def MinimaxAlphaBetaPruning(self, game, player, depth, alpha, beta, heuristic_version=1):
         #Minimax algorithm with Alpha-Beta Pruning.
        
         #Returns:(best_value, best_pit) tuple
+        #The search plays and takes back moves in place on game.state, so the
+        #board is left unchanged when the call returns.
+        self._start_search()
+        
+        result = self._alphabeta(game, player, depth, alpha, beta, heuristic_version)
+        
+        self.completed_depth = depth
+        self.pv = self._pv_table.get(0, [])
+        self._finish_search()
+        return result
+    
+    def _finish_search(self):
+        #Record the wall time of the search started by _start_search
+        self.search_ms = (time.perf_counter() - self._search_started) * 1000
+    
+    def parallel_search(self, player, depth, heuristic_version=1, workers=None):
+        #Root-parallel search of the current game position across worker processes.
+        #The first (best-ordered) root move is searched here to get a bound, as
+        #in Young Brothers Wait; the remaining root moves are then searched in
+        #parallel with that bound. Returns the same move as the serial search.
+        
+        #Returns:(best_value, best_pit) tuple
+        workers = workers or self.workers
+        game = self.game
+        state = game.state
+        player_side = self._player_side(game, player)
+        
+        self._start_search()
+        moves = state.possibleMoves(player_side)
+        if not moves or state.is_terminal():
+            return self._alphabeta(game, player, depth, float('-inf'), float('inf'), heuristic_version)
+        if self.move_ordering:
+            self._order_moves(state, player_side, moves, 0)
+        
+        # As in the serial search, the carried principal variation's move goes
+        # first; its continuation is only followed below that move
+        if self._follow_pv and self.pv[0] in moves:
+            moves.remove(self.pv[0])
+            moves.insert(0, self.pv[0])
+        
+        # Eldest brother: searched serially with the full window
+        best_pit = moves[0]
+        self._follow_pv = self._follow_pv and self.pv[0] == best_pit
+        best_value = self._search_root_child(
+            game, player, best_pit, depth, float('-inf'), float('inf'), heuristic_version
+        )
+        nodes = self.nodes
+        
+        # Younger brothers only matter if they beat the eldest
+        if player == 1:
+            alpha, beta = best_value, float('inf')
+        else:
+            alpha, beta = float('-inf'), best_value
+        
+        settings = {
+            'tt_memory_mb': self.tt_memory_mb,
+            'tt_replacement': self.tt_replacement,
+            'max_replay_chain': self.max_replay_chain,
+            'move_ordering': self.move_ordering,
+            'pvs': self.pvs,
+            'endgame_db_path': self.endgame_db.path if self.endgame_db else None,
+        }
+        pits = tuple(state.pits)
+        tasks = [
+            (pits, game.playerSide, player, pit, depth, alpha, beta, heuristic_version, settings)
+            for pit in moves[1:]
+        ]
+        results = [future.result() for future in run_tasks(_search_root_move, tasks, workers)]
+        
+        # Same tie-breaking as the serial search: first move in order wins ties
+        for pit, (value, child_nodes, researches, leaf_evals, cutoffs, max_ply) in zip(moves[1:], results):
+            nodes += child_nodes
+            self.pvs_researches += researches
+            self.leaf_evals += leaf_evals
+            self.cutoffs += cutoffs
+            self.max_ply = max(self.max_ply, max_ply)
+            if (value > best_value) if player == 1 else (value < best_value):
+                best_value = value
+                best_pit = pit
+        
+        self.nodes = nodes
+        self.completed_depth = depth
+        self.pv = [best_pit]
+        self._finish_search()
+        return best_value, best_pit
+    
+    def _search_root_child(self, game, player, pit, depth, alpha, beta, heuristic_version):
+        #Value of playing pit at the root (searched to the given root depth)
+        state = game.state
+        record = state.do_move(self._player_side(game, player), pit)
+        next_player, next_depth, next_chain = self._next_turn(state, record, player, depth, 0)
+        value, _ = self._alphabeta(
+            game, next_player, next_depth, alpha, beta, heuristic_version, 1, next_chain
+        )
+        state.undo_move(record)
+        return value
+    
+    def _alphabeta(self, game, player, depth, alpha, beta, heuristic_version, ply=0, chain=0):
+        #Recursive part of MinimaxAlphaBetaPruning.
+        #ply is the distance from the root, used for the principal variation;
+        #chain is the number of extra-turn moves played in a row to reach this node.
+        self.nodes += 1
+        if (self.deadline is not None and not self.nodes & DEADLINE_CHECK_MASK
+                and (self.stop_requested or time.perf_counter() >= self.deadline)):
+            raise SearchTimeout()
+        
+        pv_table = self._pv_table
+        pv_table[ply] = []
+        
         # Terminal condition: game over or depth limit reached
-        if game.gameOver() or depth == 0:
-            if heuristic_version == 1:
-                best_value = game.evaluate()
-            else:
-                best_value = self._advanced_heuristic(game)
-            return best_value, None
+        state = game.state
+        if depth == 0 or state.is_terminal():
+            if depth == 0:
+                self._depth_limited = True
+            self.leaf_evals += 1
+            if ply > self.max_ply:
+                self.max_ply = ply
+            return self._evaluate_leaf(game, heuristic_version), None
         
-        # Determine which player side to use
-        if player == 1:  # MAX
-            if 'COMPUTER' in game.playerSide:
-                player_key = 'COMPUTER'
-            elif 'COMPUTER1' in game.playerSide:
-                player_key = 'COMPUTER1'
-            else:
-                # Fallback: use first key in playerSide
-                player_key = list(game.playerSide.keys())[0]
-        else:  # MIN
-            if 'HUMAN' in game.playerSide:
-                player_key = 'HUMAN'
-            elif 'COMPUTER2' in game.playerSide:
-                player_key = 'COMPUTER2'
-            else:
-                # Fallback: use second key in playerSide
-                player_key = list(game.playerSide.keys())[1]
+        player_side = self._player_side(game, player)
         
-        player_side = game.playerSide[player_key]
-        possible_moves = game.state.possibleMoves(player_side)
+        # Endgame database: the exact value, no search needed (the root still
+        # searches so that it returns a move)
+        if ply and self.endgame_db is not None and self.endgame_db.covers(state):
+            self.endgame_hits += 1
+            final_difference = self.endgame_db.final_difference(state, player_side)
+            return self._exact_value(game, final_difference, heuristic_version), None
         
-        # No possible moves
-        if not possible_moves:
-            if heuristic_version == 1:
-                best_value = game.evaluate()
+        # Not terminal, so the side to move has a move
+        possible_moves = state.possibleMoves(player_side)
+        
+        # Transposition table: reuse a result searched at least as deep,
+        # otherwise try its best move first
+        tt = self.tt
+        tt_move = None
+        if tt is not None:
+            key = state.position_key(player_side) ^ REPLAY_CHAIN_KEYS[chain]
+            if heuristic_version != 1:
+                key ^= ADVANCED_HEURISTIC_KEY
+            entry = tt.probe(key)
+            if entry is not None and entry[4] in possible_moves:
+                _, entry_depth, flag, value, tt_move, _ = entry
+                if entry_depth >= depth:
+                    # The stored search may have stopped at its depth limit
+                    # (possibly in an earlier search sharing the table)
+                    self._depth_limited = True
+                    if flag == EXACT:
+                        tt.cutoffs += 1
+                        pv_table[ply] = [tt_move]
+                        return value, tt_move
+                    if flag == LOWER and value > alpha:
+                        alpha = value
+                    elif flag == UPPER and value < beta:
+                        beta = value
+                    if alpha >= beta:
+                        tt.cutoffs += 1
+                        pv_table[ply] = [tt_move]
+                        return value, tt_move
+        
+        if self.move_ordering and len(possible_moves) > 1:
+            self._order_moves(state, player_side, possible_moves, ply)
+        
+        if tt_move is not None:
+            possible_moves.remove(tt_move)
+            possible_moves.insert(0, tt_move)
+        
+        # While still on the previous iteration's principal variation, search its move first
+        if self._follow_pv:
+            previous_pv = self.pv
+            if ply < len(previous_pv) and previous_pv[ply] in possible_moves:
+                pv_move = previous_pv[ply]
+                possible_moves.remove(pv_move)
+                possible_moves.insert(0, pv_move)
             else:
-                best_value = self._advanced_heuristic(game)
-            return best_value, None
+                self._follow_pv = False
+        
+        # Window actually searched, to classify the result for the table
+        alpha_searched, beta_searched = alpha, beta
         
-        best_pit = possible_moves[0]  # Default
+        best_pit = first_pit = possible_moves[0]  # Default
+        scout = self.pvs and len(possible_moves) > 1
         
         if player == 1:  # MAX player
             best_value = float('-inf')
             
             for pit in possible_moves:
-                # Create a copy of the game
-                child_game = game.copy()
+                # Execute the move in place
+                record = state.do_move(player_side, pit)
+                next_player, next_depth, next_chain = self._next_turn(
+                    state, record, player, depth, chain
+                )
                 
-                # Execute the move
-                child_game.state.doMove(player_side, pit)
+                # Recursive call. With PVS, later moves first only have to
+                # show they cannot beat alpha (null window)
+                if scout and pit != first_pit:
+                    value, _ = self._alphabeta(
+                        game, next_player, next_depth, alpha, alpha + NULL_WINDOW,
+                        heuristic_version, ply + 1, next_chain
+                    )
+                    if alpha < value < beta:
+                        self.pvs_researches += 1
+                        value, _ = self._alphabeta(
+                            game, next_player, next_depth, alpha, beta,
+                            heuristic_version, ply + 1, next_chain
+                        )
+                else:
+                    value, _ = self._alphabeta(
+                        game, 
+                        next_player, 
+                        next_depth, 
+                        alpha, 
+                        beta,
+                        heuristic_version,
+                        ply + 1,
+                        next_chain
+                    )
                 
-                # Recursive call
-                value, _ = self.MinimaxAlphaBetaPruning(
-                    child_game, 
-                    -player, 
-                    depth - 1, 
-                    alpha, 
-                    beta,
-                    heuristic_version
-                )
+                # Take the move back
+                state.undo_move(record)
+                self._follow_pv = False
                 
                 # Update best value
                 if value > best_value:
                     best_value = value
                     best_pit = pit
+                    pv_table[ply] = [pit] + pv_table[ply + 1]
                 
                 # Alpha-Beta pruning
                 if best_value >= beta:
+                    self._record_cutoff(player_side, pit, depth, ply)
                     break
                 
                 if best_value > alpha:
@@ -210,36 +988,230 @@ class Play:
             best_value = float('inf')
             
             for pit in possible_moves:
-                # Create a copy of the game
-                child_game = game.copy()
+                # Execute the move in place
+                record = state.do_move(player_side, pit)
+                next_player, next_depth, next_chain = self._next_turn(
+                    state, record, player, depth, chain
+                )
                 
-                # Execute the move
-                child_game.state.doMove(player_side, pit)
+                # Recursive call. With PVS, later moves first only have to
+                # show they cannot beat beta (null window)
+                if scout and pit != first_pit:
+                    value, _ = self._alphabeta(
+                        game, next_player, next_depth, beta - NULL_WINDOW, beta,
+                        heuristic_version, ply + 1, next_chain
+                    )
+                    if alpha < value < beta:
+                        self.pvs_researches += 1
+                        value, _ = self._alphabeta(
+                            game, next_player, next_depth, alpha, beta,
+                            heuristic_version, ply + 1, next_chain
+                        )
+                else:
+                    value, _ = self._alphabeta(
+                        game, 
+                        next_player, 
+                        next_depth, 
+                        alpha, 
+                        beta,
+                        heuristic_version,
+                        ply + 1,
+                        next_chain
+                    )
                 
-                # Recursive call
-                value, _ = self.MinimaxAlphaBetaPruning(
-                    child_game, 
-                    -player, 
-                    depth - 1, 
-                    alpha, 
-                    beta,
-                    heuristic_version
-                )
+                # Take the move back
+                state.undo_move(record)
+                self._follow_pv = False
                 
                 # Update best value
                 if value < best_value:
                     best_value = value
                     best_pit = pit
+                    pv_table[ply] = [pit] + pv_table[ply + 1]
                 
                 # Alpha-Beta pruning
                 if best_value <= alpha:
+                    self._record_cutoff(player_side, pit, depth, ply)
                     break
                 
                 if best_value < beta:
                     beta = best_value
         
+        if tt is not None:
+            if best_value <= alpha_searched:
+                flag = UPPER
+            elif best_value >= beta_searched:
+                flag = LOWER
+            else:
+                flag = EXACT
+            tt.store(key, depth, flag, best_value, best_pit)
+        
         return best_value, best_pit
     
+    def _order_moves(self, state, player_side, moves, ply):
+        #Sort moves in place, most promising first: moves ending in the own
+        #store, then captures (largest first), then this ply's killer moves,
+        #then by history-heuristic score.
+        killers = self._killers.get(ply, ())
+        history = self._history[player_side]
+        
+        def score(pit):
+            lands_in_store, captured = state.classify_move(player_side, pit)
+            if lands_in_store:
+                return ORDER_REPLAY
+            if captured:
+                return ORDER_CAPTURE + captured
+            if pit in killers:
+                return ORDER_KILLER - killers.index(pit)
+            return history.get(pit, 0)
+        
+        moves.sort(key=score, reverse=True)
+    
+    def _record_cutoff(self, player_side, pit, depth, ply):
+        #Remember a move that caused a cutoff: as a killer for this ply (two
+        #slots, most recent first) and in the history table, weighted by depth.
+        self.cutoffs += 1
+        killers = self._killers.get(ply)
+        if killers is None:
+            self._killers[ply] = [pit]
+        elif killers[0] != pit:
+            self._killers[ply] = [pit, killers[0]]
+        
+        history = self._history[player_side]
+        history[pit] = history.get(pit, 0) + depth * depth
+    
+    def compare_move_ordering(self, player, depth, heuristic_version=1):
+        #Search the current position to a fixed depth with and without move
+        #ordering and report the node counts of both searches.
+        saved = self.move_ordering
+        nodes = {}
+        try:
+            for enabled in (True, False):
+                self.move_ordering = enabled
+                self.MinimaxAlphaBetaPruning(
+                    self.game, player, depth, float('-inf'), float('inf'), heuristic_version
+                )
+                nodes[enabled] = self.nodes
+        finally:
+            self.move_ordering = saved
+        
+        return {
+            'depth': depth,
+            'nodesWithOrdering': nodes[True],
+            'nodesWithoutOrdering': nodes[False],
+            'reduction': 1 - nodes[True] / nodes[False],
+        }
+    
+    def score_moves(self, player, depth, heuristic_version=1):
+        #Value of every legal move of the current position, each searched with
+        #the full window to the given root depth (a pruned root search only
+        #proves bounds for the moves it does not play). Reuses the table and
+        #move ordering of the last search, and adds to its node count.
+        
+        #Returns:dict of pit -> value
+        game = self.game
+        self._follow_pv = False
+        moves = game.state.possibleMoves(self._player_side(game, player))
+        return {
+            pit: self._search_root_child(game, player, pit, depth, float('-inf'), float('inf'), heuristic_version)
+            for pit in moves
+        }
+
+    def frontier_search(self, player, depth, heuristic_version=1):
+        #Full-width search with NumPy: the tree is expanded one level at a time
+        #and all leaves are scored in one batch (see batch_eval). Extra turns
+        #count as a ply. Needs NumPy, imported only when used.
+
+        #Returns:(best value, best pit) like choose_move
+        from .batch_eval import frontier_minimax
+
+        game = self.game
+        value, pit, _ = frontier_minimax(
+            game.state, self._player_side(game, player), depth,
+            self._player_side(game, 1), heuristic_version
+        )
+        return value, pit
+
+    def _player_side(self, game, player):
+        #Board side ('player1'/'player2') played by MAX (1) or MIN (-1)
+        if player == 1:  # MAX
+            if 'COMPUTER' in game.playerSide:
+                player_key = 'COMPUTER'
+            elif 'COMPUTER1' in game.playerSide:
+                player_key = 'COMPUTER1'
+            else:
+                # Fallback: use first key in playerSide
+                player_key = list(game.playerSide.keys())[0]
+        else:  # MIN
+            if 'HUMAN' in game.playerSide:
+                player_key = 'HUMAN'
+            elif 'COMPUTER2' in game.playerSide:
+                player_key = 'COMPUTER2'
+            else:
+                # Fallback: use second key in playerSide
+                player_key = list(game.playerSide.keys())[1]
+        
+        return game.playerSide[player_key]
+    
+    def _next_turn(self, state, record, player, depth, chain):
+        #Side to move, remaining depth and replay chain length after a move.
+        #Landing in the own store earns another move for the same side; a chain
+        #of such moves counts as a single ply, up to max_replay_chain moves.
+        if state.is_replay(record):
+            if chain < self.max_replay_chain:
+                return player, depth, chain + 1
+            return player, depth - 1, 0
+        return -player, depth - 1, 0
+    
+    def search_progress(self):
+        #Progress of an iterative deepening search, safe to call from another
+        #thread while it runs: deepest completed iteration, its best move,
+        #and the search speed so far
+        best = self.best_so_far
+        nodes = self.nodes
+        elapsed = time.perf_counter() - self._search_started if self._search_started else 0
+        return {
+            'depth': self.completed_depth,
+            'bestMove': best[1] if best else None,
+            'value': best[0] if best else None,
+            'nodes': nodes,
+            'ms': round(elapsed * 1000, 1),
+            'nps': round(nodes / elapsed) if elapsed else 0,
+        }
+    
+    def search_stats(self):
+        #Counters of the last search: nodes visited and transposition table activity
+        stats = {
+            'nodes': self.nodes,
+            'leafEvals': self.leaf_evals,
+            'cutoffs': self.cutoffs,
+            'maxPly': self.max_ply,
+            'ms': round(self.search_ms, 3),
+            'depth': self.completed_depth,
+            'pv': self.pv,
+            'moveOrdering': self.move_ordering,
+            'endgameHits': self.endgame_hits,
+            'bookHit': self.book_hit,
+            'pvs': self.pvs,
+            'pvsResearches': self.pvs_researches,
+            'aspirationWindow': self.aspiration_window,
+            'aspirationResearches': self.aspiration_researches,
+        }
+        if self.tt is not None:
+            stats['transpositionTable'] = self.tt.stats()
+        if self.search_cache is not None:
+            stats['searchCache'] = self.search_cache.stats()
+        if self.ponder_stats is not None:
+            stats['ponder'] = self.ponder_stats
+        return stats
+    
+    def _evaluate_leaf(self, game, heuristic_version):
+        #Score a leaf. Both heuristics score finished games by their final
+        #score without collecting the seeds, so the board is never changed.
+        if heuristic_version == 1:
+            return game.evaluate()
+        return self._advanced_heuristic(game)
+    
     def _advanced_heuristic(self, game):
         #Advanced heuristic for COMPUTER2.
         #Takes into account not just the score difference, but also:
@@ -261,17 +1233,19 @@ class Play:
         else:
             return game.evaluate()
         
-        # Store difference (main factor)
-        store_diff = game.state.get_store_count(computer_player) - game.state.get_store_count(opponent_player)
-        
-        # Count seeds on each side (mobility advantage)
-        computer_pits = game.state.player1_pits if computer_player == 'player1' else game.state.player2_pits
-        opponent_pits = game.state.player1_pits if opponent_player == 'player1' else game.state.player2_pits
-        
-        computer_seeds = sum(game.state.board[pit] for pit in computer_pits)
-        opponent_seeds = sum(game.state.board[pit] for pit in opponent_pits)
-        
-        mobility_diff = computer_seeds - opponent_seeds
+        state = game.state
+        if state.is_terminal():
+            # Finished game: the remaining seeds go to their owner's store,
+            # nothing is left to move
+            score1, score2 = state.final_score()
+            store_diff = score1 - score2 if computer_player == 'player1' else score2 - score1
+            mobility_diff = 0
+        else:
+            # Store difference (main factor)
+            store_diff = state.get_store_count(computer_player) - state.get_store_count(opponent_player)
+            
+            # Seeds on each side (mobility advantage)
+            mobility_diff = state.side_seed_count(computer_player) - state.side_seed_count(opponent_player)
         
         # Weighted combination
         return store_diff * 10 + mobility_diff * 0.5
\ No newline at end of file
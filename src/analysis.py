@@ -0,0 +1,150 @@
+#Stateless analysis of arbitrary positions.
+#
+#analyze_position searches a board given as its 14 slot counts and the side
+#to move, without a game session: value, best move, principal variation and
+#the value of every legal move. An AnalysisCache memoizes the results of
+#positions analysed before with the same limits.
+from collections import OrderedDict
+import threading
+
+from .ai_player import MAX_SEARCH_DEPTH, Play, run_tasks, worker_endgame_db
+from .game import Game
+from .mancala_board import MAX_SLOT_COUNT, SLOTS, MancalaBoard
+
+# Sides of an analysed game: player1 is MAX, as COMPUTER1 in computer vs
+# computer games, so values are from player1's point of view
+ANALYSIS_SIDES = {'COMPUTER1': 'player1', 'COMPUTER2': 'player2'}
+
+
+def parse_pits(pits=None, board=None):
+    #Slot counts of a position given as a list in board order (A-F, store 1,
+    #G-L, store 2) or as a board dict like the API's ('A'..'L', '1', '2').
+    #Raises ValueError if the position is malformed.
+    if pits is None and board is not None:
+        if not isinstance(board, dict):
+            raise ValueError("board must be an object of slot counts")
+        try:
+            pits = [board[str(slot)] for slot in SLOTS]
+        except KeyError as e:
+            raise ValueError("board is missing slot %s" % e)
+    if not isinstance(pits, (list, tuple)) or len(pits) != len(SLOTS):
+        raise ValueError("a position needs %d slot counts" % len(SLOTS))
+    if not all(isinstance(count, int) and not isinstance(count, bool) and count >= 0 for count in pits):
+        raise ValueError("slot counts must be non-negative integers")
+    if sum(pits) >= MAX_SLOT_COUNT:
+        raise ValueError("at most %d seeds in a position" % (MAX_SLOT_COUNT - 1))
+    return tuple(pits)
+
+
+def analyze_position(pits, to_move, depth=None, time_ms=None, heuristic_version=1,
+                     endgame_db=None, tt_memory_mb=16):
+    #Search the position pits (see parse_pits) with to_move ('player1' or
+    #'player2') to move: to depth (default 6), or with time_ms by iterative
+    #deepening (up to depth if given). The moves are then scored to the depth
+    #reached. Values are from player1's point of view.
+
+    #Returns:dict with value, bestMove, pv, moves (pit -> value), depth, nodes
+    #and gameOver
+    if to_move not in ANALYSIS_SIDES.values():
+        raise ValueError("toMove must be 'player1' or 'player2'")
+    if heuristic_version not in (1, 2):
+        raise ValueError("heuristicVersion must be 1 or 2")
+
+    game = Game(dict(ANALYSIS_SIDES))
+    game.state = MancalaBoard.from_pits(pits)
+    player = 1 if to_move == 'player1' else -1
+    play = Play(game, depth=depth or 6, tt_memory_mb=tt_memory_mb, endgame_db=endgame_db)
+
+    if game.state.is_terminal() or not game.state.possibleMoves(to_move):
+        return {
+            'value': play._evaluate_leaf(game, heuristic_version),
+            'bestMove': None,
+            'pv': [],
+            'moves': {},
+            'depth': 0,
+            'nodes': 0,
+            'gameOver': True,
+        }
+
+    if time_ms:
+        value, pit = play.iterative_deepening(game, player, time_ms, heuristic_version,
+                                              depth or MAX_SEARCH_DEPTH)
+    else:
+        value, pit = play.MinimaxAlphaBetaPruning(
+            game, player, play.depth, float('-inf'), float('inf'), heuristic_version
+        )
+    searched_depth = play.completed_depth
+    pv = list(play.pv)
+    moves = play.score_moves(player, searched_depth, heuristic_version)
+
+    return {
+        'value': value,
+        'bestMove': pit,
+        'pv': pv,
+        'moves': moves,
+        'depth': searched_depth,
+        'nodes': play.nodes,
+        'gameOver': False,
+    }
+
+
+def _analyze_task(task):
+    #Process-pool worker for analyze_positions
+    pits, to_move, depth, time_ms, heuristic_version, endgame_db_path = task
+    return analyze_position(pits, to_move, depth, time_ms, heuristic_version,
+                            worker_endgame_db(endgame_db_path))
+
+
+def analyze_positions(positions, workers=1, endgame_db=None):
+    #analyze_position for each (pits, to_move, depth, time_ms, heuristic_version)
+    #tuple, spread over worker processes when there are several.
+
+    #Returns:list of results in order
+    if workers <= 1 or len(positions) <= 1:
+        return [analyze_position(*position, endgame_db=endgame_db) for position in positions]
+    endgame_db_path = endgame_db.path if endgame_db else None
+    tasks = [tuple(position) + (endgame_db_path,) for position in positions]
+    return [future.result() for future in run_tasks(_analyze_task, tasks, workers)]
+
+
+class AnalysisCache:
+    #Results of analyze_position keyed by position and search limits, least
+    #recently used evicted first. Shared by the server's request threads.
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        #Result memoized under key, or None
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def __len__(self):
+        return len(self._results)
+
+    def stats(self):
+        return {
+            'entries': len(self._results),
+            'maxEntries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,193 @@
+#Vectorized evaluation of many positions at once with NumPy.
+#
+#Positions are rows of an (N, 14) integer array in MancalaBoard slot order
+#(A-F, store 1, G-L, store 2). Sides are 0 for player1 and 1 for player2.
+#NumPy is optional: the rest of the engine works without it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .mancala_board import SLOTS, SOW_PATH
+
+SIDE_NAMES = ('player1', 'player2')
+
+# Largest seed count a pit may hold in the lookup tables
+MAX_PIT_SEEDS = 96
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Batch evaluation needs NumPy: pip install numpy")
+
+
+def _move_tables():
+    #DELTA[side, k, n]: change of all 14 slots when side sows n seeds from its
+    #k-th pit (before captures). LAST[side, k, n]: slot of the last seed.
+    delta = np.zeros((2, 6, MAX_PIT_SEEDS + 1, 14), dtype=np.int16)
+    last = np.zeros((2, 6, MAX_PIT_SEEDS + 1), dtype=np.int16)
+    for side, name in enumerate(SIDE_NAMES):
+        for k in range(6):
+            start = side * 7 + k
+            path = SOW_PATH[name][start]
+            for n in range(1, MAX_PIT_SEEDS + 1):
+                delta[side, k, n, start] -= n
+                laps, rest = divmod(n, 13)
+                for position in path:
+                    delta[side, k, n, position] += laps
+                for position in path[:rest]:
+                    delta[side, k, n, position] += 1
+                last[side, k, n] = path[(n - 1) % 13]
+    return delta, last
+
+
+_tables = None
+
+
+def _get_tables():
+    global _tables
+    if _tables is None:
+        _require_numpy()
+        _tables = _move_tables()
+    return _tables
+
+
+def as_states(boards):
+    #(N, 14) array from MancalaBoard objects or slot lists
+    _require_numpy()
+    return np.array([getattr(board, 'pits', board) for board in boards], dtype=np.int16)
+
+
+def finished(states):
+    #Boolean (N,) array: one side has no seeds left in its pits
+    return (states[:, 0:6].sum(axis=1) == 0) | (states[:, 7:13].sum(axis=1) == 0)
+
+
+def evaluate_batch(states, max_side='player1', heuristic_version=1):
+    #Heuristic values of every row of an (N, 14) array, from max_side's view.
+    #Same values as Game.evaluate (heuristic 1) and Play._advanced_heuristic
+    #(otherwise); finished games are scored after the remaining seeds are
+    #collected, as in the search.
+
+    #Returns:float64 array of shape (N,)
+    _require_numpy()
+    states = np.asarray(states)
+    seeds1 = states[:, 0:6].sum(axis=1, dtype=np.int64)
+    seeds2 = states[:, 7:13].sum(axis=1, dtype=np.int64)
+    store1 = states[:, 6].astype(np.int64)
+    store2 = states[:, 13].astype(np.int64)
+
+    # Remaining seeds go to their owner's store when the game is over
+    over = (seeds1 == 0) | (seeds2 == 0)
+    store1 = np.where(over, store1 + seeds1, store1)
+    store2 = np.where(over, store2 + seeds2, store2)
+    seeds1 = np.where(over, 0, seeds1)
+    seeds2 = np.where(over, 0, seeds2)
+
+    sign = 1 if max_side == 'player1' else -1
+    store_diff = sign * (store1 - store2)
+    if heuristic_version == 1:
+        return store_diff.astype(np.float64)
+
+    mobility_diff = sign * (seeds1 - seeds2)
+    return store_diff * 10 + mobility_diff * 0.5
+
+
+def expand(states, sides):
+    #All children of the unfinished positions in one vectorized step.
+
+    #Returns:(children, child_sides, parents, pits) where children is (M, 14),
+    #child_sides the side to move after each move (extra turns keep the side),
+    #parents the row of each child's position in states, and pits the slot of
+    #the pit played
+    delta, last_table = _get_tables()
+    states = np.asarray(states, dtype=np.int16)
+    sides = np.asarray(sides, dtype=np.int8)
+    rows = np.arange(len(states))
+    playable = ~finished(states)
+
+    children, child_sides, parents, pits = [], [], [], []
+    for k in range(6):
+        slots = sides * 7 + k
+        seeds = states[rows, slots]
+        parent = np.nonzero(playable & (seeds > 0))[0]
+        if not len(parent):
+            continue
+        side = sides[parent]
+        n = seeds[parent]
+        if n.max() > MAX_PIT_SEEDS:
+            raise ValueError(f"Pits with more than {MAX_PIT_SEEDS} seeds are not supported")
+
+        child = states[parent] + delta[side, k, n]
+        last = last_table[side, k, n]
+        index = np.arange(len(parent))
+
+        # Capture: last seed alone in an own pit, opposite pit not empty
+        own_pit = (last // 7 == side) & (last % 7 != 6)
+        opposite = np.where(own_pit, 12 - last, 6)
+        capture = own_pit & (child[index, last] == 1) & (child[index, opposite] > 0)
+        c = np.nonzero(capture)[0]
+        if len(c):
+            store = side[c] * 7 + 6
+            child[c, store] += 1 + child[c, opposite[c]]
+            child[c, last[c]] = 0
+            child[c, opposite[c]] = 0
+
+        replay = last == side * 7 + 6
+        children.append(child)
+        child_sides.append(np.where(replay, side, 1 - side).astype(np.int8))
+        parents.append(parent)
+        pits.append(slots[parent])
+
+    if not children:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros((0, 14), dtype=np.int16), empty.astype(np.int8), empty, empty
+    return (np.concatenate(children), np.concatenate(child_sides),
+            np.concatenate(parents), np.concatenate(pits))
+
+
+def frontier_minimax(board, side, depth, max_side='player1', heuristic_version=1):
+    #Full-width minimax by frontier expansion: expand the tree one level at a
+    #time with expand(), score every leaf (depth reached or game over) with a
+    #single evaluate_batch() call, then back the values up level by level.
+    #Every move counts as a ply here, extra turns included, and there is no
+    #pruning: the tree grows about 6x per level.
+
+    #Returns:(best_value, best_pit, {pit: value}) for side to move on board
+    _require_numpy()
+    levels = [(as_states([board]), np.array([SIDE_NAMES.index(side)], dtype=np.int8), None, None)]
+    for _ in range(depth):
+        states, sides, _, _ = levels[-1]
+        children, child_sides, parents, pits = expand(states, sides)
+        if not len(children):
+            break
+        levels.append((children, child_sides, parents, pits))
+
+    # Positions of the last level are leaves, and so are finished games above it
+    offsets = np.cumsum([0] + [len(states) for states, _, _, _ in levels])
+    leaf_values = evaluate_batch(np.concatenate([states for states, _, _, _ in levels]),
+                                 max_side, heuristic_version)
+
+    max_index = SIDE_NAMES.index(max_side)
+    values = leaf_values[offsets[-2]:offsets[-1]]
+    for level in range(len(levels) - 1, 0, -1):
+        _, _, parents, _ = levels[level]
+        parent_sides = levels[level - 1][1]
+        maximizing = parent_sides == max_index
+        if level == 1:
+            child_values = values
+
+        best_max = np.full(len(parent_sides), -np.inf)
+        best_min = np.full(len(parent_sides), np.inf)
+        np.maximum.at(best_max, parents, values)
+        np.minimum.at(best_min, parents, values)
+        best = np.where(maximizing, best_max, best_min)
+
+        # Parents without children are finished games
+        values = np.where(np.isinf(best), leaf_values[offsets[level - 1]:offsets[level]], best)
+
+    if len(levels) == 1:
+        return float(values[0]), None, {}
+
+    move_values = {SLOTS[pit]: float(value) for pit, value in zip(levels[1][3], child_values)}
+    return float(values[0]), max(move_values, key=lambda pit: move_values[pit] * (1 if side == max_side else -1)), move_values
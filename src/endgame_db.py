@@ -0,0 +1,270 @@
+#Endgame database: exact values of every position with few seeds left in the pits.
+#
+#A position is the 12 pit counts (A-F, G-L) plus the side to move; stores do not
+#matter for the rest of the game. Its value is the best (mover's future store
+#gain - opponent's future store gain) with perfect play by both sides, under the
+#same rules as MancalaBoard (captures, extra turns, remaining seeds collected
+#when a side is empty).
+#
+#Build once offline:
+#    python -m src.endgame_db --seeds 10 --output endgame.db
+#
+#File layout: a 16-byte header followed by one signed byte per (side, position),
+#at index side * positions + rank(pits), where rank is the combinatorial rank of
+#the pit vector among all vectors with at most max_seeds seeds.
+import argparse
+import mmap
+import os
+import struct
+import time
+from math import comb
+
+from .mancala_board import PIT_INDICES, STORE_INDEX, MancalaBoard, side_seed_counts
+
+# Database used by main.py and server.py when the file exists
+DEFAULT_PATH = os.environ.get('MANCALA_ENDGAME_DB', 'endgame.db')
+
+MAGIC = b'MNCLEGDB'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')  # magic, version, max_seeds, reserved
+
+SIDES = ('player1', 'player2')
+OPPONENT = {'player1': 'player2', 'player2': 'player1'}
+
+# Slot indices of the 12 pits, in rank order
+RANK_SLOTS = PIT_INDICES['player1'] + PIT_INDICES['player2']
+
+
+def position_count(max_seeds):
+    #Number of pit vectors with at most max_seeds seeds in total
+    return comb(max_seeds + 12, 12)
+
+
+def rank_tables(max_seeds):
+    #OFFSETS[i][n][x]: positions ranked before pit i holding x seeds, when n seeds
+    #are still available for pits i..11 (earlier pits fixed)
+    offsets = []
+    for i in range(12):
+        remaining_pits = 11 - i
+        table = []
+        for n in range(max_seeds + 1):
+            row = [0]
+            for y in range(n):
+                row.append(row[-1] + comb(n - y + remaining_pits, remaining_pits))
+            table.append(row)
+        offsets.append(table)
+    return offsets
+
+
+def rank(pits, offsets, max_seeds):
+    #Combinatorial rank of the 12 pit counts of a 14-slot list
+    r = 0
+    n = max_seeds
+    for i, slot in enumerate(RANK_SLOTS):
+        x = pits[slot]
+        r += offsets[i][n][x]
+        n -= x
+    return r
+
+
+def _compositions(total, parts):
+    #All tuples of parts non-negative ints summing to total
+    if parts == 1:
+        yield (total,)
+        return
+    for first in range(total, -1, -1):
+        for rest in _compositions(total - first, parts - 1):
+            yield (first,) + rest
+
+
+def _potential(pit_counts):
+    #Sum of every seed's distance from the start of its side. A move that keeps
+    #all seeds in the pits only moves the mover's seeds forward, so it raises
+    #this; any other move lowers the number of seeds in the pits.
+    return sum((i % 6) * count for i, count in enumerate(pit_counts))
+
+
+def build_database(max_seeds, progress=None):
+    #Solve every position with at most max_seeds seeds in the pits.
+    #Works backwards from the end of the game: positions with fewer seeds first,
+    #then, for the same number of seeds, positions closer to the stores first,
+    #so the value of every successor is known when a position is solved.
+
+    #Returns:bytearray of values (signed bytes), indexed as in the file
+    offsets = rank_tables(max_seeds)
+    count = position_count(max_seeds)
+    values = [bytearray(count), bytearray(count)]
+    board = MancalaBoard.from_pits([0] * 14)
+    pits = board.pits
+
+    def value(side):
+        v = values[SIDES.index(side)][rank(pits, offsets, max_seeds)]
+        return v - 256 if v > 127 else v
+
+    for total in range(max_seeds + 1):
+        by_potential = {}
+        for pit_counts in _compositions(total, 12):
+            by_potential.setdefault(_potential(pit_counts), []).append(pit_counts)
+
+        for potential in sorted(by_potential, reverse=True):
+            for pit_counts in by_potential[potential]:
+                pits[0:6] = pit_counts[:6]
+                pits[7:13] = pit_counts[6:]
+                pits[6] = pits[13] = 0
+                board.side_seeds[:] = side_seed_counts(pits)
+                index = rank(pits, offsets, max_seeds)
+
+                for side_index, side in enumerate(SIDES):
+                    values[side_index][index] = _solve(board, side, value) & 0xFF
+
+        if progress:
+            progress(total)
+
+    return values[0] + values[1]
+
+
+def _solve(board, side, value):
+    #Exact value of the board for side to move, given the values of successors
+    pits = board.pits
+    opponent = OPPONENT[side]
+    my_seeds = board.side_seed_count(side)
+    opponent_seeds = board.side_seed_count(opponent)
+
+    # Game over: each side collects its own remaining seeds
+    if my_seeds == 0 or opponent_seeds == 0:
+        return my_seeds - opponent_seeds
+
+    best = None
+    store = STORE_INDEX[side]
+    for pit in board.possibleMoves(side):
+        record = board.do_move(side, pit)
+        gain = pits[store]  # stores start empty
+
+        mine = board.side_seed_count(side)
+        theirs = board.side_seed_count(opponent)
+        if mine == 0 or theirs == 0:
+            result = gain + mine - theirs
+        elif board.is_replay(record):
+            result = gain + value(side)
+        else:
+            result = gain - value(opponent)
+
+        board.undo_move(record)
+        if best is None or result > best:
+            best = result
+
+    return best
+
+
+def write_database(path, max_seeds, values):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_seeds, 0))
+        f.write(values)
+
+
+class EndgameDatabase:
+    #Read-only, memory-mapped endgame database
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._values = None
+
+        magic, version, max_seeds, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} endgame database")
+
+        self.max_seeds = max_seeds
+        self.positions = position_count(max_seeds)
+        self._offsets = rank_tables(max_seeds)
+        self._values = self._view[HEADER.size:].cast('b')
+        if len(self._values) != 2 * self.positions:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+    def covers(self, board):
+        #True if the board has few enough seeds in the pits to be in the database
+        #(side_seeds holds the seeds in each side's pits, kept up to date by the board)
+        side_seeds = board.side_seeds
+        return side_seeds[0] + side_seeds[1] <= self.max_seeds
+
+    def probe(self, board, player):
+        #Exact future (player's gain - opponent's gain) with player to move,
+        #or None if the position is not in the database
+        if not self.covers(board):
+            return None
+        index = rank(board.pits, self._offsets, self.max_seeds)
+        return self._values[SIDES.index(player) * self.positions + index]
+
+    def final_difference(self, board, player):
+        #Exact final store difference (player1 - player2) with player to move,
+        #or None if the position is not in the database
+        value = self.probe(board, player)
+        if value is None:
+            return None
+        if player == 'player2':
+            value = -value
+        return board.pits[6] - board.pits[13] + value
+
+    def best_move(self, board, player):
+        #Perfect move for player, or None if the position is not in the database.
+
+        #Returns:(final store difference player1 - player2, pit) tuple
+        if not self.covers(board) or board.is_terminal():
+            return None
+
+        sign = 1 if player == 'player1' else -1
+        best_value, best_pit = None, None
+        for pit in board.possibleMoves(player):
+            record = board.do_move(player, pit)
+            if board.is_terminal():
+                score1, score2 = board.final_score()
+                value = score1 - score2
+            elif board.is_replay(record):
+                value = self.final_difference(board, player)
+            else:
+                value = self.final_difference(board, OPPONENT[player])
+            board.undo_move(record)
+
+            if best_value is None or value * sign > best_value * sign:
+                best_value, best_pit = value, pit
+
+        return best_value, best_pit
+
+    def close(self):
+        if self._values is not None:
+            self._values.release()
+            self._values = None
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def open_database(path=DEFAULT_PATH):
+    #Open the database at path, or return None if it has not been built
+    if not os.path.exists(path):
+        return None
+    return EndgameDatabase(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Mancala endgame database")
+    parser.add_argument('--seeds', type=int, default=8, help="maximum seeds left in the pits")
+    parser.add_argument('--output', default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print(f"Solving {2 * position_count(args.seeds)} positions with up to {args.seeds} seeds...")
+    values = build_database(
+        args.seeds,
+        progress=lambda total: print(f"  {total} seeds done ({time.perf_counter() - start:.1f}s)")
+    )
+    write_database(args.output, args.seeds, values)
+    print(f"Wrote {args.output} ({HEADER.size + len(values)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
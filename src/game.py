@@ -16,9 +16,20 @@ class Game:
         else:
             self.playerSide = playerSide
     
+    def is_terminal(self):
+        #Check if the game has ended (one player's side is empty).
+        #Unlike gameOver, never changes the board: safe to call repeatedly.
+        return self.state.is_terminal()
+    
+    def final_score(self):
+        #Final store counts (player1, player2) once the remaining seeds are
+        #collected, without collecting them
+        return self.state.final_score()
+    
     def gameOver(self):
         #Check if the game has ended (one player's side is empty).
-        #If game is over, collect all remaining seeds.
+        #If game is over, collect all remaining seeds (use is_terminal to
+        #only check).
         
         # Check if player1's side is empty
         if self.state.is_side_empty('player1'):
@@ -84,6 +95,11 @@ class Game:
          maximizing_player = 'player1'
          minimizing_player = 'player2'
     
+        # A finished game is scored as if the remaining seeds were collected
+        if self.state.is_terminal():
+            score1, score2 = self.state.final_score()
+            return score1 - score2 if maximizing_player == 'player1' else score2 - score1
+    
         max_seeds = self.state.get_store_count(maximizing_player)
         min_seeds = self.state.get_store_count(minimizing_player)
     
@@ -171,7 +187,11 @@ if __name__ == "__main__":
     # Empty player1's side
     for pit in game.state.player1_pits:
         game.state.board[pit] = 0
+    assert game.is_terminal(), "Game should be over when side is empty"
+    assert game.state.get_store_count('player2') == 0, "is_terminal should not collect seeds"
+    assert game.final_score() == (0, 24), "Player 2 should end with its 24 seeds"
     assert game.gameOver(), "Game should be over when side is empty"
+    assert game.state.get_store_count('player2') == 24, "gameOver should collect the seeds"
     print("✓ gameOver works!")
     
     # Test 8: Reset for new round
@@ -0,0 +1,454 @@
+#Background jobs for long searches.
+#
+#A JobQueue runs submitted functions on a fixed number of worker threads,
+#taking them from a bounded queue, so slow searches never hold up the request
+#that submitted them. Each Job can be polled (or waited on) for its status,
+#progress and result, followed as a stream of progress updates, cancelled or
+#stopped early, and given a deadline.
+#
+#With a JobTable, several server processes share their jobs through a SQLite
+#file: a job runs in the process that queued it, but any process can poll,
+#follow, cancel or stop it (as a RemoteJob).
+from collections import OrderedDict
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+EXPIRED = 'expired'
+
+FINISHED = (DONE, FAILED, CANCELLED, EXPIRED)
+
+# Stop requests a RemoteJob leaves for the process running the job
+STOP_CANCEL = 'cancel'
+STOP_FINISH = 'finish'
+
+# Seconds between checks of a shared job by other processes
+REMOTE_POLL_INTERVAL = 0.1
+
+
+class QueueFull(Exception):
+    #Raised by JobQueue.submit when max_queued jobs are already waiting
+    pass
+
+
+class Job:
+    #One submitted function and its outcome
+
+    def __init__(self, fn, deadline_ms=None, info=None, key=None):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.info = info or {}
+        self.key = key  # what the job works on (see JobQueue.active)
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+
+        self.submitted = time.time()
+        self.started = self.finished = None
+        # Absolute deadline (time.time()); a job still queued then never runs,
+        # a running job is expected to stop by it (see remaining_ms)
+        self.deadline = self.submitted + deadline_ms / 1000 if deadline_ms else None
+
+        # Set by the running function: how to report progress and how to
+        # interrupt it (called from another thread)
+        self.progress = None
+        self.on_stop = None
+        self.cancel_requested = False
+        self.finish_requested = False
+        self._done = threading.Event()
+
+        # Progress updates published by the running function, for followers.
+        # The condition's (reentrant) lock also guards every status change.
+        self.updates = []
+        self._changed = threading.Condition()
+
+        # JobTable the job is shared through, if any
+        self.table = None
+
+    def remaining_ms(self):
+        #Milliseconds left before the deadline, or None without a deadline
+        if self.deadline is None:
+            return None
+        return max(0.0, (self.deadline - time.time()) * 1000)
+
+    def cancel(self):
+        #Ask the job to stop. A queued job is dropped; a running job is
+        #interrupted through on_stop and its function decides what to keep.
+
+        #Returns:False if the job had already finished
+        with self._changed:  # a worker may be taking the job meanwhile
+            if self.status in FINISHED:
+                return False
+            self.cancel_requested = True
+            if self.status == QUEUED:
+                self._finish(CANCELLED)
+                return True
+            on_stop = self.on_stop
+        if on_stop is not None:
+            on_stop()
+        return True
+
+    def finish_early(self):
+        #Ask a running job to stop and keep what it has so far (a queued job
+        #stops as soon as it starts).
+
+        #Returns:False if the job had already finished
+        with self._changed:
+            if self.status in FINISHED:
+                return False
+            self.finish_requested = True
+            on_stop = self.on_stop
+        if on_stop is not None:
+            on_stop()
+        return True
+
+    def publish(self, update):
+        #Record a progress update (from the running function) and wake followers
+        with self._changed:
+            self.updates.append(update)
+            self._changed.notify_all()
+        self._share()
+
+    def follow(self, heartbeat=15):
+        #Yield ('progress', update) for every update, earlier ones first, as
+        #they are published, then (final status, to_dict()) once the job
+        #finishes. Yields (None, None) after heartbeat seconds without news.
+        seen = 0
+        while True:
+            with self._changed:
+                if seen == len(self.updates) and not self._done.is_set():
+                    self._changed.wait(heartbeat)
+                updates = self.updates[seen:]
+                finished = self._done.is_set()
+            seen += len(updates)
+
+            for update in updates:
+                yield 'progress', update
+            if finished:
+                yield self.status, self.to_dict()
+                return
+            if not updates:
+                yield None, None
+
+    def wait(self, timeout=None):
+        #Block until the job finishes or timeout seconds pass; True if finished
+        return self._done.wait(timeout)
+
+    def _run(self):
+        # A job cancelled while queued never runs, and cancel never finishes a
+        # job a worker has taken
+        with self._changed:
+            if self.status != QUEUED:  # cancelled while queued
+                return
+            if self.deadline is not None and time.time() >= self.deadline:
+                self._finish(EXPIRED)
+                return
+            self.status = RUNNING
+            self.started = time.time()
+        self._share()
+        try:
+            self.result = self.fn(self)
+        except Exception as e:  # reported through to_dict(), never raised in the worker
+            self.error = str(e)
+            self._finish(FAILED)
+            return
+        self._finish(CANCELLED if self.cancel_requested else DONE)
+
+    def _finish(self, status):
+        with self._changed:
+            self.status = status
+            self.finished = time.time()
+            self._done.set()
+            self._changed.notify_all()
+        self._share()
+
+    def _share(self):
+        if self.table is not None:
+            self.table.save(self)
+
+    def to_dict(self, live=True):
+        #State as reported to clients; live=False leaves out the progress
+        #read from the running function
+        data = {
+            'jobId': self.id,
+            'status': self.status,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+        }
+        data.update(self.info)
+        if self.deadline is not None:
+            data['remainingMs'] = round(self.remaining_ms(), 1)
+        if live and self.status == RUNNING and self.progress is not None:
+            data['progress'] = self.progress()
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class JobTable:
+    #Jobs of several processes in one SQLite file: state, progress updates
+    #and stop requests. Finished jobs are dropped after keep_s seconds.
+
+    def __init__(self, path, keep_s=3600):
+        self.path = path
+        self.keep_s = keep_s
+        self._local = threading.local()
+        db = self._db()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, key TEXT, status TEXT NOT NULL, "
+                "data TEXT NOT NULL, updates TEXT NOT NULL, deadline REAL, stop TEXT, updated REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status)")
+
+    def _db(self):
+        # One connection per thread (and per process: never used across a fork)
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def save(self, job):
+        #Write the job's current state (stop requests are left as they are)
+        db = self._db()
+        with db:
+            db.execute(
+                "INSERT INTO jobs (id, key, status, data, updates, deadline, updated) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = excluded.status, data = excluded.data, "
+                "updates = excluded.updates, updated = excluded.updated",
+                (job.id, job.key, job.status, json.dumps(job.to_dict(live=False)),
+                 json.dumps(job.updates), job.deadline, time.time())
+            )
+
+    def load(self, job_id):
+        #RemoteJob for a job of any process, or None if unknown
+        row = self._db().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return RemoteJob(self, job_id) if row else None
+
+    def read(self, job_id):
+        #(status, data, updates, deadline) of a job, or None
+        row = self._db().execute(
+            "SELECT status, data, updates, deadline FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, data, updates, deadline = row
+        return status, json.loads(data), json.loads(updates), deadline
+
+    def request_stop(self, job_id, stop):
+        #Leave a stop request for the running process; False if already finished
+        db = self._db()
+        with db:
+            cursor = db.execute(
+                "UPDATE jobs SET stop = ? WHERE id = ? AND status IN (?, ?)", (stop, job_id, QUEUED, RUNNING)
+            )
+        return cursor.rowcount > 0
+
+    def clear_stop(self, job_id, stop):
+        #Drop a stop request once applied (unless another replaced it meanwhile)
+        db = self._db()
+        with db:
+            db.execute("UPDATE jobs SET stop = NULL WHERE id = ? AND stop = ?", (job_id, stop))
+
+    def stop_requests(self):
+        #[(job id, stop request)] of unfinished jobs
+        return self._db().execute(
+            "SELECT id, stop FROM jobs WHERE stop IS NOT NULL AND status IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchall()
+
+    def active(self, key):
+        #True if a job with this key is queued or running in any process
+        row = self._db().execute(
+            "SELECT 1 FROM jobs WHERE key = ? AND status IN (?, ?) LIMIT 1", (key, QUEUED, RUNNING)
+        ).fetchone()
+        return row is not None
+
+    def forget_finished(self):
+        db = self._db()
+        with db:
+            db.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated < ?",
+                (QUEUED, RUNNING, time.time() - self.keep_s)
+            )
+
+
+class RemoteJob:
+    #A job of another process, seen through its JobTable (same interface as Job)
+
+    def __init__(self, table, job_id):
+        self.table = table
+        self.id = job_id
+
+    @property
+    def status(self):
+        return self.table.read(self.id)[0]
+
+    def to_dict(self):
+        status, data, updates, deadline = self.table.read(self.id)
+        if deadline is not None:
+            data['remainingMs'] = round(max(0.0, (deadline - time.time()) * 1000), 1)
+        if status == RUNNING and updates:
+            data['progress'] = updates[-1]
+        return data
+
+    def cancel(self):
+        return self.table.request_stop(self.id, STOP_CANCEL)
+
+    def finish_early(self):
+        return self.table.request_stop(self.id, STOP_FINISH)
+
+    def wait(self, timeout=None):
+        end = None if timeout is None else time.time() + timeout
+        while self.status not in FINISHED:
+            if end is not None and time.time() >= end:
+                return False
+            time.sleep(REMOTE_POLL_INTERVAL)
+        return True
+
+    def follow(self, heartbeat=15):
+        seen = 0
+        quiet_since = time.time()
+        while True:
+            status, data, updates, _ = self.table.read(self.id)
+            for update in updates[seen:]:
+                yield 'progress', update
+            if len(updates) > seen:
+                seen = len(updates)
+                quiet_since = time.time()
+            if status in FINISHED:
+                yield status, self.to_dict()
+                return
+            if time.time() - quiet_since >= heartbeat:
+                quiet_since = time.time()
+                yield None, None
+            time.sleep(REMOTE_POLL_INTERVAL)
+
+
+class JobQueue:
+    #Fixed pool of worker threads fed by a bounded queue. Finished jobs are
+    #kept (for polling) up to keep_finished, oldest dropped first. Threads
+    #start with the first job, in the process that submits it (so a queue
+    #created before the server forks its workers works in each of them).
+
+    def __init__(self, workers=2, max_queued=64, keep_finished=1000, table=None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.table = table
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.submitted = self.rejected = 0
+        self._pid = None
+
+    def _start(self):
+        # Called with the lock held
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_queued)
+        self._jobs = OrderedDict()
+        threads = [
+            threading.Thread(target=self._work, name='job-worker-%d' % i, daemon=True)
+            for i in range(self.workers)
+        ]
+        if self.table is not None:
+            threads.append(threading.Thread(target=self._watch_table, name='job-watcher', daemon=True))
+        for thread in threads:
+            thread.start()
+
+    def submit(self, fn, deadline_ms=None, info=None, key=None):
+        #Queue fn(job) to run on a worker thread.
+
+        #Returns:the Job; raises QueueFull if the queue is full
+        job = Job(fn, deadline_ms, info, key)
+        job.table = self.table
+        with self._lock:
+            # Only submit() puts jobs in the queue, always with the lock held
+            self._start()
+            if self._queue.full():
+                self.rejected += 1
+                raise QueueFull("%d jobs already queued" % self.max_queued)
+            job._share()  # shared before a worker can change it
+            self._queue.put_nowait(job)
+            self._jobs[job.id] = job
+            self.submitted += 1
+            self._forget_finished()
+        return job
+
+    def get(self, job_id):
+        #Job by id (a RemoteJob if another process runs it), or None if
+        #unknown or long finished
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.table is not None:
+            job = self.table.load(job_id)
+        return job
+
+    def active(self, key):
+        #True while a job submitted with this key is queued or running
+        if self.table is not None:
+            return self.table.active(key)
+        with self._lock:
+            return any(job.key == key and job.status not in FINISHED for job in self._jobs.values())
+
+    def _forget_finished(self):
+        # Called with the lock held
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job._run()
+
+    def _watch_table(self):
+        # Apply the stop requests other processes leave for this process's jobs
+        last_cleanup = time.time()
+        while True:
+            time.sleep(REMOTE_POLL_INTERVAL)
+            for job_id, stop in self.table.stop_requests():
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if stop == STOP_CANCEL:
+                    job.cancel()
+                else:
+                    job.finish_early()
+                self.table.clear_stop(job_id, stop)
+            if time.time() - last_cleanup > 60:
+                self.table.forget_finished()
+                last_cleanup = time.time()
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            queued = self._queue.qsize() if self._pid == os.getpid() else 0
+        return {
+            'workers': self.workers,
+            'queued': queued,
+            'maxQueued': self.max_queued,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'jobs': counts,
+            'shared': self.table is not None,
+        }
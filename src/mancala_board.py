@@ -1,44 +1,196 @@
-import copy
+import random
+from collections.abc import MutableMapping
+
+# Slot layout of the compact board, in counterclockwise sowing order:
+# Player 1's pits A-F, Player 1's store, Player 2's pits G-L, Player 2's store
+SLOTS = ('A', 'B', 'C', 'D', 'E', 'F', 1, 'G', 'H', 'I', 'J', 'K', 'L', 2)
+INDEX = {key: i for i, key in enumerate(SLOTS)}
+
+# Key order of the letter-keyed view (same order the original dict used)
+VIEW_KEYS = ('A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 1, 2)
+
+STORE_INDEX = {'player1': 6, 'player2': 13}
+SIDE_INDEX = {'player1': 0, 'player2': 1}
+PIT_INDICES = {'player1': (0, 1, 2, 3, 4, 5), 'player2': (7, 8, 9, 10, 11, 12)}
+INITIAL_PITS = (4, 4, 4, 4, 4, 4, 0, 4, 4, 4, 4, 4, 4, 0)
+
+
+def _sowing_path(start, opponent_store):
+    # The 13 slots a sown seed visits after leaving start (opponent store skipped)
+    path = []
+    position = start
+    while len(path) < 13:
+        position = (position + 1) % 14
+        if position != opponent_store:
+            path.append(position)
+    return tuple(path)
+
+
+# Zobrist keys: one random 64-bit key per (slot, seed count), XORed together
+# for the position hash, plus a key XORed in when Player 2 is to move
+MAX_SLOT_COUNT = 256
+_zobrist_rng = random.Random(0x4D414E43)
+ZOBRIST = tuple(
+    tuple(_zobrist_rng.getrandbits(64) for _ in range(MAX_SLOT_COUNT))
+    for _ in range(14)
+)
+# ZOBRIST_STEP[slot][c]: hash change when a slot goes from c to c + 1 seeds
+ZOBRIST_STEP = tuple(
+    tuple(keys[c] ^ keys[c + 1] for c in range(MAX_SLOT_COUNT - 1))
+    for keys in ZOBRIST
+)
+SIDE_TO_MOVE_KEY = _zobrist_rng.getrandbits(64)
+
+
+def zobrist_hash(pits):
+    # Full (non-incremental) hash of a slot list
+    h = 0
+    for i, count in enumerate(pits):
+        h ^= ZOBRIST[i][count]
+    return h
+
+
+INITIAL_HASH = zobrist_hash(INITIAL_PITS)
+
+
+# SOW_PATH[player][start]: sowing order from each slot; a move with n seeds
+# drops n // 13 seeds on every slot of the path plus one on the first n % 13
+SOW_PATH = {
+    'player1': tuple(_sowing_path(start, 13) for start in range(14)),
+    'player2': tuple(_sowing_path(start, 6) for start in range(14)),
+}
+
+
+def side_seed_counts(pits):
+    # Seeds in the pits of each side, as [player 1, player 2]
+    return [sum(pits[0:6]), sum(pits[7:13])]
+
+
+def _side_deltas(player, start, path):
+    # Change of (player 1's pit seeds, player 2's pit seeds) for each seed count
+    # sown from start, before captures
+    deltas = []
+    for seeds in range(MAX_SLOT_COUNT):
+        laps, rest = divmod(seeds, 13)
+        counts = [6 * laps, 6 * laps]
+        for position in path[:rest]:
+            if position != 6 and position != 13:
+                counts[position // 7] += 1
+        if start != 6 and start != 13:
+            counts[start // 7] -= seeds
+        deltas.append(tuple(counts))
+    return tuple(deltas)
+
+
+# SOW_SIDE_DELTA[player][start][seeds]: how a move changes the side seed counts
+SOW_SIDE_DELTA = {
+    player: tuple(_side_deltas(player, start, path) for start, path in enumerate(paths))
+    for player, paths in SOW_PATH.items()
+}
+
+INITIAL_SIDE_SEEDS = tuple(side_seed_counts(INITIAL_PITS))
+
+
+class BoardView(MutableMapping):
+    # Letter-keyed view ('A'-'L', 1, 2) over the compact slot list of a board
+    __slots__ = ('_board',)
+
+    def __init__(self, board):
+        self._board = board
+
+    def __getitem__(self, key):
+        return self._board.pits[INDEX[key]]
+
+    def __setitem__(self, key, value):
+        self._board._set_slot(INDEX[key], value)
+
+    def __delitem__(self, key):
+        raise TypeError("Board slots cannot be deleted")
+
+    def __contains__(self, key):
+        return key in INDEX
+
+    def __iter__(self):
+        return iter(VIEW_KEYS)
+
+    def __len__(self):
+        return 14
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 class MancalaBoard:
+    __slots__ = ('pits', 'hash', 'side_seeds')
+
+    # Player pit assignments
+    player1_pits = ('A', 'B', 'C', 'D', 'E', 'F')
+    player2_pits = ('G', 'H', 'I', 'J', 'K', 'L')
+
+    # Opposite pits for capturing
+    opposite_pit = {
+        'A': 'L', 'B': 'K', 'C': 'J', 'D': 'I', 'E': 'H', 'F': 'G',
+        'G': 'F', 'H': 'E', 'I': 'D', 'J': 'C', 'K': 'B', 'L': 'A'
+    }
+
+    # Next position in counterclockwise order
+    next_pit = {
+        'A': 'B', 'B': 'C', 'C': 'D', 'D': 'E', 'E': 'F', 'F': 1,
+        1: 'G', 'G': 'H', 'H': 'I', 'I': 'J', 'J': 'K', 'K': 'L',
+        'L': 2, 2: 'A'
+    }
+
     def __init__(self):
         #Initialize the board with starting configuration
 
-        # Board dictionary: keys are pit letters and store numbers
-        self.board = {
-            # Player 1's pits (A-F)
-            'A': 4, 'B': 4, 'C': 4, 'D': 4, 'E': 4, 'F': 4,
-            # Player 2's pits (G-L)
-            'G': 4, 'H': 4, 'I': 4, 'J': 4, 'K': 4, 'L': 4,
-            # Stores
-            1: 0,  # Player 1's store
-            2: 0   # Player 2's store
-        }
-        
-        # Player pit assignments
-        self.player1_pits = ('A', 'B', 'C', 'D', 'E', 'F')
-        self.player2_pits = ('G', 'H', 'I', 'J', 'K', 'L')
+        # Seed counts for the 14 slots (see SLOTS for the layout)
+        self.pits = list(INITIAL_PITS)
         
-        # Opposite pits for capturing
-        self.opposite_pit = {
-            'A': 'L', 'B': 'K', 'C': 'J', 'D': 'I', 'E': 'H', 'F': 'G',
-            'G': 'F', 'H': 'E', 'I': 'D', 'J': 'C', 'K': 'B', 'L': 'A'
-        }
+        # Zobrist hash of the pits, kept up to date by every mutation
+        self.hash = INITIAL_HASH
         
-        # Next position in counterclockwise order
-        self.next_pit = {
-            'A': 'B', 'B': 'C', 'C': 'D', 'D': 'E', 'E': 'F', 'F': 1,
-            1: 'G', 'G': 'H', 'H': 'I', 'I': 'J', 'J': 'K', 'K': 'L',
-            'L': 2, 2: 'A'
-        }
+        # Seeds in each side's pits [player1, player2], also kept up to date
+        self.side_seeds = list(INITIAL_SIDE_SEEDS)
+
+    @classmethod
+    def from_pits(cls, pits):
+        #Create a board from 14 slot counts in SLOTS order
+        board = cls.__new__(cls)
+        board.pits = list(pits)
+        board.hash = zobrist_hash(board.pits)
+        board.side_seeds = side_seed_counts(board.pits)
+        return board
+
+    @property
+    def board(self):
+        # Letter-keyed view: keys are pit letters and store numbers
+        return BoardView(self)
+
+    @board.setter
+    def board(self, values):
+        for key, count in values.items():
+            self._set_slot(INDEX[key], count)
+    
+    def _set_slot(self, index, count):
+        keys = ZOBRIST[index]
+        self.hash ^= keys[self.pits[index]] ^ keys[count]
+        if index != 6 and index != 13:
+            self.side_seeds[index // 7] += count - self.pits[index]
+        self.pits[index] = count
+    
+    def position_key(self, player):
+        #hash of the position with the given player to move (for caches and tables)
+        if player == 'player2':
+            return self.hash ^ SIDE_TO_MOVE_KEY
+        return self.hash
     
     def possibleMoves(self, player):
        #get list of possible moves for a player
 
-        # Select the correct pits based on player
-        pits = self.player1_pits if player == 'player1' else self.player2_pits
+        pits = self.pits
         
         # Return only pits that have seeds
-        possible = [pit for pit in pits if self.board[pit] > 0]
+        possible = [SLOTS[i] for i in PIT_INDICES[player] if pits[i] > 0]
         
         return possible
     
@@ -50,103 +202,186 @@ class MancalaBoard:
         #2. Distribute one seed per pit going counterclockwise
         #3. Include your own store, skip opponent's store
         #4. If last seed lands in empty pit on your side, capture!
+        
+        #Returns True if the last seed landed in the player's store (extra turn)
 
         # Validation
-        if pit not in self.board:
+        if pit not in INDEX or pit in (1, 2):
             raise ValueError(f"Invalid pit: {pit}")
         
-        if self.board[pit] == 0:
+        if self.pits[INDEX[pit]] == 0:
             raise ValueError(f"Pit {pit} is empty")
         
-        # Determine player's and opponent's stores
-        if player == 'player1':
-            my_store = 1
-            opponent_store = 2
-            my_pits = self.player1_pits
-        else:
-            my_store = 2
-            opponent_store = 1
-            my_pits = self.player2_pits
+        record = self.do_move(player, pit)
+        return self.is_replay(record)
+    
+    def do_move(self, player, pit):
+        #Execute a move without validation and return an undo record for undo_move.
+        #Used by the search to play and take back moves in place.
+        pits = self.pits
+        start = INDEX[pit]
+        previous_hash = h = self.hash
         
         # Step 1: Pick up all seeds from chosen pit
-        seeds = self.board[pit]
-        self.board[pit] = 0
+        seeds = pits[start]
+        h ^= ZOBRIST[start][seeds] ^ ZOBRIST[start][0]
+        pits[start] = 0
+        
+        # Step 2: Distribute seeds counterclockwise (opponent's store is not on the path)
+        path = SOW_PATH[player][start]
+        laps, rest = divmod(seeds, 13)
+        if laps:
+            for position in path:
+                count = pits[position]
+                h ^= ZOBRIST[position][count] ^ ZOBRIST[position][count + laps]
+                pits[position] = count + laps
+        for position in path[:rest]:
+            count = pits[position]
+            h ^= ZOBRIST_STEP[position][count]
+            pits[position] = count + 1
+        last = path[(seeds - 1) % 13]
+        side_seeds = self.side_seeds
+        delta1, delta2 = SOW_SIDE_DELTA[player][start][seeds]
+        side_seeds[0] += delta1
+        side_seeds[1] += delta2
+        
+        # Step 3: Capture if the last seed landed in an empty pit on my side
+        # and the opposite pit has seeds
+        captured = 0
+        if last in PIT_INDICES[player] and pits[last] == 1:
+            opposite = 12 - last
+            captured = pits[opposite]
+            if captured > 0:
+                store = STORE_INDEX[player]
+                count = pits[store]
+                h ^= (ZOBRIST[store][count] ^ ZOBRIST[store][count + captured + 1]
+                      ^ ZOBRIST_STEP[last][0] ^ ZOBRIST[opposite][captured] ^ ZOBRIST[opposite][0])
+                pits[store] = count + captured + 1
+                pits[last] = 0
+                pits[opposite] = 0
+                mover = SIDE_INDEX[player]
+                side_seeds[mover] -= 1
+                side_seeds[1 - mover] -= captured
+        
+        self.hash = h
+        return (player, start, seeds, last, captured, previous_hash)
+    
+    def classify_move(self, player, pit):
+        #Predict a move without playing it (used for move ordering).
+        #Returns (lands_in_store, captured) where captured is the number of
+        #opponent seeds the move would capture (0 if none).
+        pits = self.pits
+        start = INDEX[pit]
+        seeds = pits[start]
+        path = SOW_PATH[player][start]
+        last = path[(seeds - 1) % 13]
+        
+        if last == STORE_INDEX[player]:
+            return True, 0
+        
+        # A capture needs the last seed to be the only one in a pit on my side,
+        # which also means fewer than 14 seeds were sown
+        if last not in PIT_INDICES[player] or seeds > 13:
+            return False, 0
+        if (0 if last == start else pits[last]) != 0:
+            return False, 0
+        
+        opposite = 12 - last
+        captured = pits[opposite] + (1 if opposite in path[:seeds] else 0)
+        return False, captured
+    
+    def is_replay(self, record):
+        #True if the move of this do_move record ended in the mover's store
+        return record[3] == STORE_INDEX[record[0]]
+    
+    def undo_move(self, record):
+        #Take back a move played with do_move, restoring the exact previous state.
+        player, start, seeds, last, captured, previous_hash = record
+        pits = self.pits
         
-        # Step 2: Distribute seeds counterclockwise
-        current_position = pit
+        side_seeds = self.side_seeds
         
-        while seeds > 0:
-            # Move to next position
-            current_position = self.next_pit[current_position]
-            
-            # Skip opponent's store
-            if current_position == opponent_store:
-                current_position = self.next_pit[current_position]
-            
-            # Drop one seed
-            self.board[current_position] += 1
-            seeds -= 1
+        if captured:
+            pits[STORE_INDEX[player]] -= captured + 1
+            pits[last] = 1
+            pits[12 - last] = captured
+            mover = SIDE_INDEX[player]
+            side_seeds[mover] += 1
+            side_seeds[1 - mover] += captured
         
-        # Step 3: Check for capture
-        # Capture conditions:
-        # - Last seed landed in a pit (not a store)
-        # - That pit is on my side
-        # - That pit now has exactly 1 seed (was empty before)
-        # - Opposite pit has seeds
+        path = SOW_PATH[player][start]
+        laps, rest = divmod(seeds, 13)
+        if laps:
+            for position in path:
+                pits[position] -= laps
+        for position in path[:rest]:
+            pits[position] -= 1
+        delta1, delta2 = SOW_SIDE_DELTA[player][start][seeds]
+        side_seeds[0] -= delta1
+        side_seeds[1] -= delta2
         
-        if (current_position in my_pits and 
-            self.board[current_position] == 1):
-            
-            opposite = self.opposite_pit[current_position]
-            
-            if self.board[opposite] > 0:
-                # CAPTURE!
-                captured_seeds = self.board[current_position] + self.board[opposite]
-                
-                # Add to player's store
-                self.board[my_store] += captured_seeds
-                
-                # Clear both pits
-                self.board[current_position] = 0
-                self.board[opposite] = 0
+        pits[start] = seeds
+        self.hash = previous_hash
+    
+    def snapshot(self):
+        #capture the full state so it can be put back with restore()
+        return tuple(self.pits), self.hash
+    
+    def restore(self, snapshot):
+        #put back a state captured with snapshot()
+        pits, self.hash = snapshot
+        self.pits[:] = pits
+        self.side_seeds[:] = side_seed_counts(pits)
     
     def copy(self):
-        #create deep copy to simulate moves without effecting the original board
-        return copy.deepcopy(self)
+        #create a copy to simulate moves without effecting the original board
+        new_board = MancalaBoard.__new__(MancalaBoard)
+        new_board.pits = self.pits[:]
+        new_board.hash = self.hash
+        new_board.side_seeds = self.side_seeds[:]
+        return new_board
     
     def reset(self):
         #reset to start a new round
-
-        # Reset all pits to 4 seeds
-        for pit in self.player1_pits + self.player2_pits:
-            self.board[pit] = 4
-        
-        # Reset stores to 0
-        self.board[1] = 0
-        self.board[2] = 0
+        self.pits[:] = INITIAL_PITS
+        self.hash = INITIAL_HASH
+        self.side_seeds[:] = INITIAL_SIDE_SEEDS
     
     def get_store_count(self, player):
         #get the number of seeds in a player's store
-
-        store = 1 if player == 'player1' else 2
-        return self.board[store]
+        return self.pits[STORE_INDEX[player]]
+    
+    def side_seed_count(self, player):
+        #number of seeds left in a player's pits (kept up to date, no scan)
+        return self.side_seeds[SIDE_INDEX[player]]
     
     def is_side_empty(self, player):
         #check if all pits on a player's side are empty to end the game
-        pits = self.player1_pits if player == 'player1' else self.player2_pits
-        return all(self.board[pit] == 0 for pit in pits)
+        return not self.side_seeds[SIDE_INDEX[player]]
+    
+    def is_terminal(self):
+        #True if the game is over (one side has no seeds left); never changes the board
+        side_seeds = self.side_seeds
+        return not side_seeds[0] or not side_seeds[1]
+    
+    def final_score(self):
+        #Store counts (player1, player2) after the remaining seeds are collected,
+        #without collecting them. Equal to the stores once the seeds are collected.
+        pits = self.pits
+        side_seeds = self.side_seeds
+        return pits[6] + side_seeds[0], pits[13] + side_seeds[1]
     
     def collect_remaining_seeds(self, player):
         #collect all remaining seeds from a player's side into their store at game end
-        pits = self.player1_pits if player == 'player1' else self.player2_pits
-        store = 1 if player == 'player1' else 2
+        pits = self.pits
         
         total = 0
-        for pit in pits:
-            total += self.board[pit]
-            self.board[pit] = 0
+        for i in PIT_INDICES[player]:
+            total += pits[i]
+            self._set_slot(i, 0)
         
-        self.board[store] += total
+        store = STORE_INDEX[player]
+        self._set_slot(store, pits[store] + total)
         return total
     
     def __str__(self):
@@ -209,10 +444,13 @@ def test_board():
     # Test 4: Move reaching store
     print("\n4. Testing move reaching store (F)...")
     board.reset()
-    board.doMove('player1', 'F')
+    replay = board.doMove('player1', 'F')
     print(board)
+    assert not replay, "Last seed from F passes the store"
     assert board.board['F'] == 0, "Pit F should be empty"
     assert board.board[1] == 1, "Store 1 should have 1 seed"
+    board.reset()
+    assert board.doMove('player1', 'C'), "Last seed from C lands in the store"
     print(" Move reaching store works!")
     
     # Test 5: Capture
@@ -250,6 +488,49 @@ def test_board():
     assert board.is_side_empty('player1'), "Side should be empty"
     print(" is_side_empty works!")
     
+    # Test 8: do_move / undo_move
+    print("\n8. Testing do_move / undo_move...")
+    board = MancalaBoard()
+    board.board['C'] = 0
+    board.board['A'] = 2
+    board.board['L'] = 20
+    before = list(board.pits)
+    for player, pit in (('player1', 'A'), ('player2', 'L'), ('player1', 'F')):
+        record = board.do_move(player, pit)
+        board.undo_move(record)
+        assert board.pits == before, f"undo_move should restore the board after {pit}"
+        board.do_move(player, pit)
+        assert board.hash == zobrist_hash(board.pits), "Hash should follow the move"
+        board.undo_move(record)
+        assert board.hash == zobrist_hash(board.pits), "Hash should be restored"
+    print(" do_move / undo_move works!")
+    
+    # Test 9: classify_move agrees with do_move
+    print("\n9. Testing classify_move...")
+    board = MancalaBoard()
+    board.board['C'] = 0
+    board.board['A'] = 2
+    assert board.classify_move('player1', 'A') == (False, 4), "A should capture J's 4 seeds"
+    assert MancalaBoard().classify_move('player1', 'C') == (True, 0), "C should land in the store"
+    assert board.classify_move('player2', 'G') == (False, 0), "G should be a quiet move"
+    print(" classify_move works!")
+
+    # Test 10: terminal checks do not touch the board
+    print("\n10. Testing is_terminal and final_score...")
+    board = MancalaBoard()
+    assert not board.is_terminal(), "A new game is not over"
+    for pit in board.player1_pits:
+        board.board[pit] = 0
+    board.board[1] = 20
+    before = board.snapshot()
+    assert board.is_terminal(), "Game should be over when a side is empty"
+    assert board.final_score() == (20, 24), "Player 2 should collect its 24 seeds"
+    assert board.snapshot() == before, "Terminal checks should not change the board"
+    board.collect_remaining_seeds('player2')
+    assert board.final_score() == (20, 24), "Collecting should not change the final score"
+    assert board.side_seed_count('player2') == 0, "Side counts should follow collecting"
+    print(" is_terminal and final_score work!")
+
     print("\n" + "="*50)
     print("All tests passed! ✓")
     print("="*50)
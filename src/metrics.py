@@ -0,0 +1,226 @@
+#Metrics in the Prometheus text exposition format, without dependencies.
+#
+#A Registry holds counters, gauges and histograms, each with optional labels,
+#and renders them all for a /metrics endpoint. Values are per process; server
+#processes sharing an SQLite file publish theirs to a MetricsTable, whose
+#families render_families merges into one exposition (one series per process).
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Upper bounds (seconds) of the default latency buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Upper bounds of the default buckets for counts (nodes, evaluations, ...)
+COUNT_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in zip(names, values))
+
+
+class Metric:
+    #A named metric with one value per combination of label values
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("%s takes the labels %s" % (self.name, ', '.join(self.labelnames)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        #(name suffix, label names, label values, value) of each sample
+        with self._lock:
+            return [('', self.labelnames, key, value) for key, value in sorted(self._values.items())]
+
+    def family(self, **labels):
+        #The metric with its samples as JSON-serializable lists, each sample
+        #with the given constant labels before its own
+        names, values = tuple(labels), tuple(str(value) for value in labels.values())
+        return {
+            'name': self.name, 'help': self.help, 'kind': self.kind,
+            'samples': [[suffix, names + sample_names, values + sample_values, value]
+                        for suffix, sample_names, sample_values, value in self.samples()],
+        }
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    #Observations counted in cumulative buckets (upper bounds), with their
+    #sum and count, per combination of label values
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        Metric.__init__(self, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        names = self.labelnames + ('le',)
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(('_bucket', names, key + (_format_value(bound),), cumulative))
+                samples.append(('_sum', self.labelnames, key, total))
+                samples.append(('_count', self.labelnames, key, count))
+        return samples
+
+
+def render_families(families):
+    #Text exposition of metric families (see Metric.family), the samples of
+    #families with the same name (from several processes) under one header
+    merged = {}
+    for family in families:
+        known = merged.get(family['name'])
+        if known is None:
+            merged[family['name']] = dict(family, samples=list(family['samples']))
+        else:
+            known['samples'].extend(family['samples'])
+    lines = []
+    for family in merged.values():
+        lines.append('# HELP %s %s' % (family['name'], family['help']))
+        lines.append('# TYPE %s %s' % (family['name'], family['kind']))
+        for suffix, names, values, value in family['samples']:
+            lines.append('%s%s%s %s' % (family['name'], suffix, _labels_text(names, values), _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class Registry:
+    #The metrics of a process, rendered in registration order
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def families(self, **labels):
+        #Every metric as a family, with constant labels (e.g. worker=pid)
+        return [metric.family(**labels) for metric in self._metrics]
+
+    def render(self, **labels):
+        #All metrics in the text exposition format (version 0.0.4)
+        return render_families(self.families(**labels))
+
+
+class MetricsTable:
+    #Metric families of several server processes in one SQLite file, one row
+    #per process. Rows of processes that are gone are dropped when read.
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS metrics (pid INTEGER PRIMARY KEY, "
+                "families TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _db(self):
+        # One connection per thread (and per process: never used across a fork)
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def publish(self, families):
+        #Replace this process's families
+        db = self._db()
+        with db:
+            db.execute(
+                "INSERT INTO metrics (pid, families, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(pid) DO UPDATE SET families = excluded.families, updated = excluded.updated",
+                (os.getpid(), json.dumps(families), time.time())
+            )
+
+    def collect(self):
+        #Families of every live process, oldest process first
+        db = self._db()
+        families = []
+        for pid, text in db.execute("SELECT pid, families FROM metrics ORDER BY pid").fetchall():
+            if _process_exists(pid):
+                families.extend(json.loads(text))
+            else:
+                with db:
+                    db.execute("DELETE FROM metrics WHERE pid = ?", (pid,))
+        return families
+
+
+def _process_exists(pid):
+    # The processes sharing a file run on the same machine
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
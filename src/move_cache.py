@@ -0,0 +1,144 @@
+#Results of AI move searches kept across game sessions.
+#
+#Many games reach the same positions (above all in the opening) and search
+#them with the same limits. A MoveCache maps (position, side to move, depth or
+#time budget, heuristic version, other engine settings) to the move found, so
+#that a repeated request is answered without searching. Values are kept from
+#the side to move's point of view, since which side is MAX depends on the game
+#mode. Entries are evicted least recently used first. With a path they are also written to an
+#SQLite file, which keeps them across restarts and shares them between the
+#server processes using the same file.
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .packed_board import pack
+
+# Rows written between two trims of the file to the size cap
+TRIM_INTERVAL = 1000
+
+# Part of every key, raised when the meaning of the entries changes so that
+# files written before are not read back (2: values for the side to move)
+ENTRY_VERSION = 2
+
+
+def move_key(pits, player_side, depth, time_ms, heuristic_version, settings):
+    #Cache key of a search: the exact position (packed), the side to move, the
+    #limit (a time budget replaces the depth), the heuristic and a digest of
+    #the other engine settings (a JSON-serializable dict, see settings_digest)
+    limit = 't%s' % time_ms if time_ms else 'd%s' % depth
+    return '%x:%s:%s:h%s:s%s:v%d' % (pack(pits), player_side, limit, heuristic_version,
+                                     settings_digest(settings), ENTRY_VERSION)
+
+
+def settings_digest(settings):
+    #Short hash of a settings dict that does not depend on the order of its
+    #keys, so that processes with the same settings share entries
+    text = json.dumps(settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+class MoveCache:
+    #(best_value, best_pit, depth reached, principal variation) by move_key,
+    #at most max_entries in memory and, with a path, about as many on disk
+
+    def __init__(self, max_entries=100000, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            db = self._db()
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS moves (key TEXT PRIMARY KEY, data TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS moves_created ON moves (created)")
+
+    def _db(self):
+        # One connection per thread (and per process: never used across a fork)
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def get(self, key):
+        #Entry for key (from memory, else from the file), or None
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        if self.path:
+            row = self._db().execute("SELECT data FROM moves WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = tuple(json.loads(row[0]))
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, entry)
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, best_value, best_pit, depth, pv):
+        if not self.max_entries:
+            return
+        entry = (best_value, best_pit, depth, list(pv))
+        with self._lock:
+            self._remember(key, entry)
+            self._writes += 1
+            trim = self.path and self._writes % TRIM_INTERVAL == 0
+
+        if self.path:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO moves (key, data, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(entry), time.time())
+                )
+                if trim:
+                    # Oldest rows first: the file keeps the newest max_entries
+                    db.execute(
+                        "DELETE FROM moves WHERE key IN (SELECT key FROM moves ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+
+    def _remember(self, key, entry):
+        # Caller holds the lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'maxEntries': self.max_entries,
+            'hits': self.hits,
+            'diskHits': self.disk_hits,
+            'misses': self.misses,
+            'hitRate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+            'persisted': bool(self.path),
+        }
@@ -0,0 +1,171 @@
+#Opening book: best moves for the positions of the first plies, searched offline.
+#
+#Build once (positions are searched in parallel, one per worker process):
+#    python -m src.opening_book --plies 6 --depth 12 --workers 8
+#
+#File layout: a 16-byte header, then fixed-size records sorted by position key
+#(MancalaBoard.position_key: Zobrist hash with side to move). Lookups binary
+#search the memory-mapped records. Values are from the side to move's view.
+import argparse
+import mmap
+import os
+import struct
+import time
+
+from .ai_player import Play, run_tasks, shutdown_executors
+from .game import Game
+from .mancala_board import SLOTS, INDEX, MancalaBoard
+
+# Book used by main.py and server.py when the file exists
+DEFAULT_PATH = os.environ.get('MANCALA_OPENING_BOOK', 'opening_book.bin')
+
+MAGIC = b'MNCLBOOK'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')   # magic, version, heuristic_version, entries
+RECORD = struct.Struct('<QfBB2x')  # key, value, pit slot, depth
+
+# playerSide used while building: MAX plays player1
+BOOK_SIDES = {'COMPUTER1': 'player1', 'COMPUTER2': 'player2'}
+
+
+def book_positions(plies):
+    #All positions reachable in the first plies moves from the initial board.
+    #A move that earns an extra turn counts as a ply too.
+
+    #Returns:list of (slot counts, side to move), in breadth-first order
+    start = MancalaBoard()
+    seen = {start.position_key('player1')}
+    frontier = [(start, 'player1')]
+    positions = []
+
+    for _ in range(plies):
+        next_frontier = []
+        for board, side in frontier:
+            positions.append((tuple(board.pits), side))
+            for pit in board.possibleMoves(side):
+                child = board.copy()
+                replay = child.doMove(side, pit)
+                if child.is_terminal():
+                    continue
+                child_side = side if replay else ('player2' if side == 'player1' else 'player1')
+                key = child.position_key(child_side)
+                if key not in seen:
+                    seen.add(key)
+                    next_frontier.append((child, child_side))
+        frontier = next_frontier
+
+    return positions
+
+
+def _search_position(task):
+    #Process-pool worker: search one book position serially.
+    #Returns (key, value for the side to move, pit, depth).
+    pits, side, depth, heuristic_version = task
+    game = Game(dict(BOOK_SIDES))
+    game.state = MancalaBoard.from_pits(pits)
+    player = 1 if side == 'player1' else -1
+
+    value, pit = Play(game, depth=depth).choose_move(player, heuristic_version)
+    return game.state.position_key(side), value * player, pit, depth
+
+
+def build_book(plies, depth, heuristic_version=1, workers=1, progress=None):
+    #Search every position of the first plies moves to the given depth.
+
+    #Returns:list of (key, value, pit, depth) sorted by key
+    tasks = [(pits, side, depth, heuristic_version) for pits, side in book_positions(plies)]
+    if workers > 1:
+        results = (future.result() for future in run_tasks(_search_position, tasks, workers))
+    else:
+        results = map(_search_position, tasks)
+
+    entries = []
+    for done, entry in enumerate(results, 1):
+        entries.append(entry)
+        if progress:
+            progress(done, len(tasks))
+
+    entries.sort()
+    return entries
+
+
+def write_book(path, heuristic_version, entries):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, heuristic_version, len(entries)))
+        for key, value, pit, depth in entries:
+            f.write(RECORD.pack(key, value, INDEX[pit], depth))
+
+
+class OpeningBook:
+    #Read-only, memory-mapped opening book
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, heuristic_version, entries = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        if len(self._mmap) != HEADER.size + entries * RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+        self.heuristic_version = heuristic_version
+        self.entries = entries
+
+    def lookup(self, board, player):
+        #Book move for player to move on board, or None if the position is not in the book.
+
+        #Returns:(value for player, pit, depth searched) tuple
+        key = board.position_key(player)
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, value, slot, depth = RECORD.unpack_from(
+                self._mmap, HEADER.size + middle * RECORD.size
+            )
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return value, SLOTS[slot], depth
+        return None
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def open_book(path=DEFAULT_PATH):
+    #Open the book at path, or return None if it has not been built
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Mancala opening book")
+    parser.add_argument('--plies', type=int, default=4, help="book covers the first plies moves")
+    parser.add_argument('--depth', type=int, default=10, help="search depth for every book position")
+    parser.add_argument('--heuristic', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        if done == total or done % 50 == 0:
+            print(f"  {done}/{total} positions ({time.perf_counter() - start:.1f}s)")
+
+    entries = build_book(args.plies, args.depth, args.heuristic, args.workers, progress)
+    shutdown_executors()
+    write_book(args.output, args.heuristic, entries)
+    print(f"Wrote {args.output} ({len(entries)} positions)")
+
+
+if __name__ == "__main__":
+    main()
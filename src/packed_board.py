@@ -0,0 +1,206 @@
+#Packed board engine: the whole position in one Python int.
+#
+#Each of the 14 slots (SLOTS order: A-F, store 1, G-L, store 2) is a 6-bit field,
+#slot i at bits 6*i .. 6*i+5, so a position takes 84 bits. With 48 seeds in play
+#no slot ever exceeds 63, so whole moves are applied by adding precomputed
+#deltas without carries between fields. The rules are those of
+#MancalaBoard.doMove (captures, extra turns, opponent's store skipped).
+#
+#The packed int identifies the position exactly, so it can be used directly as
+#a cache or database key; position_key adds the side to move.
+from .mancala_board import SLOTS, INDEX, PIT_INDICES, STORE_INDEX, INITIAL_PITS, SOW_PATH, MancalaBoard
+
+FIELD_BITS = 6
+FIELD_MASK = (1 << FIELD_BITS) - 1
+
+# Most seeds a slot can hold
+MAX_SLOT_SEEDS = FIELD_MASK
+
+SHIFT = tuple(FIELD_BITS * i for i in range(14))
+SIDE_BIT = {'player1': 0, 'player2': 1}
+
+
+def pack(pits):
+    #Packed int of 14 slot counts in SLOTS order
+    key = 0
+    for i, count in enumerate(pits):
+        if not 0 <= count <= MAX_SLOT_SEEDS:
+            raise ValueError(f"Slot {SLOTS[i]} holds {count} seeds (packed boards allow 0-{MAX_SLOT_SEEDS})")
+        key |= count << SHIFT[i]
+    return key
+
+
+def unpack(key):
+    #14 slot counts of a packed int, in SLOTS order
+    return [(key >> shift) & FIELD_MASK for shift in SHIFT]
+
+
+def _move_table():
+    #MOVES[player][start][seeds]: (delta, last slot) for sowing seeds from start.
+    #delta is the change of the packed int (seeds picked up and sown), captures
+    #are applied separately.
+    table = {}
+    for player in ('player1', 'player2'):
+        by_start = [None] * 14
+        for start in PIT_INDICES[player]:
+            path = SOW_PATH[player][start]
+            moves = [None]
+            for seeds in range(1, MAX_SLOT_SEEDS + 1):
+                laps, rest = divmod(seeds, 13)
+                delta = -(seeds << SHIFT[start])
+                for position in path:
+                    delta += laps << SHIFT[position]
+                for position in path[:rest]:
+                    delta += 1 << SHIFT[position]
+                moves.append((delta, path[(seeds - 1) % 13]))
+            by_start[start] = tuple(moves)
+        table[player] = tuple(by_start)
+    return table
+
+
+MOVES = _move_table()
+
+# Mask of the six pit fields of each side
+SIDE_MASK = {
+    player: sum(FIELD_MASK << SHIFT[i] for i in indices)
+    for player, indices in PIT_INDICES.items()
+}
+
+INITIAL_KEY = pack(INITIAL_PITS)
+
+
+def apply_move(key, player, start):
+    #Play the pit at slot index start (must not be empty).
+
+    #Returns:(new packed int, True if the move earned an extra turn)
+    seeds = (key >> SHIFT[start]) & FIELD_MASK
+    delta, last = MOVES[player][start][seeds]
+    key += delta
+
+    store = STORE_INDEX[player]
+    if last == store:
+        return key, True
+
+    # Capture: the last seed is alone in a pit on my side, opposite pit not empty
+    if last in PIT_INDICES[player] and (key >> SHIFT[last]) & FIELD_MASK == 1:
+        opposite = 12 - last
+        captured = (key >> SHIFT[opposite]) & FIELD_MASK
+        if captured:
+            key += ((captured + 1) << SHIFT[store]) - (1 << SHIFT[last]) - (captured << SHIFT[opposite])
+    return key, False
+
+
+def legal_starts(key, player):
+    #Slot indices of the non-empty pits of player
+    return [i for i in PIT_INDICES[player] if (key >> SHIFT[i]) & FIELD_MASK]
+
+
+def is_side_empty(key, player):
+    return not key & SIDE_MASK[player]
+
+
+class PackedBoard:
+    #Board engine with the same interface as MancalaBoard for playing games,
+    #backed by a single packed int
+    __slots__ = ('key',)
+
+    def __init__(self, key=INITIAL_KEY):
+        self.key = key
+
+    @classmethod
+    def from_pits(cls, pits):
+        return cls(pack(pits))
+
+    @classmethod
+    def from_board(cls, board):
+        return cls(pack(board.pits))
+
+    def to_board(self):
+        return MancalaBoard.from_pits(unpack(self.key))
+
+    @property
+    def pits(self):
+        # Slot counts in SLOTS order (a new list; writes do not change the board)
+        return unpack(self.key)
+
+    def position_key(self, player):
+        #Exact key of the position with the given player to move
+        return self.key << 1 | SIDE_BIT[player]
+
+    def possibleMoves(self, player):
+        return [SLOTS[i] for i in legal_starts(self.key, player)]
+
+    def doMove(self, player, pit):
+        #Execute a move; returns True if the last seed landed in the player's store
+        if pit not in INDEX or pit in (1, 2):
+            raise ValueError(f"Invalid pit: {pit}")
+        start = INDEX[pit]
+        if not (self.key >> SHIFT[start]) & FIELD_MASK:
+            raise ValueError(f"Pit {pit} is empty")
+
+        self.key, replay = apply_move(self.key, player, start)
+        return replay
+
+    def copy(self):
+        return PackedBoard(self.key)
+
+    def reset(self):
+        self.key = INITIAL_KEY
+
+    def get_store_count(self, player):
+        return (self.key >> SHIFT[STORE_INDEX[player]]) & FIELD_MASK
+
+    def is_side_empty(self, player):
+        return is_side_empty(self.key, player)
+
+    def collect_remaining_seeds(self, player):
+        #collect all remaining seeds from a player's side into their store at game end
+        key = self.key
+        total = 0
+        for i in PIT_INDICES[player]:
+            total += (key >> SHIFT[i]) & FIELD_MASK
+        self.key = (key & ~SIDE_MASK[player]) + (total << SHIFT[STORE_INDEX[player]])
+        return total
+
+    def __eq__(self, other):
+        return isinstance(other, PackedBoard) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return str(self.to_board())
+
+
+def test_packed_board():
+    # Play random games on both engines and compare every position
+    import random
+
+    print("Testing PackedBoard against MancalaBoard...")
+    rng = random.Random(12)
+    positions = 0
+    for _ in range(500):
+        board, packed, player = MancalaBoard(), PackedBoard(), 'player1'
+        while not (board.is_side_empty('player1') or board.is_side_empty('player2')):
+            moves = board.possibleMoves(player)
+            assert packed.possibleMoves(player) == moves, "Move lists differ"
+            pit = rng.choice(moves)
+            replay = board.doMove(player, pit)
+            assert packed.doMove(player, pit) == replay, "Extra turns differ"
+            assert packed.pits == board.pits, "Boards differ"
+            positions += 1
+            if not replay:
+                player = 'player2' if player == 'player1' else 'player1'
+
+        for side in ('player1', 'player2'):
+            assert packed.is_side_empty(side) == board.is_side_empty(side)
+            assert packed.collect_remaining_seeds(side) == board.collect_remaining_seeds(side)
+        assert packed.pits == board.pits, "Collected boards differ"
+
+    assert PackedBoard.from_pits(INITIAL_PITS).key == INITIAL_KEY
+    assert unpack(pack(list(range(14)))) == list(range(14))
+    print(f" {positions} positions identical!")
+
+
+if __name__ == "__main__":
+    test_packed_board()
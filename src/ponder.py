@@ -0,0 +1,144 @@
+#Pondering: searching on the opponent's time.
+#
+#After the engine has moved, a background thread plays the opponent's expected
+#reply on a copy of the board and searches the resulting position for the
+#engine. If the opponent plays that reply, the next search starts from the
+#pondered result (and, with a SearchCache, from its transposition table);
+#otherwise the background search is cancelled. At most MAX_PONDERERS
+#background searches run at a time in a process; when they are all taken, the
+#engine simply does not ponder.
+import threading
+import time
+
+from .game import Game
+
+# Longest a background search runs when nobody stops it
+PONDER_TIME_LIMIT_MS = 10000
+
+# Background searches running at a time in this process (see set_max_ponderers)
+MAX_PONDERERS = 4
+_slots = threading.BoundedSemaphore(MAX_PONDERERS)
+
+
+def set_max_ponderers(count):
+    #Cap the background searches of this process (0 turns pondering off).
+    #Call before any pondering starts.
+    global MAX_PONDERERS, _slots
+    if count < 0:
+        raise ValueError("the ponderer cap must be non-negative")
+    MAX_PONDERERS = count
+    _slots = threading.BoundedSemaphore(count) if count else None
+
+
+class Ponderer:
+    #One background search of a predicted position
+
+    def __init__(self, play, game, player, heuristic_version, line_keys, max_depth):
+        # play is a separate Play (same settings, same SearchCache) that owns game
+        self.play = play
+        self.game = game
+        self.player = player
+        self.heuristic_version = heuristic_version
+        self.max_depth = max_depth
+
+        # Position keys along the predicted reply: the opponent's positions,
+        # then the position searched (the engine to move)
+        self.line_keys = line_keys
+        self.key = line_keys[-1]
+
+        self.result = None
+        self.error = None
+        self._started = self._finished = None
+        self._slots = None
+        self._thread = threading.Thread(target=self._run, name='ponder', daemon=True)
+
+    def start(self):
+        #Start the background search if a ponderer slot is free.
+
+        #Returns:True if started
+        slots = self._slots = _slots
+        if slots is None or not slots.acquire(blocking=False):
+            return False
+        self._started = time.perf_counter()
+        self._thread.start()
+        return True
+
+    def _run(self):
+        try:
+            self.result = self.play.iterative_deepening(
+                self.game, self.player, PONDER_TIME_LIMIT_MS, self.heuristic_version, self.max_depth
+            )
+        except Exception as e:  # reported through stats(), never raised in the caller
+            self.error = e
+        finally:
+            self._finished = time.perf_counter()
+            self._slots.release()
+
+    def stop(self):
+        #Stop the background search and wait for it (returns at the next
+        #deadline check, i.e. within a few hundred nodes)
+        self.play.stop_requested = True
+        if self._started is not None:
+            self._thread.join()
+
+    def elapsed_ms(self):
+        #Time spent searching (up to now, or until the search finished)
+        end = self._finished or time.perf_counter()
+        return (end - self._started) * 1000
+
+    def on_line(self, key):
+        #True if a position (key with side to move) is still on the predicted line
+        return key in self.line_keys
+
+    def stats(self):
+        return {
+            'depth': self.play.completed_depth,
+            'nodes': self.play.nodes,
+            'ms': round(self.elapsed_ms(), 1),
+            'pv': self.play.pv,
+            'error': str(self.error) if self.error else None,
+        }
+
+
+def predict_line(play, player, heuristic_version):
+    #Expected opponent reply (one or more moves, extra turns included) from the
+    #current position of play.game, with player the engine (1 MAX, -1 MIN).
+    #Follows the engine's last principal variation, otherwise a shallow search.
+
+    #Returns:(board after the reply, position keys along the way), or None if
+    #the game ends first
+    game = play.game
+    board = game.state.copy()
+    opponent_side = play._player_side(game, -player)
+    side = opponent_side
+    keys = []
+    predicted = play.last_continuation(board, side)
+
+    for _ in range(play.max_replay_chain + 1):
+        if board.is_terminal():
+            return None
+        keys.append(board.position_key(side))
+
+        moves = board.possibleMoves(side)
+        if predicted and predicted[0] in moves:
+            pit = predicted.pop(0)
+        else:
+            predicted = []
+            pit = _quick_reply(play, board, -player, heuristic_version)
+
+        if not board.doMove(side, pit):
+            if board.is_terminal():
+                return None
+            keys.append(board.position_key(play._player_side(game, player)))
+            return board, keys
+    return None
+
+
+def _quick_reply(play, board, player, heuristic_version, depth=4):
+    #Opponent's best move by a shallow search on a copy
+    game = Game(dict(play.game.playerSide))
+    game.state = board.copy()
+    searcher = type(play)(game, depth=depth, tt_memory_mb=1, max_replay_chain=play.max_replay_chain)
+    return searcher.MinimaxAlphaBetaPruning(
+        game, player, depth, float('-inf'), float('inf'), heuristic_version
+    )[1]
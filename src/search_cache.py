@@ -0,0 +1,123 @@
+#Search state kept between the moves of a game session.
+#
+#A SearchCache holds the transposition table and the last principal variation
+#of one game, so the next search (usually two plies further down the same
+#tree) starts from the previous move's work. A SearchCachePool keeps the caches
+#of all sessions under a global memory cap, evicting the least recently used.
+from collections import OrderedDict
+import threading
+
+from .transposition import TranspositionTable
+
+
+def pv_line(board, player_side, pv):
+    #Walk a principal variation from board with player_side to move.
+
+    #Returns:list of (position key, move played there)
+    line = []
+    board = board.copy()
+    side = player_side
+    for pit in pv:
+        if pit not in board.possibleMoves(side):
+            break
+        line.append((board.position_key(side), pit))
+        if not board.doMove(side, pit):
+            side = 'player2' if side == 'player1' else 'player1'
+    return line
+
+
+def line_continuation(line, board, player_side):
+    #Moves of a pv_line from this position on, or [] if the position is not on it
+    key = board.position_key(player_side)
+    for i, (line_key, _) in enumerate(line):
+        if line_key == key:
+            return [pit for _, pit in line[i:]]
+    return []
+
+
+class SearchCache:
+    #Transposition table and principal variation of one game session
+
+    def __init__(self, memory_mb=16, replacement='depth'):
+        self.memory_mb = memory_mb
+        self.tt = TranspositionTable(memory_mb, replacement)
+        self.searches = 0
+
+        # Position keys along the last principal variation and the move
+        # played from each: [(position key, move), ...]
+        self._pv_line = []
+
+    def remember_pv(self, board, player_side, pv):
+        #Record the principal variation found for player_side to move on board
+        self._pv_line = pv_line(board, player_side, pv)
+
+    def continuation(self, board, player_side):
+        #Rest of the last principal variation from this position, or [] if
+        #the game left it
+        return line_continuation(self._pv_line, board, player_side)
+
+    def release(self):
+        #Drop the table (the cache was evicted)
+        self.tt = None
+        self._pv_line = []
+
+    def stats(self):
+        return {
+            'searches': self.searches,
+            'memoryMb': self.memory_mb,
+            'pvLength': len(self._pv_line),
+        }
+
+
+class SearchCachePool:
+    #Search caches of all sessions, least recently used first. Each session's
+    #table gets session_mb; when the caches together would exceed total_mb the
+    #least recently used sessions lose theirs.
+
+    def __init__(self, session_mb=16, total_mb=256, replacement='depth'):
+        if session_mb > total_mb:
+            raise ValueError("session_mb cannot exceed total_mb")
+        self.session_mb = session_mb
+        self.total_mb = total_mb
+        self.replacement = replacement
+        self._caches = OrderedDict()
+        self._lock = threading.Lock()  # sessions are searched from several threads
+        self.evictions = 0
+
+    def get(self, session_id):
+        #Cache of a session (created if it has none), marked most recently used
+        with self._lock:
+            cache = self._caches.get(session_id)
+            if cache is not None:
+                self._caches.move_to_end(session_id)
+                return cache
+
+            while self._caches and (len(self._caches) + 1) * self.session_mb > self.total_mb:
+                _, evicted = self._caches.popitem(last=False)
+                evicted.release()
+                self.evictions += 1
+
+            cache = self._caches[session_id] = SearchCache(self.session_mb, self.replacement)
+            return cache
+
+    def discard(self, session_id):
+        #Forget a session's cache (new game or game deleted)
+        with self._lock:
+            cache = self._caches.pop(session_id, None)
+        if cache is not None:
+            cache.release()
+
+    def __contains__(self, session_id):
+        return session_id in self._caches
+
+    def __len__(self):
+        return len(self._caches)
+
+    def stats(self):
+        return {
+            'sessions': len(self._caches),
+            'sessionMb': self.session_mb,
+            'totalMb': self.total_mb,
+            'usedMb': len(self._caches) * self.session_mb,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,448 @@
+#Game sessions kept by the server.
+#
+#A SessionStore is a dict-like store of sessions with a cap on their number
+#(least recently used sessions are evicted first) and an idle time after which
+#a session expires. Sessions can be snapshotted to SQLite, periodically from
+#a background thread, and restored when the server starts.
+#
+#A SharedSessionStore keeps the sessions in the SQLite file itself, so that
+#several server processes can serve the same sessions.
+#
+#Neither store knows what a session holds: the caller passes functions turning
+#a session into a small JSON-able record and back.
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported
+    resource = None
+
+DEFAULT_PATH = os.environ.get('MANCALA_SESSION_DB', 'sessions.db')
+
+
+class SessionConflict(Exception):
+    #Raised by SharedSessionStore.save when another process saved the session
+    #since this one loaded it
+    pass
+
+
+def _create_table(db):
+    # version counts the saves of a shared session (0 in snapshots)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, record TEXT NOT NULL, "
+        "last_used REAL NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+    )
+
+
+def _encode(record):
+    return json.dumps(record, separators=(',', ':'))
+
+
+def _rss_mb():
+    # Current resident memory of the process (Linux: resident pages in
+    # /proc/self/statm); None where it cannot be read
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    # Peak resident memory of the process since it started (kilobytes on
+    # Linux): it never goes down, even after sessions are evicted
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class SessionStore:
+    #Dict-like: store[session_id], session_id in store, del store[session_id]
+
+    def __init__(self, max_sessions=1000, ttl_s=3600, on_evict=None, can_evict=None):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+
+        # on_evict(session_id, session) is called for every session dropped by
+        # the store (evicted or expired); can_evict(session_id, session) can
+        # keep a session that is in use (it then stays even past the cap or
+        # its TTL)
+        self.on_evict = on_evict
+        self.can_evict = can_evict
+
+        # session_id -> [session, last used (time.time())], least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.expirations = 0
+
+        self.path = None
+        self.to_record = None
+        self._snapshotter = None
+        self._stop = threading.Event()
+        self.last_snapshot = None
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def get(self, session_id, default=None):
+        #Session by id, marked as just used; default if unknown or expired
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return default
+            if self._expired(entry, time.time()) and self._drop(session_id):
+                self.expirations += 1
+                return default
+            entry[1] = time.time()
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def __setitem__(self, session_id, session):
+        with self._lock:
+            self._sessions[session_id] = [session, time.time()]
+            self._sessions.move_to_end(session_id)
+            self.expire()
+            self._evict_over_cap()
+
+    def save(self, session_id, session):
+        #Nothing to do: sessions live in this process (see SharedSessionStore)
+        pass
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            del self._sessions[session_id]
+
+    def pop(self, session_id, default=None):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        return default if entry is None else entry[0]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def items(self):
+        with self._lock:
+            return [(session_id, entry[0]) for session_id, entry in self._sessions.items()]
+
+    def _expired(self, entry, now):
+        return self.ttl_s is not None and now - entry[1] > self.ttl_s
+
+    def _drop(self, session_id):
+        # Remove a session unless it is in use; True if removed
+        session = self._sessions[session_id][0]
+        if self.can_evict is not None and not self.can_evict(session_id, session):
+            return False
+        del self._sessions[session_id]
+        if self.on_evict is not None:
+            self.on_evict(session_id, session)
+        return True
+
+    def expire(self):
+        #Drop every session idle for longer than the TTL
+        if self.ttl_s is None:
+            return
+        with self._lock:
+            now = time.time()
+            for session_id, entry in list(self._sessions.items()):
+                if not self._expired(entry, now):
+                    break  # the rest were used more recently
+                if self._drop(session_id):
+                    self.expirations += 1
+
+    def _evict_over_cap(self):
+        # Least recently used first, skipping sessions in use
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                return
+            if self._drop(session_id):
+                self.evictions += 1
+
+    def open(self, path, to_record, from_record, interval_s=60):
+        #Restore the sessions snapshotted at path, then snapshot them there
+        #every interval_s seconds (0 or None: only when snapshot() is called).
+        #to_record(session) gives a JSON-able record, from_record(session_id,
+        #record) rebuilds the session (returning None skips the record).
+
+        #Returns:number of sessions restored
+        self.path = path
+        self.to_record = to_record
+        restored = self.restore(from_record)
+        if interval_s:
+            self._snapshotter = threading.Thread(
+                target=self._snapshot_loop, args=(interval_s,), name='session-snapshot', daemon=True
+            )
+            self._snapshotter.start()
+        return restored
+
+    def close(self):
+        #Stop the periodic snapshots and write a last one
+        self._stop.set()
+        if self.path is not None:
+            self.snapshot()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        _create_table(db)
+        return db
+
+    def snapshot(self):
+        #Write every session to the SQLite file, replacing the previous snapshot
+        started = time.perf_counter()
+        with self._lock:
+            rows = [
+                (session_id, _encode(self.to_record(entry[0])), entry[1])
+                for session_id, entry in self._sessions.items()
+            ]
+        db = self._connect()
+        try:
+            with db:
+                db.execute("DELETE FROM sessions")
+                db.executemany("INSERT INTO sessions (id, record, last_used) VALUES (?, ?, ?)", rows)
+        finally:
+            db.close()
+        self.last_snapshot = {
+            'time': time.time(),
+            'sessions': len(rows),
+            'bytes': sum(len(row[1]) for row in rows),
+            'ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        return len(rows)
+
+    def restore(self, from_record):
+        #Load the snapshot (sessions already past their TTL are skipped)
+        if not os.path.exists(self.path):
+            return 0
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT id, record, last_used FROM sessions ORDER BY last_used").fetchall()
+        finally:
+            db.close()
+
+        now = time.time()
+        restored = 0
+        with self._lock:
+            for session_id, record, last_used in rows:
+                if self.ttl_s is not None and now - last_used > self.ttl_s:
+                    continue
+                session = from_record(session_id, json.loads(record))
+                if session is None:
+                    continue
+                self._sessions[session_id] = [session, last_used]
+                restored += 1
+            self._evict_over_cap()
+        return restored
+
+    def _snapshot_loop(self, interval_s):
+        while not self._stop.wait(interval_s):
+            self.expire()
+            self.snapshot()
+
+    def stats(self):
+        self.expire()
+        return {
+            'sessions': len(self._sessions),
+            'maxSessions': self.max_sessions,
+            'ttlSeconds': self.ttl_s,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'snapshotPath': self.path,
+            'lastSnapshot': self.last_snapshot,
+            'rssMb': _rss_mb(),
+            'peakRssMb': _peak_rss_mb(),
+        }
+
+
+class SharedSessionStore:
+    #Same interface as SessionStore, with the sessions in a SQLite file shared
+    #by several processes. Each row holds a session's record and a version
+    #that every save bumps. A process keeps the live sessions it served last
+    #(at most cache_size) and rebuilds one from its record whenever another
+    #process saved it since. Changes reach the other processes through
+    #save(), which fails with SessionConflict if the session changed meanwhile.
+    #Sessions in use are not protected from eviction or expiry here.
+
+    def __init__(self, path, to_record, from_record, max_sessions=1000, ttl_s=3600,
+                 on_evict=None, cache_size=256):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.path = path
+        self.to_record = to_record
+        self.from_record = from_record
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.on_evict = on_evict
+        self.cache_size = cache_size
+
+        # session_id -> [version, session] of the live sessions of this process
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.evictions = 0
+        self.expirations = 0
+        self.rebuilds = 0
+
+        db = self._db()
+        with db:
+            _create_table(db)
+
+    def _db(self):
+        # One connection per thread (and per process: never used across a fork)
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def get(self, session_id, default=None):
+        #Session by id, marked as just used; default if unknown or expired
+        db = self._db()
+        row = db.execute(
+            "SELECT record, version, last_used FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            self._forget(session_id)
+            return default
+
+        record, version, last_used = row
+        now = time.time()
+        with db:
+            if self.ttl_s is not None and now - last_used > self.ttl_s:
+                db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self.expirations += 1
+                self._forget(session_id)
+                return default
+            db.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (now, session_id))
+
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self.rebuilds += 1
+                entry = self._cache[session_id] = [version, self.from_record(session_id, json.loads(record))]
+            self._cache.move_to_end(session_id)
+            self._trim_cache()
+            return entry[1]
+
+    def __setitem__(self, session_id, session):
+        db = self._db()
+        with db:
+            db.execute(
+                "INSERT INTO sessions (id, record, last_used, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(id) DO UPDATE SET record = excluded.record, "
+                "last_used = excluded.last_used, version = version + 1",
+                (session_id, _encode(self.to_record(session)), time.time())
+            )
+            version = db.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+        with self._lock:
+            self._cache[session_id] = [version, session]
+            self._cache.move_to_end(session_id)
+            self._trim_cache()
+        self.expire()
+        self._evict_over_cap()
+
+    def save(self, session_id, session):
+        #Write back a session this process changed. Raises SessionConflict
+        #(and drops the local copy) if another process saved it first.
+        with self._lock:
+            entry = self._cache.get(session_id)
+        if entry is None or entry[1] is not session:
+            raise SessionConflict("session %s was replaced" % session_id)
+
+        db = self._db()
+        with db:
+            cursor = db.execute(
+                "UPDATE sessions SET record = ?, version = version + 1, last_used = ? "
+                "WHERE id = ? AND version = ?",
+                (_encode(self.to_record(session)), time.time(), session_id, entry[0])
+            )
+        if cursor.rowcount == 0:
+            with self._lock:
+                self._cache.pop(session_id, None)
+            raise SessionConflict("session %s was changed by another process" % session_id)
+        entry[0] += 1
+
+    def __delitem__(self, session_id):
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def __len__(self):
+        return self._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _forget(self, session_id):
+        # The session is gone from the file: drop the live copy too
+        with self._lock:
+            entry = self._cache.pop(session_id, None)
+        if entry is not None and self.on_evict is not None:
+            self.on_evict(session_id, entry[1])
+
+    def _trim_cache(self):
+        # Called with the lock held; the sessions stay in the file
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def expire(self):
+        #Delete every session idle for longer than the TTL
+        if self.ttl_s is None:
+            return
+        db = self._db()
+        with db:
+            cursor = db.execute("DELETE FROM sessions WHERE last_used < ?", (time.time() - self.ttl_s,))
+        self.expirations += cursor.rowcount
+
+    def _evict_over_cap(self):
+        db = self._db()
+        with db:
+            cursor = db.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+        self.evictions += cursor.rowcount
+
+    def close(self):
+        #Nothing to write: every change is saved as it happens
+        pass
+
+    def stats(self):
+        self.expire()
+        return {
+            'sessions': len(self),
+            'maxSessions': self.max_sessions,
+            'ttlSeconds': self.ttl_s,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'shared': True,
+            'path': self.path,
+            'cachedSessions': len(self._cache),
+            'rebuilds': self.rebuilds,
+            'rssMb': _rss_mb(),
+            'peakRssMb': _peak_rss_mb(),
+        }
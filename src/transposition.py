@@ -0,0 +1,92 @@
+#Bounded transposition table for the minimax search.
+#Positions are keyed by MancalaBoard.position_key (Zobrist hash + side to move).
+import random
+
+# Bound types of a stored value
+EXACT = 0   # value is the exact minimax value
+LOWER = 1   # search failed high: true value >= value
+UPPER = 2   # search failed low: true value <= value
+
+# Replacement policies when two positions map to the same slot
+#   'always' - the newest entry always wins
+#   'depth'  - keep the entry searched deeper, unless it is the same position
+#              or the entry is left over from an earlier search
+REPLACEMENT_POLICIES = ('always', 'depth')
+
+# XORed into the keys of positions scored with the advanced heuristic, so a
+# table kept between searches never mixes the values of both heuristics
+ADVANCED_HEURISTIC_KEY = random.Random(0x48455552).getrandbits(64)
+
+# XORed into the keys of positions reached by a chain of extra-turn moves, by
+# chain length: the same position is searched deeper the fewer free extra
+# turns are left, so values from different chain lengths must not mix
+MAX_REPLAY_CHAIN = 64
+_chain_rng = random.Random(0x43484149)
+REPLAY_CHAIN_KEYS = (0,) + tuple(_chain_rng.getrandbits(64) for _ in range(MAX_REPLAY_CHAIN))
+
+
+class TranspositionTable:
+    # Approximate memory used by one filled slot (list pointer + entry tuple + ints)
+    ENTRY_BYTES = 160
+
+    def __init__(self, memory_mb=16, replacement='depth'):
+        if replacement not in REPLACEMENT_POLICIES:
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+
+        self.size = max(1, int(memory_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        self.replacement = replacement
+
+        # Each slot holds None or an entry tuple (key, depth, flag, value, move, generation)
+        self.slots = [None] * self.size
+        
+        # Incremented by new_search() when the table is kept between searches
+        self.generation = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def probe(self, key):
+        #Return the entry stored for key, or None
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, flag, value, move):
+        index = key % self.size
+        old = self.slots[index]
+
+        if old is not None and old[0] != key:
+            if self.replacement == 'depth' and old[1] > depth and old[5] == self.generation:
+                return
+            self.overwrites += 1
+
+        self.slots[index] = (key, depth, flag, value, move, self.generation)
+        self.stores += 1
+
+    def new_search(self):
+        #Keep the entries for the next search, but let its entries replace them
+        self.generation += 1
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'cutoffs': self.cutoffs,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'hitRate': self.hits / probes if probes else 0.0,
+            'size': self.size,
+        }
@@ -0,0 +1,73 @@
+#Tests of the search (python test_search.py, or pytest).
+import random
+
+from src import ponder
+from src.ai_player import Play
+from src.game import Game
+
+
+def random_position(rng, plies):
+    # Game after up to plies random moves from the start (side to move alternates
+    # except after extra turns); returns (game, player to move: 1 MAX, -1 MIN)
+    game = Game({'COMPUTER1': 'player1', 'COMPUTER2': 'player2'})
+    player = 1
+    for _ in range(plies):
+        side = 'player1' if player == 1 else 'player2'
+        moves = game.state.possibleMoves(side)
+        if not moves or game.state.is_terminal():
+            break
+        if not game.state.doMove(side, rng.choice(moves)):
+            player = -player
+    return game, player
+
+
+def test_transposition_table_keeps_values():
+    # The transposition table must not change search values, also when the
+    # same position is reached with different numbers of free extra turns left
+    print("\n1. Testing search values with and without the transposition table...")
+    rng = random.Random(4)
+    checked = 0
+    for _ in range(200):
+        game, player = random_position(rng, rng.randint(4, 30))
+        if game.state.is_terminal():
+            continue
+        depth = rng.randint(3, 6)
+        chain = rng.choice((0, 1, 2))
+        with_tt = Play(game, depth=depth, max_replay_chain=chain, move_ordering=False)
+        without_tt = Play(game, depth=depth, max_replay_chain=chain, move_ordering=False, tt_memory_mb=0)
+        value = with_tt.MinimaxAlphaBetaPruning(game, player, depth, float('-inf'), float('inf'))[0]
+        expected = without_tt.MinimaxAlphaBetaPruning(game, player, depth, float('-inf'), float('inf'))[0]
+        assert value == expected, f"{game.state.pits} depth {depth} chain {chain}: {value} != {expected}"
+        checked += 1
+    print(f" {checked} positions agree!")
+
+
+
+def test_ponderer_cap():
+    # Background searches beyond the process cap are not started, and a
+    # stopped one frees its slot
+    print("\n2. Testing the cap on background searches...")
+    cap = ponder.MAX_PONDERERS
+    ponder.set_max_ponderers(1)
+    try:
+        first = Play(Game({'COMPUTER1': 'player1', 'HUMAN': 'player2'}), depth=20, ponder=True)
+        second = Play(Game({'COMPUTER1': 'player1', 'HUMAN': 'player2'}), depth=20, ponder=True)
+        assert first.start_pondering(1), "The first game should ponder"
+        assert not second.start_pondering(1), "The second game should find the cap reached"
+        first.stop_pondering()
+        assert second.start_pondering(1), "A stopped search should free its slot"
+        second.stop_pondering()
+    finally:
+        ponder.set_max_ponderers(cap)
+    print(" At most the cap ponders!")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Testing the search")
+    print("=" * 50)
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+    print("\nAll tests passed! ✓")
+    print("=" * 50)
@@ -0,0 +1,464 @@
+#Tests of the Flask API server (python test_server.py, or pytest).
+#
+#The server keeps its games in memory here: snapshots, the shared store and
+#the persistent move cache are turned off before it is imported.
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ['MANCALA_SESSION_DB'] = ''
+os.environ.pop('MANCALA_MOVE_CACHE_DB', None)
+os.environ.pop('MANCALA_SHARED_STATE', None)
+
+import server
+from src.job_queue import CANCELLED, DONE, EXPIRED, Job, JobQueue, JobTable, RemoteJob
+from src.mancala_board import MancalaBoard
+from src.metrics import MetricsTable, Registry
+from src.packed_board import unpack
+from src.session_store import SessionConflict, SharedSessionStore
+
+
+def new_game(client, game_id, **settings):
+    response = client.post('/api/new-game', json=dict({'gameId': game_id}, **settings))
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def board_seeds(game_id):
+    # Seeds on the live board, and whether its incremental hash and side
+    # counts still match its pits
+    state = server.games[game_id]['game'].state
+    rebuilt = state.from_pits(state.pits)
+    return sum(state.pits), state.hash == rebuilt.hash and state.side_seeds == rebuilt.side_seeds
+
+
+def wait_for(condition, seconds=10):
+    deadline = time.time() + seconds
+    while not condition() and time.time() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+
+def test_human_move_during_ai_move():
+    # A synchronous AI move holds its game: a human move sent meanwhile is
+    # refused instead of playing on the board the search is changing
+    print("\n1. Testing a human move during a synchronous AI move...")
+    client = server.app.test_client()
+    new_game(client, 'busy', mode='human', depth=9)
+    server.move_cache._entries.clear()
+
+    answers = {}
+    thread = threading.Thread(target=lambda: answers.update(
+        ai=server.app.test_client().post('/api/ai-move', json={'gameId': 'busy'})
+    ))
+    thread.start()
+    assert wait_for(lambda: server.game_busy('busy')), "The AI move should hold the game"
+
+    response = client.post('/api/human-move', json={'gameId': 'busy', 'pit': 'A'})
+    assert response.status_code == 409, "A human move during the search should be refused"
+    thread.join()
+    assert answers['ai'].status_code == 200, answers['ai'].json
+    assert not server.game_busy('busy'), "The game should be released after the move"
+
+    seeds, consistent = board_seeds('busy')
+    assert seeds == 48 and consistent, "The board should be intact"
+    print(" Busy games refuse other moves!")
+
+
+def test_accepted_job_does_not_stop_next_search():
+    # Accepting a job stops its search only: the game's next timed move
+    # searches its whole budget (and is cached as complete)
+    print("\n2. Testing a timed AI move after an accepted job...")
+    client = server.app.test_client()
+    new_game(client, 'accepted', mode='human', timeMs=5000)
+    server.move_cache._entries.clear()
+
+    job = client.post('/api/jobs/ai-move', json={'gameId': 'accepted'}).json
+    assert wait_for(lambda: server.jobs.get(job['jobId']).updates), "The job should report progress"
+    accepted = client.post('/api/jobs/%s/accept' % job['jobId']).json
+    assert accepted['status'] == 'done', accepted
+
+    response = client.post('/api/ai-move', json={'gameId': 'accepted', 'timeMs': 300})
+    assert response.status_code == 200, response.json
+    stats = response.json['stats']
+    assert stats['moveCache'] == 'miss' and stats['ms'] >= 250, "The move should use its budget, not stop at once"
+    assert stats['depth'] > 3, stats['depth']
+    print(" The next search runs to its budget!")
+
+
+def test_move_cache_value_sign():
+    # The same position with player2 to move is MAX's turn in a human game
+    # and MIN's in a computer game: a cached search answers both, with the
+    # value's sign of each game
+    print("\n3. Testing cached move values across game modes...")
+    client = server.app.test_client()
+    server.move_cache._entries.clear()
+    new_game(client, 'signs-human', mode='human', depth=4)
+    new_game(client, 'signs-ai', mode='ai', depth=4)
+    response = client.post('/api/human-move', json={'gameId': 'signs-human', 'pit': 'A'})
+    assert response.status_code == 200, response.json
+    pits = list(server.games['signs-human']['game'].state.pits)
+    server.games['signs-ai']['game'].state = MancalaBoard.from_pits(pits)
+
+    searched = client.post('/api/ai-move', json={'gameId': 'signs-human'}).json
+    cached = client.post('/api/ai-move', json={'gameId': 'signs-ai', 'currentPlayer': 'player2'}).json
+    assert searched['stats']['moveCache'] == 'miss' and cached['stats']['moveCache'] == 'hit'
+    assert cached['move'] == searched['move']
+    assert cached['value'] == -searched['value'] != 0, (searched['value'], cached['value'])
+
+    # And the other way around
+    server.games['signs-human']['game'].state = MancalaBoard.from_pits(pits)
+    again = client.post('/api/ai-move', json={'gameId': 'signs-human'}).json
+    assert again['stats']['moveCache'] == 'hit' and again['value'] == searched['value']
+    print(" Cached values keep their sign!")
+
+
+def test_job_lifecycle():
+    # Accepting a job plays the best move so far; a cancelled job leaves the
+    # board alone; a game with a job refuses other moves
+    print("\n4. Testing AI move jobs...")
+    client = server.app.test_client()
+    server.move_cache._entries.clear()
+
+    new_game(client, 'job-accept', mode='ai', timeMs=10000)
+    key = server.ai_move_key(server.games['job-accept'], 'player1', 1, None)
+    job = client.post('/api/jobs/ai-move', json={'gameId': 'job-accept'}).json
+    assert wait_for(lambda: server.jobs.get(job['jobId']).updates), "The job should report progress"
+    assert client.post('/api/ai-move', json={'gameId': 'job-accept'}).status_code == 409
+    accepted = client.post('/api/jobs/%s/accept' % job['jobId']).json
+    assert accepted['success'] and accepted['status'] == 'done'
+    assert accepted['result']['success'] and accepted['finished'] - accepted['started'] < 5
+    assert server.move_cache.get(key) is None, "A move cut short should not be cached"
+
+    new_game(client, 'job-cancel', mode='ai', timeMs=10000)
+    initial = list(server.games['job-cancel']['pits'])
+    job = client.post('/api/jobs/ai-move', json={'gameId': 'job-cancel'}).json
+    assert wait_for(lambda: server.jobs.get(job['jobId']).updates), "The job should report progress"
+    cancelled = client.delete('/api/jobs/%s' % job['jobId']).json
+    assert cancelled['success'] and cancelled['status'] == 'cancelled'
+    assert cancelled['result']['error'] == 'Cancelled'
+    assert server.games['job-cancel']['pits'] == initial and not server.game_busy('job-cancel')
+    assert not client.delete('/api/jobs/%s' % job['jobId']).json['success'], "A finished job cannot be cancelled"
+    assert client.get('/api/jobs/unknown').status_code == 404
+    print(" Jobs finish, stop early and cancel!")
+
+
+def test_queued_job_expires():
+    # A job still queued at its deadline never runs
+    print("\n5. Testing job expiry...")
+    queue = JobQueue(workers=1, max_queued=4)
+    release = threading.Event()
+    blocker = queue.submit(lambda job: release.wait(10))
+    late = queue.submit(lambda job: 'ran', deadline_ms=10)
+    time.sleep(0.05)
+    release.set()
+    assert late.wait(10) and blocker.wait(10)
+    assert late.status == EXPIRED and late.result is None and late.started is None
+    print(" Expired jobs do not run!")
+
+
+def test_cancel_races_worker():
+    # A cancel racing the worker that takes the job either drops the job
+    # before it runs or reaches it running: never both
+    print("\n6. Testing cancels racing the job's worker...")
+    for _ in range(300):
+        ran = []
+        job = Job(lambda job: ran.append(job._done.is_set()))
+        worker = threading.Thread(target=job._run)
+        worker.start()
+        job.cancel()
+        worker.join()
+        assert job.status in (CANCELLED, DONE) and job._done.is_set()
+        assert ran in ([], [False]), "A job finished before it ran"
+        assert job.status == CANCELLED or ran
+    print(" A job is finished once!")
+
+
+def test_remote_stop_applied_once():
+    # A stop request left in the shared table reaches the job once, then is
+    # cleared
+    print("\n7. Testing remote stop requests...")
+    with tempfile.TemporaryDirectory() as directory:
+        table = JobTable(os.path.join(directory, 'jobs.db'))
+        queue = JobQueue(workers=1, table=table)
+        release = threading.Event()
+        stops = []
+
+        def run(job):
+            job.on_stop = lambda: stops.append(time.time())
+            release.wait(10)
+
+        job = queue.submit(run)
+        assert wait_for(lambda: job.on_stop is not None)
+        assert RemoteJob(table, job.id).finish_early()
+        assert wait_for(lambda: stops)
+        time.sleep(0.5)  # several polls of the table
+        release.set()
+        assert job.wait(10) and len(stops) == 1, stops
+        assert table.stop_requests() == []
+    print(" Stops are applied once!")
+
+
+def follow_events(client, job_id):
+    # (event, data) of a job's event stream, read until the job finishes
+    text = client.get('/api/jobs/%s/events' % job_id).get_data(as_text=True)
+    events = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_job_events():
+    # A job's event stream reports every completed depth, then the result
+    print("\n8. Testing the event stream of a job...")
+    client = server.app.test_client()
+    server.move_cache._entries.clear()
+
+    new_game(client, 'job-done', mode='ai', depth=5)
+    job = client.post('/api/jobs/ai-move', json={'gameId': 'job-done'})
+    assert job.status_code == 202 and job.json['status'] in ('queued', 'running')
+    events = follow_events(client, job.json['jobId'])
+    assert [event for event, _ in events] == ['progress'] * 5 + ['done'], events
+    assert [data['depth'] for _, data in events[:-1]] == [1, 2, 3, 4, 5]
+    result = events[-1][1]['result']
+    assert result['success'] and result['move'] == events[-2][1]['bestMove']
+    assert server.games['job-done']['pits'] != [4] * 6 + [0] + [4] * 6 + [0], "The move should be played"
+    print(" Progress and result are streamed!")
+
+
+def test_shared_session_version_conflict():
+    # Two processes sharing a session file: the second to save a game that
+    # both loaded fails, then rebuilds the game from the first one's save
+    print("\n9. Testing shared session version conflicts...")
+    client = server.app.test_client()
+    new_game(client, 'shared', mode='human', depth=2)
+    record = server.session_record(server.games['shared'])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sessions.db')
+        first, second = (SharedSessionStore(path, server.session_record, server.restore_session)
+                         for _ in range(2))
+        first['shared'] = server.restore_session('shared', record)
+        mine, theirs = first['shared'], second['shared']
+
+        mine['game'].state.doMove('player1', 'A')
+        mine['pits'] = list(mine['game'].state.pits)
+        first.save('shared', mine)
+
+        theirs['game'].state.doMove('player1', 'B')
+        theirs['pits'] = list(theirs['game'].state.pits)
+        try:
+            second.save('shared', theirs)
+        except SessionConflict:
+            pass
+        else:
+            raise AssertionError("Saving over another process's move should fail")
+        assert second['shared']['pits'] == mine['pits'], "The game should be rebuilt from the first save"
+    print(" Conflicting saves are refused!")
+
+
+def test_batch_entries_fail_alone():
+    # A missing, repeated or busy game fails its own entry; the rest are played
+    print("\n10. Testing batch errors of single entries...")
+    client = server.app.test_client()
+    new_game(client, 'batch-1', mode='ai', depth=3)
+    new_game(client, 'batch-2', mode='ai', depth=3)
+    new_game(client, 'batch-busy', mode='ai', depth=3)
+    assert server.claim_game('batch-busy')
+    try:
+        response = client.post('/api/ai-moves', json={'moves': [
+            {'gameId': 'batch-1'}, {'gameId': 'missing'}, {'gameId': 'batch-1'},
+            {'gameId': 'batch-busy'}, {'gameId': 'batch-2'},
+        ]})
+    finally:
+        server.release_game('batch-busy')
+    assert response.status_code == 200, response.json
+    results = response.json['results']
+    assert [result['gameId'] for result in results] == ['batch-1', 'missing', 'batch-1', 'batch-busy', 'batch-2']
+    assert [result['status'] for result in results] == [200, 404, 400, 409, 200]
+    assert results[0]['success'] and results[4]['success'] and not results[1]['success']
+    assert client.post('/api/ai-moves', json={'moves': []}).status_code == 400
+    print(" Failed entries leave the others alone!")
+
+
+def test_board_encodings():
+    # Every encoding carries the same board
+    print("\n11. Testing the board encodings...")
+    client = server.app.test_client()
+    new_game(client, 'encodings', mode='human', depth=2)
+    before = list(server.games['encodings']['pits'])
+    move = client.post('/api/human-move?board=delta', json={'gameId': 'encodings', 'pit': 'C'}).json
+    pits = list(server.games['encodings']['pits'])
+    changed = [[i, count] for i, (old, count) in enumerate(zip(before, pits)) if old != count]
+    assert move['delta'] == changed and 'board' not in move
+
+    def state(query='', **headers):
+        return client.get('/api/game-state/encodings' + query, headers=headers)
+
+    assert state('?board=pits').json['pits'] == pits
+    assert state(Accept='application/vnd.mancala.pits+json').json['pits'] == pits
+    assert list(unpack(int(state('?board=packed').json['packed'], 16))) == pits
+    assert state('?board=delta&since=%s' % state('?board=packed').json['packed']).json['delta'] == []
+    assert state('?board=delta').json['pits'] == pits
+    assert state('?board=delta&since=xyz').status_code == 400
+    raw = state(Accept='application/octet-stream')
+    assert raw.mimetype == 'application/octet-stream' and list(raw.data) == pits
+    board = state().json['board']
+    assert [board[slot] for slot in 'ABCDEF'] + [board['1']] == pits[:7]
+    assert state('?board=unknown').json['board'] == board
+    print(" All encodings agree!")
+
+
+def test_move_cache_hit_and_miss():
+    # A position searched before with the same limits and settings is answered
+    # from the cache; other limits, another heuristic or other engine settings
+    # search again
+    print("\n12. Testing move cache hits and misses...")
+    client = server.app.test_client()
+    server.move_cache._entries.clear()
+    answers = []
+    for game_id, depth, heuristic_version, settings in (
+            ('hit-1', 4, 1, {}), ('hit-2', 4, 1, {}), ('hit-3', 5, 1, {}), ('hit-4', 4, 2, {}),
+            ('hit-5', 4, 1, {'pvs': True}), ('hit-6', 4, 1, {'moveOrdering': False}),
+            ('hit-7', 4, 1, {'aspirationWindow': 2}), ('hit-8', 4, 1, {'pvs': True})):
+        new_game(client, game_id, mode='ai', depth=depth, **settings)
+        answers.append(client.post('/api/ai-move', json={'gameId': game_id, 'heuristicVersion': heuristic_version}).json)
+    assert [answer['stats']['moveCache'] for answer in answers] == [
+        'miss', 'hit', 'miss', 'miss', 'miss', 'miss', 'miss', 'hit']
+    assert (answers[1]['move'], answers[1]['value']) == (answers[0]['move'], answers[0]['value'])
+    assert answers[1]['stats']['depth'] == 4 and answers[1]['stats']['pv'] == answers[0]['stats']['pv']
+    print(" Repeated searches come from the cache!")
+
+
+def test_metrics():
+    # /metrics renders the searches, move cache lookups and requests served
+    print("\n13. Testing the metrics endpoint...")
+    client = server.app.test_client()
+    new_game(client, 'metrics', mode='ai', depth=3)
+    client.post('/api/ai-move', json={'gameId': 'metrics'})
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    for name in ('mancala_search_duration_seconds', 'mancala_move_cache_lookups_total',
+                 'mancala_http_request_duration_seconds', 'mancala_active_games'):
+        assert '# TYPE %s' % name in ' '.join(lines), name
+    samples = dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+    assert float(samples['mancala_active_games']) == len(server.games)
+    assert float(samples['mancala_search_nodes_count{depth="3",heuristic_version="1"}']) >= 1
+    assert any(key.startswith('mancala_http_request_duration_seconds_count{endpoint="/api/ai-move"')
+               for key in samples)
+    print(" Metrics are rendered!")
+
+
+def test_shared_metrics():
+    # With shared state /metrics serves the metrics of every live server
+    # process, one series per worker pid under one header per metric
+    print("\n14. Testing metrics shared between processes...")
+    client = server.app.test_client()
+    with tempfile.TemporaryDirectory() as directory:
+        table = MetricsTable(os.path.join(directory, 'sessions.db'))
+        other = Registry()
+        other.counter('mancala_move_cache_lookups_total', 'AI moves', ('result',)).inc(result='hit')
+        gone = subprocess.Popen([sys.executable, '-c', 'pass'])
+        gone.wait()
+        with table._db() as db:
+            for pid in (os.getppid(), gone.pid):
+                db.execute("INSERT INTO metrics (pid, families, updated) VALUES (?, ?, ?)",
+                           (pid, json.dumps(other.families(worker=pid)), time.time()))
+        server.metrics_table = table
+        try:
+            text = client.get('/metrics').get_data(as_text=True)
+        finally:
+            server.metrics_table = None
+        lines = text.splitlines()
+        assert lines.count('# TYPE mancala_move_cache_lookups_total counter') == 1
+        assert 'mancala_move_cache_lookups_total{worker="%d",result="hit"} 1' % os.getppid() in lines
+        assert any(line.startswith('mancala_active_games{worker="%d"}' % os.getpid()) for line in lines)
+        assert 'worker="%d"' % gone.pid not in text, "A finished process should be dropped"
+        assert len(table.collect()) == len(server.metrics.families()) + 1
+    print(" Every live process is served!")
+
+
+def test_new_game_refuses_bad_aspiration_window():
+    # A window that is not a positive number would never widen: the game is
+    # refused instead of searching forever
+    print("\n15. Testing new games with bad aspiration windows...")
+    client = server.app.test_client()
+    for width in (-1, 0, 'wide', True):
+        response = client.post('/api/new-game', json={'gameId': 'window', 'aspirationWindow': width})
+        assert response.status_code == 400, (width, response.status_code)
+    new_game(client, 'window', mode='ai', depth=3, aspirationWindow=0.5)
+    for _ in range(2):
+        assert client.post('/api/ai-move', json={'gameId': 'window'}).status_code == 200
+    print(" Bad windows are refused!")
+
+
+def test_new_game_refuses_bad_worker_counts():
+    # Worker counts outside 1..MAX_WORKERS are refused rather than growing
+    # the shared process pool
+    print("\n16. Testing new games with bad worker counts...")
+    client = server.app.test_client()
+    for workers in (0, -2, 'many', 2.0, server.MAX_WORKERS + 1, 500):
+        response = client.post('/api/new-game', json={'gameId': 'workers', 'workers': workers})
+        assert response.status_code == 400, (workers, response.status_code)
+    new_game(client, 'workers', mode='ai', depth=3, workers=server.MAX_WORKERS)
+    assert client.post('/api/ai-move', json={'gameId': 'workers'}).status_code == 200
+    print(" Bad worker counts are refused!")
+
+
+def test_move_limits_are_checked():
+    # Depths and time budgets must be integers within the server's caps, for
+    # new games, single moves, jobs and batch entries alike
+    print("\n17. Testing the limits of AI moves...")
+    client = server.app.test_client()
+    for settings in ({'depth': 0}, {'depth': '6'}, {'depth': server.MAX_MOVE_DEPTH + 1},
+                     {'timeMs': 'fast'}, {'timeMs': 0}, {'timeMs': 2.5}, {'timeMs': server.MAX_MOVE_TIME_MS + 1}):
+        response = client.post('/api/new-game', json=dict({'gameId': 'limits'}, **settings))
+        assert response.status_code == 400, (settings, response.status_code)
+
+    new_game(client, 'limits', mode='ai', depth=3)
+    for time_ms in ('fast', -1, True, server.MAX_MOVE_TIME_MS + 1):
+        for endpoint in ('/api/ai-move', '/api/jobs/ai-move'):
+            response = client.post(endpoint, json={'gameId': 'limits', 'timeMs': time_ms})
+            assert response.status_code == 400, (endpoint, time_ms, response.status_code)
+    assert server.games['limits']['pits'] == [4] * 6 + [0] + [4] * 6 + [0], "No move should be played"
+
+    new_game(client, 'limits-2', mode='ai', depth=3)
+    results = client.post('/api/ai-moves', json={'moves': [
+        {'gameId': 'limits', 'timeMs': 'fast'}, {'gameId': 'limits-2', 'timeMs': 20},
+    ]}).json['results']
+    assert [result['status'] for result in results] == [400, 200]
+    print(" Limits outside the caps are refused!")
+
+
+def test_health_reports_current_memory():
+    # /health reports the current resident memory, which falls again when
+    # memory is freed, besides the peak, which never does
+    print("\n18. Testing the memory reported by /health...")
+    client = server.app.test_client()
+    block = bytearray(64 * 1024 * 1024)
+    held = client.get('/health').json['sessions']
+    del block
+    freed = client.get('/health').json['sessions']
+    if freed['rssMb'] is None:
+        print(" Current memory is not available here")
+        return
+    assert held['rssMb'] - freed['rssMb'] > 32, (held, freed)
+    assert freed['peakRssMb'] >= held['rssMb'] - 1
+    print(" Current and peak memory are reported!")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Testing the server")
+    print("=" * 50)
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+    print("\nAll tests passed! ✓")
+    print("=" * 50)